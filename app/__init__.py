@@ -2,7 +2,56 @@ import os
 from flask import Flask
 from flask_wtf.csrf import CSRFProtect
 from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 from .config import config
+from .indexes import apply_indexes, indexes_cli
+
+def init_db(app):
+    """
+    Give the app a new MongoClient from its config. The client connects on
+    first use, so an app created before a server forks holds no sockets.
+    """
+    client = MongoClient(
+        app.config['MONGO_URI'],
+        maxPoolSize=app.config['MONGO_MAX_POOL_SIZE'],
+        minPoolSize=app.config['MONGO_MIN_POOL_SIZE'],
+        connectTimeoutMS=app.config['MONGO_CONNECT_TIMEOUT_MS'],
+        serverSelectionTimeoutMS=app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        socketTimeoutMS=app.config['MONGO_SOCKET_TIMEOUT_MS'],
+        compressors=app.config['MONGO_COMPRESSORS'] or None,
+        connect=False
+    )
+    app.mongo_client = client
+    app.db = client[app.config['MONGO_DB']]
+    app.db_pid = os.getpid()
+
+
+def init_worker(app):
+    """
+    Set up a process that will serve requests (a forked gunicorn worker or
+    the development server): its own Mongo client, then the per-process
+    state that would otherwise be built on the first requests (indexes
+    created, the project list cached, Scholar proxies found). Other
+    processes that build the app, like CLI commands, skip all of this.
+    """
+    if app.db_pid != os.getpid():
+        init_db(app)
+    from .research_assistant.models import ResearchProject
+    from .research_assistant.scholar_search import start_proxy_setup
+    with app.app_context():
+        if app.config['SCHOLAR_BACKEND'] == 'scholarly' and app.config['SCHOLAR_FREE_PROXIES']:
+            start_proxy_setup()
+        try:
+            if app.config['MONGO_CREATE_INDEXES']:
+                for name, results in apply_indexes(app.db, app.config['MONGO_INDEX_BACKGROUND']).items():
+                    for index_name, error in results:
+                        if error:
+                            app.logger.warning(f"Could not create index {name}.{index_name}: {error}")
+            ResearchProject.get_titles()
+        except PyMongoError as e:
+            # Not fatal: everything is built again lazily once Mongo is reachable
+            app.logger.warning(f"Skipped warming worker {os.getpid()}: {str(e)}")
+
 
 def create_app():
     app = Flask(__name__, static_folder='static', static_url_path='/static')
@@ -12,16 +61,90 @@ def create_app():
 
     # Set OpenAI API key
     app.config['OPENAI_API_KEY'] = config['faa_openai_api_key']
+    # Point at a local mock server to exercise the LLM gateway offline
+    app.config['OPENAI_BASE_URL'] = config['faa_openai_base_url']
+    # Shared cache of LLM analyses, used by every web worker
+    app.config['FAA_LLM_CACHE_TTL_SECONDS'] = config['faa_llm_cache_ttl_seconds']
+    app.config['FAA_LLM_CACHE_MAX_ENTRIES'] = config['faa_llm_cache_max_entries']
+    # 'fake' answers locally without an API key, for offline development
+    app.config['FAA_LLM_CLIENT'] = config['faa_llm_client']
+    app.config['FAA_FAKE_LLM_LATENCY'] = config['faa_fake_llm_latency']
+    # Selections longer than one chunk are summarized in chunks, this many at a time
+    app.config['FAA_LLM_CHUNK_TOKENS'] = config['faa_llm_chunk_tokens']
+    app.config['FAA_LLM_CONCURRENCY'] = config['faa_llm_concurrency']
+
+    # LLM gateway: provider limits shared by all workers, retries and connection pool
+    app.config['LLM_REQUESTS_PER_MINUTE'] = config['llm_requests_per_minute']
+    app.config['LLM_TOKENS_PER_MINUTE'] = config['llm_tokens_per_minute']
+    app.config['LLM_MAX_ATTEMPTS'] = config['llm_max_attempts']
+    app.config['LLM_BACKOFF_BASE_SECONDS'] = config['llm_backoff_base_seconds']
+    app.config['LLM_BACKOFF_MAX_SECONDS'] = config['llm_backoff_max_seconds']
+    app.config['LLM_TIMEOUT_SECONDS'] = config['llm_timeout_seconds']
+    app.config['LLM_MAX_CONNECTIONS'] = config['llm_max_connections']
+
+    # Background finding aid text extraction
+    app.config['FAA_WORKER_CONCURRENCY'] = config['faa_worker_concurrency']
+    app.config['FAA_EXTRACTION_POOL_SIZE'] = config['faa_extraction_pool_size']
+    app.config['FAA_EXTRACTION_BATCH_PAGES'] = config['faa_extraction_batch_pages']
+    app.config['FAA_EXTRACTION_LEASE_SECONDS'] = config['faa_extraction_lease_seconds']
+    app.config['FAA_EXTRACTION_MAX_ATTEMPTS'] = config['faa_extraction_max_attempts']
+    app.config['FAA_EXTRACTION_RETRY_DELAY_SECONDS'] = config['faa_extraction_retry_delay_seconds']
 
+    # Google Scholar: 'fake' answers locally, for offline development
+    app.config['SCHOLAR_BACKEND'] = config['scholar_backend']
+    app.config['SCHOLAR_FAKE_LATENCY'] = config['scholar_fake_latency']
+    app.config['SCHOLAR_FREE_PROXIES'] = config['scholar_free_proxies']
+    # Results are shared by every web worker; identical searches in flight share one fetch
+    app.config['SCHOLAR_CACHE_TTL_SECONDS'] = config['scholar_cache_ttl_seconds']
+    app.config['SCHOLAR_FETCH_LEASE_SECONDS'] = config['scholar_fetch_lease_seconds']
+    # Multi-query searches run on a thread pool; each process sends at most this many to Scholar at once
+    app.config['SCHOLAR_BATCH_WORKERS'] = config['scholar_batch_workers']
+    app.config['SCHOLAR_MAX_CONCURRENT_FETCHES'] = config['scholar_max_concurrent_fetches']
+    # A batch query not finished this long after it was queued or started was lost with its worker
+    app.config['SCHOLAR_BATCH_QUERY_TIMEOUT_SECONDS'] = config['scholar_batch_query_timeout_seconds']
+
+    # Per-process cache of project and analysis lookups; other workers' writes show up within the TTL
+    app.config['MODEL_CACHE_MAX_ENTRIES'] = config['model_cache_max_entries']
+    app.config['MODEL_CACHE_TTL_SECONDS'] = config['model_cache_ttl_seconds']
+
+    # Image processor worker pool; jobs below the pixel threshold stay in-process
+    app.config['IMAGE_POOL_SIZE'] = config['ip_pool_size']
+    app.config['IMAGE_PARALLEL_MIN_PIXELS'] = config['ip_parallel_min_pixels']
+    app.config['IMAGE_CACHE_MAX_BYTES'] = config['ip_cache_max_bytes']
+    app.config['IMAGE_RENDER_MAX_AGE'] = config['ip_render_max_age']
+
+    # Background rendition jobs
+    app.config['IMAGE_WORKER_CONCURRENCY'] = config['ip_worker_concurrency']
+    app.config['IMAGE_MAX_PENDING_JOBS'] = config['ip_max_pending_jobs']
+    app.config['IMAGE_JOB_LEASE_SECONDS'] = config['ip_job_lease_seconds']
+    app.config['IMAGE_JOB_RETRY_DELAY_SECONDS'] = config['ip_job_retry_delay_seconds']
+
+    # MongoDB connection pool, one per process
+    app.config['MONGO_URI'] = config['mongo_uri']
+    app.config['MONGO_DB'] = config['mongo_db']
+    app.config['MONGO_MAX_POOL_SIZE'] = config['mongo_max_pool_size']
+    app.config['MONGO_MIN_POOL_SIZE'] = config['mongo_min_pool_size']
+    app.config['MONGO_CONNECT_TIMEOUT_MS'] = config['mongo_connect_timeout_ms']
+    app.config['MONGO_SERVER_SELECTION_TIMEOUT_MS'] = config['mongo_server_selection_timeout_ms']
+    app.config['MONGO_SOCKET_TIMEOUT_MS'] = config['mongo_socket_timeout_ms']
+    app.config['MONGO_COMPRESSORS'] = config['mongo_compressors']
+    # Create every registered index as each worker starts; `flask indexes apply` does it by hand
+    app.config['MONGO_CREATE_INDEXES'] = config['mongo_create_indexes']
+    app.config['MONGO_INDEX_BACKGROUND'] = config['mongo_index_background']
 
     csrf = CSRFProtect(app)
 
-    client = MongoClient('mongodb://mongo:27017/')
-    app.db = client.library_db
+    init_db(app)
+
+    @app.before_request
+    def reconnect_after_fork():
+        # A client can't be shared across fork; a forked worker opens its own
+        if app.db_pid != os.getpid():
+            init_db(app)
 
     # Ensure output directory exists
     output_dir = os.path.join(app.root_path, 'static', 'output')
-    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(os.path.join(output_dir, 'renditions'), exist_ok=True)
 
     from .books import books as books_blueprint
     app.register_blueprint(books_blueprint, url_prefix='/books')
@@ -38,4 +161,6 @@ def create_app():
     from .routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    app.cli.add_command(indexes_cli)
+
     return app
\ No newline at end of file
@@ -0,0 +1,46 @@
+import click
+from flask import current_app
+from . import books
+from .facets import rebuild_facets
+from .importer import DEFAULT_BATCH_SIZE, FORMATS, detect_format, import_file
+from .search import backfill_normalized_fields, ensure_search_indexes
+
+
+@books.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help='Rows per bulk_write.')
+def import_command(path, fmt, batch_size):
+    """Stream a JSON array, NDJSON or CSV file of books into the catalog."""
+    fmt = fmt or detect_format(path)
+
+    def progress(report):
+        click.echo(f"{report.processed} rows, {report.rejected} rejected, "
+                   f"{report.rows_per_second:.0f} rows/s")
+
+    with open(path, 'rb') as stream:
+        report = import_file(current_app.db.books, stream, fmt, batch_size, on_batch=progress,
+                             facets=current_app.db.book_facets)
+
+    click.echo(f"Imported {report.processed - report.rejected} of {report.processed} rows "
+               f"({report.upserted} new, {report.modified} updated) in {report.elapsed:.2f}s")
+    for rejected in report.rejected_samples:
+        click.echo(f"  row {rejected['row']}: {rejected['errors']}", err=True)
+    if report.rejected > len(report.rejected_samples):
+        click.echo(f"  ... and {report.rejected - len(report.rejected_samples)} more rejected rows", err=True)
+
+
+@books.cli.command('backfill-search')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help='Rows per bulk_write.')
+def backfill_search_command(batch_size):
+    """Create the search indexes and normalize titles/authors on older books."""
+    ensure_search_indexes(current_app.db.books)
+    updated = backfill_normalized_fields(current_app.db.books, batch_size)
+    click.echo(f"Normalized {updated} books for prefix search")
+
+
+@books.cli.command('rebuild-facets')
+def rebuild_facets_command():
+    """Recompute genre, decade and author counts from the books collection."""
+    total = rebuild_facets(current_app.db.books, current_app.db.book_facets)
+    click.echo(f"Rebuilt {total} facet counts")
@@ -0,0 +1,122 @@
+from collections import Counter
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+from ..indexes import create_registered_indexes, ensure_indexes, register_indexes
+
+FACETS = ('genre', 'decade', 'author')
+DEFAULT_FACET_LIMIT = 10
+
+register_indexes('book_facets', IndexModel([('facet', ASCENDING), ('count', DESCENDING)], name='facets_by_count'))
+
+
+def ensure_facet_indexes(facets):
+    ensure_indexes(facets, 'book_facets')
+
+
+def facet_keys(book):
+    """
+    Return the (facet, value) pairs a book document contributes to.
+    """
+    if not book:
+        return []
+    keys = []
+    if book.get('genre'):
+        keys.append(('genre', book['genre']))
+    if isinstance(book.get('published_year'), int):
+        keys.append(('decade', book['published_year'] // 10 * 10))
+    if book.get('author'):
+        keys.append(('author', book['author']))
+    return keys
+
+
+def change_deltas(before=None, after=None, deltas=None):
+    """
+    Accumulate the count changes for replacing `before` with `after` into
+    `deltas`. Either side may be None for an insert or a delete.
+    """
+    deltas = Counter() if deltas is None else deltas
+    for key in facet_keys(before):
+        deltas[key] -= 1
+    for key in facet_keys(after):
+        deltas[key] += 1
+    return deltas
+
+
+def apply_deltas(facets, deltas):
+    """
+    Apply accumulated count changes with one $inc per touched facet value.
+    """
+    changes = {key: delta for key, delta in deltas.items() if delta}
+    if not changes:
+        return
+    facets.bulk_write([
+        UpdateOne(
+            {'_id': f"{facet}:{value}"},
+            {'$inc': {'count': delta}, '$setOnInsert': {'facet': facet, 'value': value}},
+            upsert=True
+        )
+        for (facet, value), delta in changes.items()
+    ], ordered=False)
+    emptied = [f"{facet}:{value}" for (facet, value), delta in changes.items() if delta < 0]
+    if emptied:
+        facets.delete_many({'_id': {'$in': emptied}, 'count': {'$lte': 0}})
+
+
+def record_change(facets, before=None, after=None):
+    apply_deltas(facets, change_deltas(before, after))
+
+
+def top_facets(facets, limit=DEFAULT_FACET_LIMIT):
+    """
+    Return the most common values for each facet. Reads at most `limit`
+    documents per facet, independent of the size of the catalog.
+    """
+    ensure_facet_indexes(facets)
+    return {
+        facet: list(facets.find({'facet': facet}, {'_id': 0, 'value': 1, 'count': 1})
+                    .sort('count', DESCENDING).limit(limit))
+        for facet in FACETS
+    }
+
+
+def rebuild_facets(books, facets):
+    """
+    Recompute every facet count from the books collection and swap the
+    result in with a single rename, so readers never see a partial table.
+    """
+    staging = facets.database[f"{facets.name}_rebuild"]
+    staging.drop()
+    groups = {
+        'genre': '$genre',
+        'decade': {'$multiply': [{'$floor': {'$divide': ['$published_year', 10]}}, 10]},
+        'author': '$author',
+    }
+    match = {
+        'genre': {'genre': {'$nin': [None, '']}},
+        'decade': {'published_year': {'$type': 'int'}},
+        'author': {'author': {'$nin': [None, '']}},
+    }
+    total = 0
+    for facet, expression in groups.items():
+        pipeline = [
+            {'$match': match[facet]},
+            {'$group': {'_id': expression, 'count': {'$sum': 1}}},
+        ]
+        batch = []
+        for row in books.aggregate(pipeline, allowDiskUse=True):
+            value = int(row['_id']) if facet == 'decade' else row['_id']
+            batch.append({'_id': f"{facet}:{value}", 'facet': facet, 'value': value, 'count': row['count']})
+            if len(batch) >= 1000:
+                staging.insert_many(batch, ordered=False)
+                total += len(batch)
+                batch = []
+        if batch:
+            staging.insert_many(batch, ordered=False)
+            total += len(batch)
+
+    if total:
+        staging.rename(facets.name, dropTarget=True)
+    else:
+        facets.drop()
+    # The staging collection had no indexes, so create them again
+    create_registered_indexes(facets, 'book_facets')
+    return total
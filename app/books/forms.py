@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired, FileAllowed
 from wtforms import StringField, IntegerField, SubmitField
 from wtforms.validators import DataRequired, NumberRange
 
@@ -8,4 +9,11 @@ class BookForm(FlaskForm):
     isbn = StringField('ISBN', validators=[DataRequired()])
     published_year = IntegerField('Published Year', validators=[DataRequired(), NumberRange(min=1000, max=9999)])
     genre = StringField('Genre', validators=[DataRequired()])
-    submit = SubmitField('Submit')
\ No newline at end of file
+    submit = SubmitField('Submit')
+
+class BookImportForm(FlaskForm):
+    file = FileField('Import File (JSON array, NDJSON or CSV)', validators=[
+        FileRequired(),
+        FileAllowed(['json', 'ndjson', 'jsonl', 'csv'], 'JSON, NDJSON or CSV files only!')
+    ])
+    submit = SubmitField('Import')
@@ -0,0 +1,242 @@
+import csv
+import io
+import json
+import re
+import time
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from werkzeug.datastructures import MultiDict
+from ..indexes import ensure_indexes
+from .facets import apply_deltas, change_deltas
+from .forms import BookForm
+from .models import Book
+
+BOOK_FIELDS = ('title', 'author', 'isbn', 'published_year', 'genre')
+FORMATS = ('json', 'ndjson', 'csv')
+DEFAULT_BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+# Only a sample of rejected rows is kept so memory stays flat on bad files
+MAX_REJECTED_SAMPLES = 100
+
+
+def normalize_isbn(isbn):
+    """
+    Strip hyphens and spaces so '978-0-14-143951-8' and '9780141439518'
+    are the same upsert key.
+    """
+    return re.sub(r'[^0-9X]', '', str(isbn or '').upper())
+
+
+def detect_format(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension in FORMATS:
+        return extension
+    raise ValueError(f"Unsupported import format: {filename}")
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of a top-level JSON array one at a time, reading the
+    stream in fixed-size chunks instead of loading the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    # What the next token must be: '[', 'first' (a value or ']'), 'value', or 'separator' (',' or ']')
+    expect = '['
+
+    while True:
+        buffer = buffer.lstrip(' \t\r\n')
+        if buffer:
+            if expect == '[':
+                if buffer[0] != '[':
+                    raise ValueError("JSON import must be an array of book objects")
+                buffer = buffer[1:]
+                expect = 'first'
+                continue
+            if expect == 'separator':
+                if buffer[0] == ']':
+                    return
+                if buffer[0] != ',':
+                    raise ValueError("Expected ',' or ']' after a JSON array element")
+                buffer = buffer[1:]
+                expect = 'value'
+                continue
+            if expect == 'first' and buffer[0] == ']':
+                return
+            if buffer[0] in ',]':
+                raise ValueError("Expected a JSON array element")
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number ending the buffer may continue in the next chunk
+                if end < len(buffer) or eof:
+                    yield obj
+                    buffer = buffer[end:]
+                    expect = 'separator'
+                    continue
+        if eof:
+            if expect != '[':
+                raise ValueError("Unterminated JSON array")
+            return
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer += chunk
+
+def iter_ndjson(stream):
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # Surface as a row the validator will reject rather than aborting the import
+            yield {'_parse_error': f"line {line_no}: invalid JSON"}
+
+
+def iter_records(stream, fmt):
+    """
+    Yield raw book records from a text stream in the given format.
+    """
+    if fmt == 'json':
+        return iter_json_array(stream)
+    if fmt == 'ndjson':
+        return iter_ndjson(stream)
+    if fmt == 'csv':
+        return csv.DictReader(stream)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def validate_record(record):
+    """
+    Run a raw record through the BookForm validators.
+
+    Returns (book_dict, None) for a valid row or (None, errors) otherwise.
+    """
+    if not isinstance(record, dict):
+        return None, {'record': ['Expected an object']}
+    if '_parse_error' in record:
+        return None, {'record': [record['_parse_error']]}
+
+    formdata = MultiDict({
+        field: '' if record.get(field) is None else str(record.get(field)).strip()
+        for field in BOOK_FIELDS
+    })
+    form = BookForm(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+
+    book = Book(**{field: getattr(form, field).data for field in BOOK_FIELDS})
+    book.isbn = normalize_isbn(book.isbn)
+    if not book.isbn:
+        return None, {'isbn': ['ISBN has no digits']}
+    return book.to_dict(), None
+
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.upserted = 0
+        self.modified = 0
+        self.rejected = 0
+        self.rejected_samples = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def reject(self, row_no, errors):
+        self.rejected += 1
+        if len(self.rejected_samples) < MAX_REJECTED_SAMPLES:
+            self.rejected_samples.append({'row': row_no, 'errors': errors})
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return (f"<ImportReport processed={self.processed} upserted={self.upserted} "
+                f"modified={self.modified} rejected={self.rejected} "
+                f"rate={self.rows_per_second:.0f}/s>")
+
+
+def _flush(collection, batch, report, facets=None):
+    if not batch:
+        return
+    previous = {}
+    if facets is not None:
+        # One lookup per batch gives the old facet values of books being overwritten
+        isbns = [book['isbn'] for _, book in batch]
+        projection = {'isbn': 1, 'genre': 1, 'author': 1, 'published_year': 1}
+        previous = {doc['isbn']: doc for doc in collection.find({'isbn': {'$in': isbns}}, projection)}
+
+    requests = [UpdateOne({'isbn': book['isbn']}, {'$set': book}, upsert=True) for _, book in batch]
+    failed = set()
+    try:
+        result = collection.bulk_write(requests, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for error in details.get('writeErrors', []):
+            failed.add(error['index'])
+            row_no = batch[error['index']][0]
+            report.reject(row_no, {'write': [error.get('errmsg', 'Write failed')]})
+    report.upserted += details.get('nUpserted', 0)
+    report.modified += details.get('nModified', 0)
+
+    if facets is not None:
+        deltas = None
+        for index, (_, book) in enumerate(batch):
+            if index not in failed:
+                deltas = change_deltas(previous.get(book['isbn']), book, deltas)
+                # A repeated ISBN later in the batch overwrites this row, not the stored one
+                previous[book['isbn']] = book
+        if deltas:
+            apply_deltas(facets, deltas)
+
+
+def import_books(collection, records, batch_size=DEFAULT_BATCH_SIZE, on_batch=None, facets=None):
+    """
+    Validate and upsert books keyed on ISBN in bulk_write batches.
+
+    `records` can be any iterable, so the caller controls how the source is
+    streamed. Only one batch is held in memory at a time. `on_batch` is
+    called with the running report after each batch is written. When a
+    `facets` collection is given its counts are updated once per batch.
+    """
+    ensure_indexes(collection, 'books')
+    report = ImportReport()
+    batch = []
+
+    for row_no, record in enumerate(records, start=1):
+        report.processed += 1
+        book, errors = validate_record(record)
+        if errors:
+            report.reject(row_no, errors)
+            continue
+        batch.append((row_no, book))
+        if len(batch) >= batch_size:
+            _flush(collection, batch, report, facets)
+            batch = []
+            report.elapsed = time.monotonic() - report.started
+            if on_batch:
+                on_batch(report)
+
+    _flush(collection, batch, report, facets)
+    report.elapsed = time.monotonic() - report.started
+    if on_batch:
+        on_batch(report)
+    return report
+
+
+def import_file(collection, binary_stream, fmt, batch_size=DEFAULT_BATCH_SIZE, on_batch=None, facets=None):
+    text_stream = io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+    try:
+        return import_books(collection, iter_records(text_stream, fmt), batch_size, on_batch, facets)
+    finally:
+        text_stream.detach()
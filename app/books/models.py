@@ -1,6 +1,33 @@
+import re
+import unicodedata
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
+from ..indexes import register_indexes
+
+register_indexes(
+    'books',
+    IndexModel([('isbn', ASCENDING)], unique=True),
+    # The catalog sorts by these, breaking ties on _id
+    IndexModel([('title', ASCENDING), ('_id', ASCENDING)]),
+    IndexModel([('author', ASCENDING), ('_id', ASCENDING)]),
+    IndexModel([('published_year', ASCENDING), ('_id', ASCENDING)]),
+)
+
+
+def normalize_text(value):
+    """
+    Lowercase, strip accents and punctuation, and collapse whitespace so
+    prefix lookups match regardless of how a title was typed.
+    """
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(c for c in value if not unicodedata.combining(c)).lower()
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', value)).strip()
+
 
 class Book:
+    # Fields needed to render a catalog row; keeps listing queries from pulling whole documents
+    LIST_PROJECTION = {'title': 1, 'author': 1, 'isbn': 1, 'published_year': 1, 'genre': 1}
+
     def __init__(self, title, author, isbn, published_year, genre, _id=None):
         self.title = title
         self.author = author
@@ -27,10 +54,22 @@ class Book:
             'isbn': self.isbn,
             'published_year': self.published_year,
             'genre': self.genre,
+            'title_normalized': normalize_text(self.title),
+            'author_normalized': normalize_text(self.author),
         }
         if self._id:
             book_dict['_id'] = ObjectId(self._id)
         return book_dict
 
+    def to_json(self):
+        return {
+            '_id': self._id,
+            'title': self.title,
+            'author': self.author,
+            'isbn': self.isbn,
+            'published_year': self.published_year,
+            'genre': self.genre,
+        }
+
     def __repr__(self):
         return f"<Book {self.title} (ID: {self._id})>"
\ No newline at end of file
@@ -0,0 +1,108 @@
+import base64
+import time
+from bson import ObjectId, json_util
+from bson.errors import InvalidId
+from pymongo import ASCENDING, DESCENDING
+
+SORT_FIELDS = ('_id', 'title', 'author', 'published_year')
+DEFAULT_LIMIT = 25
+MAX_LIMIT = 100
+COUNT_CACHE_SECONDS = 60
+
+_count_cache = {}
+
+
+def encode_cursor(doc, sort_field):
+    """
+    Encode the sort key of a document as an opaque, URL-safe page cursor.
+    """
+    value = doc.get(sort_field) if sort_field != '_id' else None
+    # Extended JSON so dates survive the round trip as dates
+    raw = json_util.dumps([value, str(doc['_id'])]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decode a cursor produced by encode_cursor. Raises ValueError on garbage.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        value, last_id = json_util.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return value, ObjectId(last_id)
+    except (ValueError, TypeError, InvalidId) as e:
+        raise ValueError(f"Invalid page cursor: {token!r}") from e
+
+
+def _keyset_filter(sort_field, value, last_id, op):
+    if sort_field == '_id':
+        return {'_id': {op: last_id}}
+    # Ties on the sort key are broken by _id so every document has a unique position
+    tie = {sort_field: value, '_id': {op: last_id}}
+    # Null and missing values sort before all others but match no range
+    # operator, so they are paged over by _id alone
+    if value is None:
+        return {'$or': [tie, {sort_field: {'$ne': None}}]} if op == '$gt' else tie
+    clauses = [{sort_field: {op: value}}, tie]
+    if op == '$lt':
+        clauses.append({sort_field: None})
+    return {'$or': clauses}
+
+
+def fetch_page(collection, sort_field='_id', direction=ASCENDING, limit=DEFAULT_LIMIT,
+               after=None, before=None, projection=None, criteria=None):
+    """
+    Fetch one page of documents using keyset pagination.
+
+    `after` continues forward from a next cursor, `before` walks back from a
+    previous cursor. `criteria` restricts the documents paged over. Only
+    `limit + 1` documents are read per call, so the cost of a page does not
+    depend on how deep into the collection it is.
+    """
+    token = before or after
+    backwards = before is not None
+    query_direction = -direction if backwards else direction
+
+    query = dict(criteria or {})
+    if token:
+        value, last_id = decode_cursor(token)
+        op = '$gt' if query_direction == ASCENDING else '$lt'
+        query.update(_keyset_filter(sort_field, value, last_id, op))
+
+    sort = [(sort_field, query_direction)]
+    if sort_field != '_id':
+        sort.append(('_id', query_direction))
+
+    docs = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    if backwards:
+        docs.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = token is not None, has_more
+
+    return {
+        'items': docs,
+        'next_cursor': encode_cursor(docs[-1], sort_field) if docs and has_next else None,
+        'prev_cursor': encode_cursor(docs[0], sort_field) if docs and has_prev else None,
+    }
+
+
+def estimated_total(collection):
+    """
+    Return the collection's estimated document count, cached for
+    COUNT_CACHE_SECONDS so listing pages never trigger a full count.
+    """
+    now = time.monotonic()
+    cached = _count_cache.get(collection.full_name)
+    if cached and cached[1] > now:
+        return cached[0]
+    total = collection.estimated_document_count()
+    _count_cache[collection.full_name] = (total, now + COUNT_CACHE_SECONDS)
+    return total
+
+
+def parse_direction(value):
+    return DESCENDING if value == 'desc' else ASCENDING
@@ -1,18 +1,48 @@
-from flask import render_template, redirect, url_for, flash, request, current_app
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from . import books
-from .forms import BookForm
+from ..exports import EXPORT_BATCH_SIZE, EXPORT_FORMATS, stream_export
+from .forms import BookForm, BookImportForm
+from .facets import record_change, top_facets
+from .importer import detect_format, import_file, normalize_isbn
 from .models import Book
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, AUTOCOMPLETE_LIMIT, search_books, autocomplete_books
+from .pagination import SORT_FIELDS, DEFAULT_LIMIT, MAX_LIMIT, fetch_page, estimated_total, parse_direction
 
 @books.route('/')
 def index():
-    book_docs = list(current_app.db.books.find())
-    print("Raw book documents:", book_docs)  # Debug print
-    book_list = [Book.from_dict(book) for book in book_docs]
-    print("Processed book list:", book_list)  # Debug print
-    for book in book_list:
-        print(f"Book ID: {book._id}, Title: {book.title}")  # Debug print
-    return render_template('books/index.html', books=book_list)
+    sort_field = request.args.get('sort', '_id')
+    if sort_field not in SORT_FIELDS:
+        sort_field = '_id'
+    order = 'desc' if request.args.get('order') == 'desc' else 'asc'
+    limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
+
+    try:
+        page = fetch_page(
+            current_app.db.books,
+            sort_field=sort_field,
+            direction=parse_direction(order),
+            limit=limit,
+            after=request.args.get('after'),
+            before=request.args.get('before'),
+            projection=Book.LIST_PROJECTION
+        )
+    except ValueError:
+        flash('Invalid page link, showing the first page instead.', 'error')
+        return redirect(url_for('books.index', sort=sort_field, order=order, limit=limit))
+
+    book_list = [Book.from_dict(book) for book in page['items']]
+    return render_template('books/index.html',
+                           books=book_list,
+                           facets=top_facets(current_app.db.book_facets),
+                           total=estimated_total(current_app.db.books),
+                           next_cursor=page['next_cursor'],
+                           prev_cursor=page['prev_cursor'],
+                           sort=sort_field,
+                           order=order,
+                           limit=limit)
 
 @books.route('/add', methods=['GET', 'POST'])
 def add():
@@ -21,12 +51,17 @@ def add():
         book = Book(
             title=form.title.data,
             author=form.author.data,
-            isbn=form.isbn.data,
+            isbn=normalize_isbn(form.isbn.data),
             published_year=form.published_year.data,
             genre=form.genre.data
         )
-        result = current_app.db.books.insert_one(book.to_dict())
+        try:
+            result = current_app.db.books.insert_one(book.to_dict())
+        except DuplicateKeyError:
+            flash('A book with this ISBN already exists.', 'error')
+            return render_template('books/form.html', form=form, title="Add Book")
         book._id = str(result.inserted_id)
+        record_change(current_app.db.book_facets, after=book.to_dict())
         flash('Book added successfully!', 'success')
         return redirect(url_for('books.index'))
     return render_template('books/form.html', form=form, title="Add Book")
@@ -44,10 +79,20 @@ def edit(id):
     if form.validate_on_submit():
         book.title = form.title.data
         book.author = form.author.data
-        book.isbn = form.isbn.data
+        book.isbn = normalize_isbn(form.isbn.data)
         book.published_year = form.published_year.data
         book.genre = form.genre.data
-        current_app.db.books.update_one({'_id': ObjectId(id)}, {'$set': book.to_dict()})
+        try:
+            previous = current_app.db.books.find_one_and_update(
+                {'_id': ObjectId(id)},
+                {'$set': book.to_dict()},
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            flash('A book with this ISBN already exists.', 'error')
+            return render_template('books/form.html', form=form, title="Edit Book")
+        if previous:
+            record_change(current_app.db.book_facets, before=previous, after=book.to_dict())
         flash('Book updated successfully!', 'success')
         return redirect(url_for('books.index'))
 
@@ -55,6 +100,67 @@ def edit(id):
 
 @books.route('/delete/<string:id>', methods=['POST'])
 def delete(id):
-    current_app.db.books.delete_one({'_id': ObjectId(id)})
+    deleted = current_app.db.books.find_one_and_delete({'_id': ObjectId(id)})
+    if deleted:
+        record_change(current_app.db.book_facets, before=deleted)
     flash('Book deleted successfully!', 'success')
-    return redirect(url_for('books.index'))
\ No newline at end of file
+    return redirect(url_for('books.index'))
+
+@books.route('/import', methods=['GET', 'POST'])
+def import_books():
+    form = BookImportForm()
+    report = None
+    if form.validate_on_submit():
+        f = form.file.data
+        try:
+            report = import_file(current_app.db.books, f.stream, detect_format(f.filename),
+                                 facets=current_app.db.book_facets)
+        except ValueError as e:
+            current_app.logger.error(f"Error importing books: {str(e)}")
+            flash(f'Could not read the import file: {e}', 'error')
+        else:
+            flash(f'Imported {report.processed - report.rejected} of {report.processed} rows '
+                  f'in {report.elapsed:.2f}s.', 'success' if not report.rejected else 'warning')
+    return render_template('books/import.html', form=form, report=report)
+
+
+def _search_limit(default):
+    return max(1, min(request.args.get('limit', default, type=int), MAX_SEARCH_LIMIT))
+
+@books.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    results = search_books(current_app.db.books, query, _search_limit(DEFAULT_SEARCH_LIMIT))
+    book_list = [Book.from_dict(doc) for doc in results]
+    return render_template('books/search.html', query=query, books=book_list)
+
+@books.route('/api/search')
+def api_search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query'}), 400
+    results = search_books(current_app.db.books, query, _search_limit(DEFAULT_SEARCH_LIMIT))
+    return jsonify({
+        'query': query,
+        'results': [dict(Book.from_dict(doc).to_json(), score=doc.get('score')) for doc in results]
+    })
+
+@books.route('/api/autocomplete')
+def api_autocomplete():
+    suggestions = autocomplete_books(current_app.db.books, request.args.get('prefix', ''),
+                                     _search_limit(AUTOCOMPLETE_LIMIT))
+    return jsonify({'suggestions': [
+        {'_id': str(doc['_id']), 'title': doc.get('title'), 'author': doc.get('author')}
+        for doc in suggestions
+    ]})
+
+@books.route('/export')
+def export():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported export format: {fmt}'}), 400
+
+    projection = dict(Book.LIST_PROJECTION)
+    cursor = current_app.db.books.find({}, projection).sort('_id', 1).batch_size(EXPORT_BATCH_SIZE)
+    fieldnames = ['_id'] + list(projection)
+    return stream_export(fmt, 'books', documents=cursor, rows=cursor, fieldnames=fieldnames)
@@ -0,0 +1,90 @@
+import re
+from pymongo import ASCENDING, TEXT, IndexModel, UpdateOne
+from ..indexes import ensure_indexes, register_indexes
+from .models import Book, normalize_text
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+AUTOCOMPLETE_LIMIT = 10
+MIN_PREFIX_LENGTH = 2
+
+# Title matches matter most when ranking, genre the least
+TEXT_INDEX_WEIGHTS = {'title': 10, 'author': 5, 'genre': 1}
+
+register_indexes(
+    'books',
+    IndexModel([('title', TEXT), ('author', TEXT), ('genre', TEXT)], weights=TEXT_INDEX_WEIGHTS, name='books_text'),
+    IndexModel([('title_normalized', ASCENDING)], name='books_title_prefix'),
+    IndexModel([('author_normalized', ASCENDING)], name='books_author_prefix'),
+)
+
+
+def ensure_search_indexes(collection):
+    """
+    Create the books indexes, text and prefix ones included, once per
+    process and collection.
+    """
+    ensure_indexes(collection, 'books')
+
+
+def search_books(collection, query, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Full-text search over title, author and genre ranked by text score.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+    ensure_search_indexes(collection)
+    projection = dict(Book.LIST_PROJECTION, score={'$meta': 'textScore'})
+    cursor = collection.find({'$text': {'$search': query}}, projection) \
+        .sort([('score', {'$meta': 'textScore'})]) \
+        .limit(limit)
+    return list(cursor)
+
+
+def autocomplete_books(collection, prefix, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Type-ahead suggestions for titles or authors starting with `prefix`.
+
+    The prefix is normalized the same way as the stored *_normalized fields
+    and matched with an anchored regex, which MongoDB turns into a bounded
+    scan of the prefix index rather than a collection scan.
+    """
+    prefix = normalize_text(prefix)
+    if len(prefix) < MIN_PREFIX_LENGTH:
+        return []
+    ensure_search_indexes(collection)
+    pattern = {'$regex': f'^{re.escape(prefix)}'}
+    projection = {'title': 1, 'author': 1}
+
+    suggestions = []
+    seen = set()
+    for field in ('title_normalized', 'author_normalized'):
+        for doc in collection.find({field: pattern}, projection).sort(field, ASCENDING).limit(limit):
+            if doc['_id'] in seen:
+                continue
+            seen.add(doc['_id'])
+            suggestions.append(doc)
+        if len(suggestions) >= limit:
+            break
+    return suggestions[:limit]
+
+
+def backfill_normalized_fields(collection, batch_size=1000):
+    """
+    Populate the *_normalized fields on books written before they existed.
+    """
+    updated = 0
+    batch = []
+    missing = {'$or': [{'title_normalized': {'$exists': False}}, {'author_normalized': {'$exists': False}}]}
+    for doc in collection.find(missing, {'title': 1, 'author': 1}).batch_size(batch_size):
+        batch.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+            'title_normalized': normalize_text(doc.get('title')),
+            'author_normalized': normalize_text(doc.get('author')),
+        }}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    return updated
@@ -1,7 +1,62 @@
 import os
 
 config = {
+    "mongo_uri": os.environ.get("MONGO_URI", "mongodb://mongo:27017/"),
+    "mongo_db": os.environ.get("MONGO_DB", "library_db"),
+    "mongo_max_pool_size": int(os.environ.get("MONGO_MAX_POOL_SIZE", 50)),
+    "mongo_min_pool_size": int(os.environ.get("MONGO_MIN_POOL_SIZE", 0)),
+    "mongo_connect_timeout_ms": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+    "mongo_server_selection_timeout_ms": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+    "mongo_socket_timeout_ms": int(os.environ.get("MONGO_SOCKET_TIMEOUT_MS", 60000)),
+    "mongo_compressors": os.environ.get("MONGO_COMPRESSORS", "zlib"),
+    "mongo_create_indexes": os.environ.get("MONGO_CREATE_INDEXES", "true").lower() == "true",
+    "mongo_index_background": os.environ.get("MONGO_INDEX_BACKGROUND", "false").lower() == "true",
+    "gunicorn_bind": os.environ.get("GUNICORN_BIND", "0.0.0.0:5000"),
+    "gunicorn_workers": int(os.environ.get("GUNICORN_WORKERS", 2 * (os.cpu_count() or 1) + 1)),
+    "gunicorn_threads": int(os.environ.get("GUNICORN_THREADS", 4)),
+    "gunicorn_timeout": int(os.environ.get("GUNICORN_TIMEOUT", 120)),
+    "gunicorn_graceful_timeout": int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30)),
+    "gunicorn_keepalive": int(os.environ.get("GUNICORN_KEEPALIVE", 5)),
+    "gunicorn_max_requests": int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000)),
     "faa_openai_api_key": os.environ.get("FAA_OPENAI_API_KEY"),
+    "faa_openai_base_url": os.environ.get("FAA_OPENAI_BASE_URL"),
     "faa_pdf_upload_folder": os.environ.get("FAA_PDF_UPLOAD_FOLDER", "static/findingaids"),
     "faa_pdf_max_content_length": os.environ.get("FAA_PDF_MAX_CONTENT_LENGTH", "10 * 1024 * 1024"),
+    "faa_worker_concurrency": int(os.environ.get("FAA_WORKER_CONCURRENCY", 1)),
+    "faa_extraction_pool_size": int(os.environ.get("FAA_EXTRACTION_POOL_SIZE", os.cpu_count() or 1)),
+    "faa_extraction_batch_pages": int(os.environ.get("FAA_EXTRACTION_BATCH_PAGES", 25)),
+    "faa_extraction_lease_seconds": int(os.environ.get("FAA_EXTRACTION_LEASE_SECONDS", 300)),
+    "faa_extraction_max_attempts": int(os.environ.get("FAA_EXTRACTION_MAX_ATTEMPTS", 3)),
+    "faa_extraction_retry_delay_seconds": int(os.environ.get("FAA_EXTRACTION_RETRY_DELAY_SECONDS", 5)),
+    "faa_llm_cache_ttl_seconds": int(os.environ.get("FAA_LLM_CACHE_TTL_SECONDS", 30 * 24 * 3600)),
+    "faa_llm_cache_max_entries": int(os.environ.get("FAA_LLM_CACHE_MAX_ENTRIES", 10000)),
+    "faa_llm_client": os.environ.get("FAA_LLM_CLIENT", "openai"),
+    "faa_fake_llm_latency": float(os.environ.get("FAA_FAKE_LLM_LATENCY", 0.5)),
+    "faa_llm_chunk_tokens": int(os.environ.get("FAA_LLM_CHUNK_TOKENS", 3000)),
+    "faa_llm_concurrency": int(os.environ.get("FAA_LLM_CONCURRENCY", 4)),
+    "llm_requests_per_minute": int(os.environ.get("LLM_REQUESTS_PER_MINUTE", 500)),
+    "llm_tokens_per_minute": int(os.environ.get("LLM_TOKENS_PER_MINUTE", 200000)),
+    "llm_max_attempts": int(os.environ.get("LLM_MAX_ATTEMPTS", 5)),
+    "llm_backoff_base_seconds": float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", 0.5)),
+    "llm_backoff_max_seconds": float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", 20)),
+    "llm_timeout_seconds": float(os.environ.get("LLM_TIMEOUT_SECONDS", 60)),
+    "llm_max_connections": int(os.environ.get("LLM_MAX_CONNECTIONS", 20)),
+    "scholar_backend": os.environ.get("SCHOLAR_BACKEND", "scholarly"),
+    "scholar_fake_latency": float(os.environ.get("SCHOLAR_FAKE_LATENCY", 2.0)),
+    "scholar_free_proxies": os.environ.get("SCHOLAR_FREE_PROXIES", "true").lower() == "true",
+    "scholar_cache_ttl_seconds": int(os.environ.get("SCHOLAR_CACHE_TTL_SECONDS", 24 * 3600)),
+    "scholar_fetch_lease_seconds": int(os.environ.get("SCHOLAR_FETCH_LEASE_SECONDS", 60)),
+    "scholar_batch_workers": int(os.environ.get("SCHOLAR_BATCH_WORKERS", 8)),
+    "scholar_batch_query_timeout_seconds": int(os.environ.get("SCHOLAR_BATCH_QUERY_TIMEOUT_SECONDS", 600)),
+    "scholar_max_concurrent_fetches": int(os.environ.get("SCHOLAR_MAX_CONCURRENT_FETCHES", 4)),
+    "model_cache_max_entries": int(os.environ.get("MODEL_CACHE_MAX_ENTRIES", 1000)),
+    "model_cache_ttl_seconds": int(os.environ.get("MODEL_CACHE_TTL_SECONDS", 30)),
+    "ip_pool_size": int(os.environ.get("IP_POOL_SIZE", os.cpu_count() or 1)),
+    "ip_parallel_min_pixels": int(os.environ.get("IP_PARALLEL_MIN_PIXELS", 4_000_000)),
+    "ip_cache_max_bytes": int(os.environ.get("IP_CACHE_MAX_BYTES", 2 * 1024 ** 3)),
+    "ip_render_max_age": int(os.environ.get("IP_RENDER_MAX_AGE", 7 * 24 * 3600)),
+    "ip_worker_concurrency": int(os.environ.get("IP_WORKER_CONCURRENCY", 2)),
+    "ip_max_pending_jobs": int(os.environ.get("IP_MAX_PENDING_JOBS", 50)),
+    "ip_job_lease_seconds": int(os.environ.get("IP_JOB_LEASE_SECONDS", 300)),
+    "ip_job_retry_delay_seconds": int(os.environ.get("IP_JOB_RETRY_DELAY_SECONDS", 5)),
 }
\ No newline at end of file
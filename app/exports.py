@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+from flask import Response, stream_with_context
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+# Documents fetched per getMore; callers with large documents should pass less
+EXPORT_BATCH_SIZE = 1000
+# Rows are written to the response in small groups to keep per-yield overhead low
+ROWS_PER_CHUNK = 200
+
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def iter_ndjson(documents):
+    chunk = []
+    for document in documents:
+        chunk.append(json.dumps(document, default=str))
+        if len(chunk) >= ROWS_PER_CHUNK:
+            yield '\n'.join(chunk) + '\n'
+            chunk = []
+    if chunk:
+        yield '\n'.join(chunk) + '\n'
+
+
+def iter_csv(rows, fieldnames):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    # Send the header straight away so the client sees the first byte immediately
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    count = 0
+    for row in rows:
+        writer.writerow({key: '' if value is None else value for key, value in row.items()})
+        count += 1
+        if count >= ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if count:
+        yield buffer.getvalue()
+
+
+def stream_export(fmt, filename, documents=None, rows=None, fieldnames=None):
+    """
+    Build a streaming download response.
+
+    NDJSON exports take `documents`; CSV exports take flat `rows` and their
+    `fieldnames`. Both should be lazy iterables (typically wrapping a Mongo
+    cursor) so only one cursor batch is in memory at a time.
+    """
+    if fmt == 'csv':
+        body = iter_csv(rows, fieldnames)
+    else:
+        body = iter_ndjson(documents)
+    response = Response(stream_with_context(body), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    # Stop reverse proxies from buffering the whole export before forwarding it
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
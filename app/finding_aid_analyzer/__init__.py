@@ -3,4 +3,4 @@ from flask import Blueprint
 
 finding_aid_analyzer = Blueprint('finding_aid_analyzer', __name__)
 
-from . import routes
\ No newline at end of file
+from . import routes, commands
\ No newline at end of file
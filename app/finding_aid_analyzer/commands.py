@@ -0,0 +1,49 @@
+import click
+from flask import current_app
+from . import finding_aid_analyzer
+from ..llm_gateway import get_gateway
+from .models import AnalysisCache, FindingAidAnalysis
+from .worker import run_workers
+
+
+@finding_aid_analyzer.cli.command('worker')
+@click.option('--concurrency', type=int, default=None,
+              help='Worker processes, each extracting one PDF at a time. Defaults to FAA_WORKER_CONCURRENCY.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+def worker_command(concurrency, poll_interval):
+    """Extract text from uploaded finding aids in the background."""
+    concurrency = concurrency or current_app.config['FAA_WORKER_CONCURRENCY']
+    click.echo(f"Starting {concurrency} finding aid worker(s) with "
+               f"{current_app.config['FAA_EXTRACTION_POOL_SIZE']} extraction processes each")
+    run_workers(concurrency, poll_interval)
+
+
+@finding_aid_analyzer.cli.command('migrate-pages')
+def migrate_pages_command():
+    """Move page text embedded in older analyses into finding_aid_pages."""
+    migrated = FindingAidAnalysis.migrate_embedded_pages()
+    click.echo(f"Migrated {migrated} analyses")
+
+
+@finding_aid_analyzer.cli.command('cache-stats')
+def cache_stats_command():
+    """Show hit and miss counts for the shared analysis cache."""
+    stats = AnalysisCache.stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / lookups if lookups else 0
+    click.echo(f"{stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.0%} hit rate)")
+
+
+@finding_aid_analyzer.cli.command('llm-stats')
+@click.option('--minutes', default=60, show_default=True, help='How far back to report.')
+def llm_stats_command(minutes):
+    """Show LLM call counts, token usage, errors and latency."""
+    summary = get_gateway().metrics.summary(minutes)
+    if not summary:
+        click.echo(f"No LLM calls in the last {minutes} minutes")
+    for model, stats in summary.items():
+        click.echo(f"{model}: {stats['calls']} calls, {stats['errors']} errors, {stats['retries']} retries "
+                   f"({stats['rate_limited']} rate limited), {stats['prompt_tokens']} prompt + "
+                   f"{stats['completion_tokens']} completion tokens, "
+                   f"{stats['latency_ms_avg']} ms avg / {stats['latency_ms_max']} ms max latency, "
+                   f"{stats['wait_ms_avg']} ms avg rate-limit wait")
@@ -0,0 +1,224 @@
+# finding_aid_analyzer/llm.py
+import asyncio
+import re
+from collections import Counter
+from ..llm_gateway import CHARS_PER_TOKEN, estimate_prompt_tokens
+
+# Each chunk summary is kept short so the reduce prompt fits in one call
+CHUNK_SUMMARY_TOKENS = 300
+ANALYSIS_TOKENS = 1000
+
+# Paragraphs, then sentences, then words; with the text joined back the same way
+_SEPARATORS = (
+    (re.compile(r'\n\s*\n'), '\n\n'),
+    (re.compile(r'(?<=[.!?])\s+'), ' '),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def _split(text, max_chars, level=0):
+    if len(text) <= max_chars:
+        return [text]
+    if level == len(_SEPARATORS):
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+    pattern, joiner = _SEPARATORS[level]
+    chunks = []
+    current = ''
+    for piece in pattern.split(text):
+        if not piece.strip():
+            continue
+        for part in _split(piece, max_chars, level + 1):
+            if current and len(current) + len(joiner) + len(part) > max_chars:
+                chunks.append(current)
+                current = part
+            else:
+                current = f"{current}{joiner}{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_text(text, max_tokens):
+    """
+    Split text into chunks of at most `max_tokens` (estimated), breaking
+    between paragraphs where possible, then between sentences, then words.
+    """
+    text = text.strip()
+    if not text:
+        return []
+    return _split(text, max_tokens * CHARS_PER_TOKEN)
+
+
+def parse_analysis(content):
+    parts = content.split("Research Topics:", 1)
+    if len(parts) == 2:
+        summary, topics = parts
+        research_topics = [topic.strip() for topic in topics.strip().split("\n") if topic.strip()]
+    else:
+        summary = content
+        research_topics = []
+    return summary.strip(), research_topics
+
+
+def _analysis_prompts(text, education_level):
+    system = (f"You are an AI assistant analyzing a finding aid for a {education_level} student. "
+              "Provide a summary of the finding aid and suggest 5 research topics based on its content. "
+              "Start the research topics with 'Research Topics:' on a new line.")
+    return system, f"Analyze this finding aid for a {education_level} student: {text}"
+
+
+def _chunk_prompts(chunk, index, total, education_level):
+    system = (f"You are an AI assistant reading part {index + 1} of {total} of a finding aid for a "
+              f"{education_level} student. Summarize this part in one short paragraph, keeping the "
+              "names, dates, places and series it mentions.")
+    return system, f"Part {index + 1} of {total}: {chunk}"
+
+
+class OpenAIClient:
+    """
+    Chat completions through the process's LLM gateway, which owns the
+    connection pool, rate limits, retries and metrics.
+    """
+
+    def __init__(self, gateway, model):
+        self.gateway = gateway
+        self.model = model
+
+    @staticmethod
+    def _messages(system, user):
+        return [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user}
+        ]
+
+    async def complete(self, system, user, max_tokens):
+        messages = self._messages(system, user)
+        return await self.gateway.complete(self.model, messages, max_tokens,
+                                           estimate_prompt_tokens(messages), temperature=0.7)
+
+    async def stream(self, system, user, max_tokens):
+        """
+        Yield the completion's text as it is generated.
+        """
+        messages = self._messages(system, user)
+        async for delta in self.gateway.stream(self.model, messages, max_tokens,
+                                               estimate_prompt_tokens(messages), temperature=0.7):
+            yield delta
+
+
+class FakeLLMClient:
+    """
+    Offline stand-in for OpenAIClient. Each call waits `latency` seconds
+    (then `token_latency` per streamed word) and answers deterministically
+    from the prompt, so the chunking pipeline's timing and output can be
+    checked without an API key. Records how many calls were made and the
+    most that were in flight at once.
+    """
+    model = 'fake'
+
+    def __init__(self, latency=0.0, token_latency=0.0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+
+    async def complete(self, system, user, max_tokens):
+        return ''.join([delta async for delta in self.stream(system, user, max_tokens)])
+
+    async def stream(self, system, user, max_tokens):
+        """
+        Wait `latency` before the first word, then yield the answer a word
+        at a time, like a streamed completion.
+        """
+        self.calls += 1
+        self._in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self._in_flight -= 1
+
+        body = user.split(': ', 1)[-1]
+        words = body.split()
+        summary = ' '.join(words[:40])[:max_tokens * CHARS_PER_TOKEN]
+        answer = summary
+        if 'Research Topics' in system:
+            names = Counter(word.strip('.,;:()') for word in words if word[:1].isupper())
+            topics = [f"{index}. {name}" for index, (name, _) in enumerate(names.most_common(5), start=1)]
+            answer = f"{summary}\nResearch Topics:\n" + '\n'.join(topics)
+        for index, delta in enumerate(re.findall(r'\S+\s*', answer)):
+            if index and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield delta
+
+
+async def summarize_chunks(client, chunks, education_level, concurrency):
+    """
+    Summarize every chunk, at most `concurrency` calls at a time. Summaries
+    come back in chunk order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarize(index, chunk):
+        async with semaphore:
+            system, user = _chunk_prompts(chunk, index, len(chunks), education_level)
+            return await client.complete(system, user, CHUNK_SUMMARY_TOKENS)
+
+    return await asyncio.gather(*(summarize(index, chunk) for index, chunk in enumerate(chunks)))
+
+
+async def condense_text(client, text, education_level, chunk_tokens, concurrency):
+    """
+    Map stage: while `text` is longer than one chunk, split it and replace
+    it with its chunk summaries, in order, summarized concurrently.
+    """
+    # Leave room for several summaries per chunk so each round shrinks the text
+    chunk_tokens = max(chunk_tokens, 4 * CHUNK_SUMMARY_TOKENS)
+    chunks = chunk_text(text, chunk_tokens)
+    while len(chunks) > 1:
+        summaries = await summarize_chunks(client, chunks, education_level, concurrency)
+        text = '\n\n'.join(summaries)
+        chunks = chunk_text(text, chunk_tokens)
+    return text
+
+
+async def analyze_text(client, text, education_level, chunk_tokens, concurrency):
+    """
+    Return (summary, research_topics) for `text`.
+
+    Text that fits in one chunk is analyzed in a single call. Longer text is
+    split into chunks that are summarized concurrently (map), and the
+    summaries, in order, are analyzed as one text (reduce); if even the
+    summaries don't fit in a chunk they are condensed again first.
+    """
+    text = await condense_text(client, text, education_level, chunk_tokens, concurrency)
+    system, user = _analysis_prompts(text, education_level)
+    return parse_analysis(await client.complete(system, user, ANALYSIS_TOKENS))
+
+
+async def stream_analysis(client, text, education_level, chunk_tokens, concurrency):
+    """
+    Like analyze_text, but yield the final analysis' text as it is
+    generated. Nothing is yielded until the map stage (if any) is done.
+    """
+    text = await condense_text(client, text, education_level, chunk_tokens, concurrency)
+    system, user = _analysis_prompts(text, education_level)
+    async for delta in client.stream(system, user, ANALYSIS_TOKENS):
+        yield delta
+
+
+def run_analysis(gateway, client, text, education_level, chunk_tokens, concurrency):
+    """
+    Synchronous entry point for views: run the analysis on the gateway's
+    event loop and wait for it.
+    """
+    return gateway.run(analyze_text(client, text, education_level, chunk_tokens, concurrency))
+
+
+def iter_analysis(gateway, client, text, education_level, chunk_tokens, concurrency):
+    """
+    Synchronous generator over stream_analysis for streaming responses.
+    """
+    return gateway.iterate(stream_analysis(client, text, education_level, chunk_tokens, concurrency))
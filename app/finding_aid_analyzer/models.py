@@ -1,17 +1,215 @@
 # finding_aid_analyzer/models.py
+import hashlib
+import unicodedata
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import current_app
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from ..indexes import ensure_indexes, register_indexes
+from ..model_cache import get_model_cache
+
+# Most pages a single page-range request returns
+MAX_PAGE_RANGE = 50
+# Legacy analyses are migrated in batches so no more than this many are held at once
+MIGRATION_BATCH_SIZE = 20
+# Never read the full text through the analysis document
+METADATA_PROJECTION = {"extracted_text_pages": 0}
+
+
+register_indexes(
+    "finding_aids",
+    # Partial so records from before hashing (with no sha256) don't collide
+    IndexModel([("sha256", ASCENDING)], unique=True, partialFilterExpression={"sha256": {"$type": "string"}}),
+)
+register_indexes(
+    "llm_cache",
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    IndexModel([("last_used", ASCENDING)]),
+)
+register_indexes(
+    "finding_aid_pages",
+    IndexModel([("analysis_id", ASCENDING), ("page_no", ASCENDING)], unique=True),
+)
+register_indexes(
+    "analyses",
+    # Project pages look analyses up by the finding aids they belong to
+    IndexModel([("file_id", ASCENDING)]),
+    IndexModel([("project_ids", ASCENDING)]),
+    # Extraction workers claim the oldest queued or abandoned analysis
+    IndexModel([("extraction_status", ASCENDING), ("created_at", ASCENDING)]),
+)
+
+
+class LeaseLost(Exception):
+    """Raised when a worker writes to an extraction another worker has reclaimed."""
+
+
+class FindingAid:
+    """
+    An uploaded PDF in the `finding_aids` collection, unique by the SHA-256
+    of its bytes so the same file attached to several projects is stored
+    and extracted once.
+    """
+
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.finding_aids)
+
+    @staticmethod
+    def get_by_hash(file_hash):
+        FindingAid.ensure_indexes()
+        return current_app.db.finding_aids.find_one({"sha256": file_hash})
+
+    @staticmethod
+    def create(filename, path, file_hash):
+        """
+        Insert a record for a new file. Returns (finding_aid, created); if
+        another request stored the same bytes first, its record is returned.
+        """
+        FindingAid.ensure_indexes()
+        document = {
+            "filename": filename,
+            "path": path,
+            "sha256": file_hash,
+            "upload_date": datetime.utcnow()
+        }
+        try:
+            current_app.db.finding_aids.insert_one(document)
+            return document, True
+        except DuplicateKeyError:
+            return FindingAid.get_by_hash(file_hash), False
+
+
+class AnalysisCache:
+    """
+    LLM analyses shared by every web worker, in the `llm_cache` collection.
+
+    Entries are keyed on a hash of the normalized selection, education
+    level, model and prompt version, expire through a TTL index, and are
+    trimmed least recently used first once there are more than the
+    configured maximum. Hits and misses are counted in `llm_cache_stats`.
+    """
+
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.llm_cache)
+
+    @staticmethod
+    def key(text, education_level, model, prompt_version):
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        raw = "\x1f".join([normalized, education_level, model, str(prompt_version)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get(key):
+        AnalysisCache.ensure_indexes()
+        now = datetime.utcnow()
+        # The TTL monitor only runs once a minute, so check expiry here too
+        entry = current_app.db.llm_cache.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_used": now}, "$inc": {"hits": 1}},
+            {"summary": 1, "research_topics": 1}
+        )
+        AnalysisCache._count("hits" if entry else "misses")
+        return entry
+
+    @staticmethod
+    def put(key, summary, research_topics, model, prompt_version, ttl_seconds, max_entries):
+        AnalysisCache.ensure_indexes()
+        now = datetime.utcnow()
+        current_app.db.llm_cache.update_one(
+            {"_id": key},
+            {"$set": {
+                "summary": summary,
+                "research_topics": research_topics,
+                "model": model,
+                "prompt_version": prompt_version,
+                "created_at": now,
+                "last_used": now,
+                "expires_at": now + timedelta(seconds=ttl_seconds),
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True
+        )
+        AnalysisCache.trim(max_entries)
+
+    @staticmethod
+    def trim(max_entries):
+        excess = current_app.db.llm_cache.estimated_document_count() - max_entries
+        if excess > 0:
+            victims = current_app.db.llm_cache.find({}, {"_id": 1}).sort("last_used", ASCENDING).limit(excess)
+            current_app.db.llm_cache.delete_many({"_id": {"$in": [victim["_id"] for victim in victims]}})
+
+    @staticmethod
+    def _count(counter):
+        current_app.db.llm_cache_stats.update_one({"_id": "analysis"}, {"$inc": {counter: 1}}, upsert=True)
+
+    @staticmethod
+    def stats():
+        counters = current_app.db.llm_cache_stats.find_one({"_id": "analysis"}) or {}
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": current_app.db.llm_cache.estimated_document_count(),
+        }
+
+
+class FindingAidPage:
+    """
+    The extracted text of one PDF page, stored one document per page in the
+    `finding_aid_pages` collection and keyed by (analysis_id, page_no), so
+    analyses stay small and pages can be read a range at a time.
+    """
+
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.finding_aid_pages)
+
+    @staticmethod
+    def save_many(analysis_id, pages):
+        """
+        Upsert (page_no, text) pairs; re-saving a page (e.g. when a retried
+        extraction reaches it again) replaces its text.
+        """
+        analysis_id = ObjectId(analysis_id)
+        requests = [
+            UpdateOne({"analysis_id": analysis_id, "page_no": page_no}, {"$set": {"text": text}}, upsert=True)
+            for page_no, text in pages
+        ]
+        if requests:
+            FindingAidPage.ensure_indexes()
+            current_app.db.finding_aid_pages.bulk_write(requests, ordered=False)
+
+    @staticmethod
+    def get_range(analysis_id, start, limit):
+        """
+        Pages [start, start + limit) that have been extracted so far, in page order.
+        """
+        limit = max(1, min(limit, MAX_PAGE_RANGE))
+        cursor = current_app.db.finding_aid_pages.find(
+            {"analysis_id": ObjectId(analysis_id), "page_no": {"$gte": start, "$lt": start + limit}},
+            {"_id": 0, "page_no": 1, "text": 1}
+        ).sort("page_no", ASCENDING)
+        return list(cursor)
+
+    @staticmethod
+    def delete_for(analysis_id):
+        current_app.db.finding_aid_pages.delete_many({"analysis_id": ObjectId(analysis_id)})
+
 
 class FindingAidAnalysis:
-    def __init__(self, file_id, summary=None, research_topics=None, education_level=None, project_ids=None, extracted_text_pages=None):
+    def __init__(self, file_id, summary=None, research_topics=None, education_level=None, project_ids=None,
+                 extraction_status='done', page_count=0, pages_extracted=None):
         self.file_id = file_id
         self.summary = summary
         self.research_topics = research_topics
         self.education_level = education_level
         self.project_ids = project_ids or []
-        self.extracted_text_pages = extracted_text_pages or []
+        self.extraction_status = extraction_status
+        self.page_count = page_count or 0
+        self.pages_extracted = pages_extracted if pages_extracted is not None else self.page_count
         self.created_at = datetime.utcnow()
+        self._id = None
 
     def to_dict(self):
         return {
@@ -20,7 +218,9 @@ class FindingAidAnalysis:
             "research_topics": self.research_topics,
             "education_level": self.education_level,
             "project_ids": self.project_ids,
-            "extracted_text_pages": self.extracted_text_pages,
+            "extraction_status": self.extraction_status,
+            "page_count": self.page_count,
+            "pages_extracted": self.pages_extracted,
             "created_at": self.created_at
         }
 
@@ -32,21 +232,164 @@ class FindingAidAnalysis:
             data.get('research_topics'),
             data.get('education_level'),
             data.get('project_ids', []),
-            data.get('extracted_text_pages', [])
+            data.get('extraction_status', 'done'),
+            data.get('page_count'),
+            data.get('pages_extracted')
         )
         analysis.created_at = data['created_at']
+        analysis._id = str(data['_id']) if data.get('_id') else None
         return analysis
 
+    @staticmethod
+    def _cache():
+        return get_model_cache('analyses')
+
+    @staticmethod
+    def _invalidate(analysis_id):
+        # Entries are keyed by id or by file id, so match on the document too
+        analysis_id = ObjectId(analysis_id)
+        FindingAidAnalysis._cache().invalidate(('id', str(analysis_id)), where=lambda doc: doc['_id'] == analysis_id)
+
+    @staticmethod
+    def invalidate_project(project_id):
+        FindingAidAnalysis._cache().invalidate(where=lambda doc: project_id in doc.get('project_ids', []))
+
 
     @staticmethod
-    def create(file_id, education_level, project_id, extracted_text_pages):
-        analysis = FindingAidAnalysis(file_id, education_level=education_level, project_ids=[project_id], extracted_text_pages=extracted_text_pages)
-        result = current_app.db.analyses.insert_one(analysis.to_dict())
+    def create(file_id, education_level, project_id, extracted_text_pages=None):
+        """
+        Create an analysis. Without `extracted_text_pages` it is queued for
+        background text extraction; with them, the pages are stored in
+        finding_aid_pages straight away.
+        """
+        status = 'done' if extracted_text_pages is not None else 'queued'
+        analysis = FindingAidAnalysis(file_id, education_level=education_level, project_ids=[project_id],
+                                      extraction_status=status, page_count=len(extracted_text_pages or []))
+        document = analysis.to_dict()
+        document['extraction_available_at'] = analysis.created_at
+        result = current_app.db.analyses.insert_one(document)
+        FindingAidAnalysis._cache().invalidate(('file', str(file_id)))
+        if extracted_text_pages:
+            FindingAidPage.save_many(result.inserted_id, enumerate(extracted_text_pages))
         return str(result.inserted_id)
 
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.analyses)
+
+    @staticmethod
+    def fail_abandoned_extractions(now, max_attempts):
+        """
+        Mark failed the running extractions whose lease expired on their last
+        attempt, e.g. because the PDF crashed or hung every worker that took it.
+        """
+        result = current_app.db.analyses.update_many(
+            {'extraction_status': 'running', 'extraction_lease_expires_at': {'$lt': now},
+             'extraction_attempts': {'$gte': max_attempts}},
+            {'$set': {'extraction_status': 'failed', 'extraction_lease_expires_at': None,
+                      'extraction_error': 'Extraction stopped responding on the last attempt'}}
+        )
+        if result.modified_count:
+            FindingAidAnalysis._cache().clear()
+
+    @staticmethod
+    def claim_extraction(worker_id, lease_seconds, max_attempts):
+        """
+        Atomically take the oldest analysis waiting for text extraction, or
+        one whose extracting worker's lease has expired and that has
+        attempts left.
+        """
+        now = datetime.utcnow()
+        FindingAidAnalysis.fail_abandoned_extractions(now, max_attempts)
+        analysis = current_app.db.analyses.find_one_and_update(
+            {'$or': [
+                {'extraction_status': 'queued', 'extraction_available_at': {'$lte': now}},
+                {'extraction_status': 'running', 'extraction_lease_expires_at': {'$lt': now},
+                 'extraction_attempts': {'$lt': max_attempts}},
+            ]},
+            {
+                '$set': {
+                    'extraction_status': 'running',
+                    'extraction_worker': worker_id,
+                    'extraction_lease_expires_at': now + timedelta(seconds=lease_seconds),
+                },
+                '$inc': {'extraction_attempts': 1},
+            },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+        if analysis:
+            FindingAidAnalysis._invalidate(analysis['_id'])
+        return analysis
+
+    @staticmethod
+    def _update_claimed(analysis_id, worker_id, update):
+        """
+        Apply `update` only while `worker_id` still holds the extraction.
+        Raises LeaseLost once another worker has reclaimed it.
+        """
+        result = current_app.db.analyses.update_one(
+            {"_id": ObjectId(analysis_id), "extraction_status": "running", "extraction_worker": worker_id},
+            update
+        )
+        FindingAidAnalysis._invalidate(analysis_id)
+        if not result.matched_count:
+            raise LeaseLost(f"Extraction of analysis {analysis_id} is no longer held by {worker_id}")
+
+    @staticmethod
+    def start_extraction(analysis_id, page_count, worker_id):
+        FindingAidAnalysis._update_claimed(analysis_id, worker_id,
+                                           {"$set": {"page_count": page_count, "pages_extracted": 0}})
+        # A retried extraction starts over, so drop whatever the last attempt saved
+        FindingAidPage.delete_for(analysis_id)
+
+    @staticmethod
+    def save_extracted_pages(analysis_id, start, pages, lease_seconds, worker_id):
+        """
+        Store one finished batch of pages and extend the lease. Nothing is
+        written if the lease was lost.
+        """
+        FindingAidAnalysis._update_claimed(analysis_id, worker_id, {
+            "$set": {"extraction_lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds)},
+            "$inc": {"pages_extracted": len(pages)},
+        })
+        FindingAidPage.save_many(analysis_id, enumerate(pages, start))
+
+    @staticmethod
+    def finish_extraction(analysis_id, worker_id):
+        FindingAidAnalysis._update_claimed(analysis_id, worker_id, {
+            "$set": {"extraction_status": "done", "extraction_lease_expires_at": None}
+        })
+
+    @staticmethod
+    def fail_extraction(analysis, error, max_attempts, retry_delay_seconds):
+        attempts = analysis.get('extraction_attempts', 1)
+        if attempts < max_attempts:
+            update = {
+                "extraction_status": "queued",
+                "extraction_available_at": datetime.utcnow() + timedelta(seconds=retry_delay_seconds * 2 ** (attempts - 1)),
+            }
+        else:
+            update = {"extraction_status": "failed"}
+        update.update({"extraction_error": error, "extraction_lease_expires_at": None})
+        # Leave it alone if another worker has reclaimed it in the meantime
+        current_app.db.analyses.update_one(
+            {"_id": analysis['_id'], "extraction_status": "running", "extraction_worker": analysis['extraction_worker']},
+            {"$set": update}
+        )
+        FindingAidAnalysis._invalidate(analysis['_id'])
+
+    @staticmethod
+    def get_progress(analysis_id):
+        return current_app.db.analyses.find_one(
+            {"_id": ObjectId(analysis_id)},
+            {"extraction_status": 1, "page_count": 1, "pages_extracted": 1, "extraction_error": 1}
+        )
+
     @staticmethod
     def get_by_id(analysis_id):
-        analysis = current_app.db.analyses.find_one({"_id": ObjectId(analysis_id)})
+        analysis = FindingAidAnalysis._cache().get(('id', str(analysis_id)), lambda: current_app.db.analyses.find_one(
+            {"_id": ObjectId(analysis_id)}, METADATA_PROJECTION))
         if analysis:
             return FindingAidAnalysis.from_dict(analysis)
         return None
@@ -57,6 +400,7 @@ class FindingAidAnalysis:
             {"_id": ObjectId(analysis_id)},
             {"$set": {"summary": summary, "research_topics": research_topics}}
         )
+        FindingAidAnalysis._invalidate(analysis_id)
         return result.modified_count > 0
 
     @staticmethod
@@ -65,6 +409,7 @@ class FindingAidAnalysis:
             {"_id": ObjectId(analysis_id)},
             {"$addToSet": {"project_ids": project_id}}
         )
+        FindingAidAnalysis._invalidate(analysis_id)
         return result.modified_count > 0
 
     @staticmethod
@@ -73,21 +418,54 @@ class FindingAidAnalysis:
             {"_id": ObjectId(analysis_id)},
             {"$pull": {"project_ids": project_id}}
         )
+        FindingAidAnalysis._invalidate(analysis_id)
         return result.modified_count > 0
 
     @staticmethod
     def get_by_project(project_id):
-        analyses = current_app.db.analyses.find({"project_ids": project_id})
+        analyses = current_app.db.analyses.find({"project_ids": project_id}, METADATA_PROJECTION)
         return [FindingAidAnalysis.from_dict(analysis) for analysis in analyses]
 
     @staticmethod
     def delete(analysis_id):
         result = current_app.db.analyses.delete_one({"_id": ObjectId(analysis_id)})
+        FindingAidAnalysis._invalidate(analysis_id)
+        FindingAidPage.delete_for(analysis_id)
         return result.deleted_count > 0
 
     @staticmethod
     def get_by_file_id(file_id):
-        analysis = current_app.db.analyses.find_one({"file_id": str(file_id)})
+        analysis = FindingAidAnalysis._cache().get(('file', str(file_id)), lambda: current_app.db.analyses.find_one(
+            {"file_id": str(file_id)}, METADATA_PROJECTION))
         if analysis:
             return FindingAidAnalysis.from_dict(analysis)
-        return None
\ No newline at end of file
+        return None
+
+    @staticmethod
+    def migrate_embedded_pages():
+        """
+        Move text embedded in older analysis documents into finding_aid_pages.
+        Safe to re-run; returns the number of analyses migrated.
+        """
+        migrated = 0
+        while True:
+            batch = list(current_app.db.analyses.find(
+                {"extracted_text_pages": {"$exists": True}},
+                {"extracted_text_pages": 1}
+            ).limit(MIGRATION_BATCH_SIZE))
+            if not batch:
+                return migrated
+            for analysis in batch:
+                pages = analysis["extracted_text_pages"] or []
+                # Pages an interrupted extraction never reached are left out
+                FindingAidPage.save_many(analysis["_id"], [
+                    (page_no, text) for page_no, text in enumerate(pages) if text is not None
+                ])
+                extracted = sum(1 for page in pages if page is not None)
+                current_app.db.analyses.update_one(
+                    {"_id": analysis["_id"]},
+                    {"$set": {"page_count": len(pages), "pages_extracted": extracted},
+                     "$unset": {"extracted_text_pages": ""}}
+                )
+                FindingAidAnalysis._invalidate(analysis["_id"])
+                migrated += 1
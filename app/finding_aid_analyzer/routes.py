@@ -1,13 +1,13 @@
 # finding_aid_analyzer/routes.py
 
-import os
-from datetime import datetime
 from flask import render_template, request, current_app, flash, redirect, url_for, jsonify
 from werkzeug.utils import secure_filename
 from . import finding_aid_analyzer
 from .forms import FindingAidUploadForm
-from .models import FindingAidAnalysis
-from .utils import analyze_finding_aid, allowed_file, extract_text_from_pdf
+from .models import FindingAid, FindingAidAnalysis, FindingAidPage, MAX_PAGE_RANGE
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, project_analysis_ids, search_pages
+from .utils import analyze_finding_aid, allowed_file, event_stream_response, save_upload, stream_analysis_events
+from ..llm_gateway import get_gateway
 from ..research_assistant.models import ResearchProject
 from bson import ObjectId
 
@@ -16,8 +16,7 @@ def upload_finding_aid():
     """
     Handle the upload of a finding aid PDF file.
     """
-    projects = ResearchProject.get_all()
-    project_choices = [(str(p._id), p.title) for p in projects]
+    project_choices = ResearchProject.get_titles()
 
     form = FindingAidUploadForm(project_choices=project_choices)
 
@@ -29,27 +28,32 @@ def upload_finding_aid():
         if file and allowed_file(file.filename):
             try:
                 filename = secure_filename(file.filename)
-                file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file.save(file_path)
+                file_hash, file_path = save_upload(file.stream, current_app.config['UPLOAD_FOLDER'])
 
-                file_id = current_app.db.finding_aids.insert_one({
-                    "filename": filename,
-                    "path": file_path,
-                    "upload_date": datetime.utcnow()
-                }).inserted_id
+                finding_aid = FindingAid.get_by_hash(file_hash)
+                created = False
+                if not finding_aid:
+                    finding_aid, created = FindingAid.create(filename, file_path, file_hash)
+                file_id = str(finding_aid['_id'])
 
-                extracted_text_pages = extract_text_from_pdf(file_path)
+                # A PDF seen before keeps its analysis and extracted pages; it is only linked here
+                analysis = None if created else FindingAidAnalysis.get_by_file_id(file_id)
+                if analysis:
+                    FindingAidAnalysis.add_to_project(analysis._id, project_id)
+                else:
+                    # Text is extracted by `flask finding_aid_analyzer worker`
+                    FindingAidAnalysis.create(
+                        file_id,
+                        education_level,
+                        project_id
+                    )
 
-                analysis_id = FindingAidAnalysis.create(
-                    str(file_id),
-                    education_level,
-                    project_id,
-                    extracted_text_pages
-                )
+                ResearchProject.add_finding_aid(project_id, file_id)
 
-                ResearchProject.add_finding_aid(project_id, str(file_id))
-
-                flash('Finding aid uploaded and text extracted successfully!', 'success')
+                if analysis:
+                    flash('This finding aid was already uploaded, so its extracted text has been added to the project.', 'success')
+                else:
+                    flash('Finding aid uploaded! Its text is being extracted and will appear below as pages are read.', 'success')
                 return redirect(url_for('research_assistant.view_project', project_id=project_id))
             except Exception as e:
                 current_app.logger.error(f"Error processing finding aid: {str(e)}")
@@ -60,6 +64,54 @@ def upload_finding_aid():
 
     return render_template('finding_aid_analyzer/upload.html', form=form)
 
+@finding_aid_analyzer.route('/analysis/<analysis_id>/progress')
+def extraction_progress(analysis_id):
+    """
+    Report how far background text extraction has got, for polling.
+    """
+    if not ObjectId.is_valid(analysis_id):
+        return jsonify({'error': 'Analysis not found'}), 404
+    progress = FindingAidAnalysis.get_progress(analysis_id)
+    if not progress:
+        return jsonify({'error': 'Analysis not found'}), 404
+    return jsonify({
+        'status': progress.get('extraction_status', 'done'),
+        'page_count': progress.get('page_count'),
+        'pages_extracted': progress.get('pages_extracted'),
+        'error': progress.get('extraction_error'),
+    })
+
+@finding_aid_analyzer.route('/analysis/<analysis_id>/pages')
+def analysis_pages(analysis_id):
+    """
+    Return a range of extracted pages: ?start=<page_no>&limit=<count>.
+    Pages still being extracted are left out of the range; `next_start`
+    follows the last page returned, and is null once no more will come.
+    """
+    if not ObjectId.is_valid(analysis_id):
+        return jsonify({'error': 'Analysis not found'}), 404
+    progress = FindingAidAnalysis.get_progress(analysis_id)
+    if not progress:
+        return jsonify({'error': 'Analysis not found'}), 404
+
+    start = max(request.args.get('start', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_PAGE_RANGE)
+    page_count = progress.get('page_count') or 0
+    status = progress.get('extraction_status', 'done')
+    pages = FindingAidPage.get_range(analysis_id, start, limit)
+    next_start = pages[-1]['page_no'] + 1 if pages else start
+    # While extraction runs, the pages after the last one returned may still appear
+    if status in ('done', 'failed') and (len(pages) < limit or next_start >= page_count):
+        next_start = None
+    return jsonify({
+        'pages': pages,
+        'start': start,
+        'page_count': page_count,
+        'pages_extracted': progress.get('pages_extracted') or 0,
+        'status': status,
+        'next_start': next_start,
+    })
+
 @finding_aid_analyzer.route('/analyze', methods=['POST'])
 def analyze_text():
     """
@@ -79,4 +131,62 @@ def analyze_text():
         return jsonify({'summary': summary, 'research_topics': research_topics})
     except Exception as e:
         current_app.logger.error(f"Error analyzing text: {str(e)}")
-        return jsonify({'error': 'An error occurred while analyzing the text'}), 500
\ No newline at end of file
+        return jsonify({'error': 'An error occurred while analyzing the text'}), 500
+
+@finding_aid_analyzer.route('/analyze/stream', methods=['POST'])
+def analyze_text_stream():
+    """
+    Analyze selected text, streaming the analysis as server-sent events.
+    """
+    data = request.json
+    analysis_id = data.get('analysis_id')
+    selected_text = data.get('selected_text')
+    education_level = data.get('education_level')
+
+    if not all([analysis_id, selected_text, education_level]):
+        return jsonify({'error': 'Missing required data'}), 400
+
+    return event_stream_response(stream_analysis_events(analysis_id, selected_text, education_level))
+
+@finding_aid_analyzer.route('/llm/metrics')
+def llm_metrics():
+    """
+    LLM call metrics per model for the last ?minutes= minutes (default 60).
+    """
+    minutes = min(max(request.args.get('minutes', 60, type=int), 1), 7 * 24 * 60)
+    return jsonify(get_gateway().metrics.summary(minutes))
+
+def _search_args():
+    query = request.args.get('q', '').strip()
+    project_id = request.args.get('project_id') or None
+    page = max(request.args.get('page', 1, type=int), 1)
+    limit = max(1, min(request.args.get('limit', DEFAULT_SEARCH_LIMIT, type=int), MAX_SEARCH_LIMIT))
+    return query, project_id, page, limit
+
+def _run_search(query, project_id, page, limit):
+    analysis_ids = project_analysis_ids(current_app.db, project_id) if project_id else None
+    return search_pages(current_app.db, query, analysis_ids, page, limit)
+
+@finding_aid_analyzer.route('/search')
+def search():
+    """
+    Search the text of every extracted finding aid, or one project's.
+    """
+    query, project_id, page, limit = _search_args()
+    hits, has_more = _run_search(query, project_id, page, limit)
+    project = ResearchProject.get_by_id(project_id) if project_id and ObjectId.is_valid(project_id) else None
+    return render_template('finding_aid_analyzer/search.html', query=query, hits=hits, page=page,
+                           has_more=has_more, limit=limit, project=project, project_id=project_id)
+
+@finding_aid_analyzer.route('/api/search')
+def api_search():
+    query, project_id, page, limit = _search_args()
+    if not query:
+        return jsonify({'error': 'Missing search query'}), 400
+    hits, has_more = _run_search(query, project_id, page, limit)
+    return jsonify({
+        'query': query,
+        'page': page,
+        'has_more': has_more,
+        'results': [dict(hit, snippet=str(hit['snippet'])) for hit in hits]
+    })
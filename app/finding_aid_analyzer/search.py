@@ -0,0 +1,135 @@
+import re
+from bson import ObjectId
+from markupsafe import Markup, escape
+from pymongo import TEXT, IndexModel
+from ..indexes import ensure_indexes, register_indexes
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Deep pages re-rank every match above them, so stop offering pages past this
+MAX_SEARCH_PAGE = 50
+SNIPPET_CHARS = 240
+
+_QUERY_PARTS = re.compile(r'-?"[^"]*"|\S+')
+
+register_indexes(
+    'finding_aid_pages',
+    IndexModel([('text', TEXT)], name='finding_aid_pages_text', default_language='english'),
+)
+
+
+def ensure_page_search_index(collection):
+    """
+    Create the indexes over finding_aid_pages, the text index among them,
+    once per process.
+    """
+    ensure_indexes(collection, 'finding_aid_pages')
+
+
+def parse_query(query):
+    """
+    Split a search into (phrases, terms) to highlight. Quoted phrases are
+    matched exactly by $text; negated parts ("-word") are not highlighted.
+    """
+    phrases, terms = [], []
+    for part in _QUERY_PARTS.findall(query or ''):
+        if part.startswith('-'):
+            continue
+        if part.startswith('"'):
+            phrase = part.strip('"').strip()
+            if phrase:
+                phrases.append(phrase)
+        else:
+            terms.append(part)
+    return phrases, terms
+
+
+def _highlight_pattern(phrases, terms):
+    alternatives = [r'\s+'.join(re.escape(word) for word in phrase.split()) for phrase in phrases]
+    # Approximate the text index's stemming: match the word with any ending
+    alternatives += [rf"{re.escape(term.rstrip('s') if len(term) > 3 else term)}\w*" for term in terms]
+    if not alternatives:
+        return None
+    return re.compile(r'\b(?:' + '|'.join(alternatives) + r')', re.IGNORECASE)
+
+
+def make_snippet(text, pattern, length=SNIPPET_CHARS):
+    """
+    A window of `text` around the first match, HTML-escaped, with every
+    match in the window wrapped in <mark>.
+    """
+    text = ' '.join((text or '').split())
+    first = pattern.search(text) if pattern else None
+    start = max(0, first.start() - length // 3) if first else 0
+    end = min(len(text), start + length)
+    window = text[start:end]
+
+    parts = []
+    position = 0
+    if pattern:
+        for match in pattern.finditer(window):
+            parts.append(escape(window[position:match.start()]))
+            parts.append(Markup('<mark>%s</mark>') % match.group(0))
+            position = match.end()
+    parts.append(escape(window[position:]))
+    snippet = Markup('').join(parts)
+    if start > 0:
+        snippet = Markup('&hellip;') + snippet
+    if end < len(text):
+        snippet += Markup('&hellip;')
+    return snippet
+
+
+def search_pages(db, query, analysis_ids=None, page=1, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    Full-text search over extracted finding aid pages, ranked by text score.
+
+    `analysis_ids` restricts the search (e.g. to one project's finding aids).
+    Returns (hits, has_more); each hit has the analysis id, page number,
+    score and a highlighted snippet. As with book search, a query for a very
+    common word costs time proportional to the pages containing it.
+    """
+    query = (query or '').strip()
+    if not query:
+        return [], False
+    collection = db.finding_aid_pages
+    ensure_page_search_index(collection)
+
+    criteria = {'$text': {'$search': query}}
+    if analysis_ids is not None:
+        criteria['analysis_id'] = {'$in': [ObjectId(analysis_id) for analysis_id in analysis_ids]}
+    projection = {'analysis_id': 1, 'page_no': 1, 'text': 1, 'score': {'$meta': 'textScore'}}
+    page = max(1, min(page, MAX_SEARCH_PAGE))
+    cursor = collection.find(criteria, projection) \
+        .sort([('score', {'$meta': 'textScore'})]) \
+        .skip((page - 1) * limit) \
+        .limit(limit + 1)
+    docs = list(cursor)
+    has_more = len(docs) > limit and page < MAX_SEARCH_PAGE
+
+    pattern = _highlight_pattern(*parse_query(query))
+    hits = [{
+        'analysis_id': str(doc['analysis_id']),
+        'page_no': doc['page_no'],
+        'score': doc.get('score'),
+        'snippet': make_snippet(doc.get('text'), pattern),
+    } for doc in docs[:limit]]
+    _attach_filenames(db, hits)
+    return hits, has_more
+
+
+def _attach_filenames(db, hits):
+    # Two batched lookups for the page of hits rather than one per hit
+    analysis_ids = {ObjectId(hit['analysis_id']) for hit in hits}
+    file_ids = {doc['_id']: doc['file_id'] for doc in db.analyses.find({'_id': {'$in': list(analysis_ids)}},
+                                                                        {'file_id': 1})}
+    filenames = {str(doc['_id']): doc.get('filename') for doc in db.finding_aids.find(
+        {'_id': {'$in': [ObjectId(file_id) for file_id in file_ids.values()]}}, {'filename': 1})}
+    for hit in hits:
+        file_id = file_ids.get(ObjectId(hit['analysis_id']))
+        hit['file_id'] = file_id
+        hit['filename'] = filenames.get(file_id)
+
+
+def project_analysis_ids(db, project_id):
+    return [str(doc['_id']) for doc in db.analyses.find({'project_ids': project_id}, {'_id': 1})]
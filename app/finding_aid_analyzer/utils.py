@@ -1,60 +1,177 @@
 # finding_aid_analyzer/utils.py
+import hashlib
+import json
+import multiprocessing
 import os
-from openai import OpenAI
-from flask import current_app
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from flask import Response, current_app, stream_with_context
 from werkzeug.utils import secure_filename
-from functools import lru_cache
 import PyPDF2
+from ..llm_gateway import get_gateway
+from .llm import FakeLLMClient, OpenAIClient, iter_analysis, parse_analysis, run_analysis
+from .models import AnalysisCache, FindingAidAnalysis
 
 
 ALLOWED_EXTENSIONS = {'pdf'}
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf(file_path):
-    extracted_pages = []
+def save_upload(stream, upload_folder):
+    """
+    Stream an upload to disk, hashing it on the way, and store it as
+    <sha256>.pdf so identical files share one path and different files with
+    the same name never overwrite each other. Returns (sha256, path).
+    """
+    digest = hashlib.sha256()
+    temp_path = os.path.join(upload_folder, f"upload.{os.getpid()}.{id(stream)}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        file_hash = digest.hexdigest()
+        file_path = os.path.join(upload_folder, f"{file_hash}.pdf")
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return file_hash, file_path
+
+def count_pdf_pages(file_path):
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def extract_page_range(file_path, start, stop):
+    """
+    Extract the text of pages [start, stop). Runs in a pool worker, so each
+    call opens its own reader.
+    """
     with open(file_path, 'rb') as file:
         pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            extracted_pages.append(page.extract_text())
-    return extracted_pages
+        return start, [pdf_reader.pages[page_no].extract_text() for page_no in range(start, stop)]
+
+
+_executor = None
+_executor_size = None
+# Held while the pool is created or replaced so request threads never get two
+_executor_lock = threading.Lock()
+
+
+def _get_executor(pool_size):
+    global _executor, _executor_size
+    with _executor_lock:
+        if _executor is None or _executor_size != pool_size:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=pool_size, mp_context=multiprocessing.get_context('spawn'))
+            _executor_size = pool_size
+        return _executor
+
+
+def extract_text_in_batches(file_path, page_count, on_batch, pool_size=1, batch_pages=25):
+    """
+    Extract every page, split into batches of `batch_pages` spread across a
+    process pool. `on_batch(start, texts)` is called in this process as each
+    batch finishes, which may be out of page order.
+    """
+    ranges = [(start, min(start + batch_pages, page_count)) for start in range(0, page_count, batch_pages)]
+    if pool_size <= 1 or len(ranges) < 2:
+        for start, stop in ranges:
+            on_batch(*extract_page_range(file_path, start, stop))
+        return
+
+    executor = _get_executor(pool_size)
+    futures = [executor.submit(extract_page_range, file_path, start, stop) for start, stop in ranges]
+    for future in as_completed(futures):
+        on_batch(*future.result())
+
+
+ANALYSIS_MODEL = "gpt-3.5-turbo"
+# Bump when the prompt or response parsing changes so cached analyses stop matching
+ANALYSIS_PROMPT_VERSION = 2
 
 
-@lru_cache(maxsize=100)
 def analyze_finding_aid(text_to_analyze, education_level):
-    attempts = 0
-    max_attempts = 2
-
-    client = OpenAI(api_key=current_app.config['OPENAI_API_KEY'])
-
-    while attempts < max_attempts:
-        try:
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": f"You are an AI assistant analyzing a finding aid for a {education_level} student. Provide a summary of the finding aid and suggest 5 research topics based on its content. Start the research topics with 'Research Topics:' on a new line."},
-                    {"role": "user", "content": f"Analyze this finding aid for a {education_level} student: {text_to_analyze}"}
-                ],
-                temperature=0.7,
-                max_tokens=1000
-            )
-
-            content = response.choices[0].message.content
-
-            parts = content.split("Research Topics:", 1)
-            if len(parts) == 2:
-                summary, topics = parts
-                research_topics = [topic.strip() for topic in topics.strip().split("\n") if topic.strip()]
-            else:
-                summary = content
-                research_topics = []
-
-            return summary.strip(), research_topics
-        except Exception as e:
-            attempts += 1
-            if attempts == max_attempts:
-                raise Exception(f"Failed to analyze finding aid after {max_attempts} attempts: {str(e)}")
-
-    return "Failed to analyze the finding aid.", []
+    """
+    Summarize a selection and suggest research topics, answering from the
+    shared analysis cache when the same text was analyzed before.
+    """
+    model = llm_model()
+    key = AnalysisCache.key(text_to_analyze, education_level, model, ANALYSIS_PROMPT_VERSION)
+    cached = AnalysisCache.get(key)
+    if cached:
+        return cached['summary'], cached['research_topics']
+
+    summary, research_topics = _request_analysis(get_llm_client(), text_to_analyze, education_level)
+    AnalysisCache.put(key, summary, research_topics, model, ANALYSIS_PROMPT_VERSION,
+                      current_app.config['FAA_LLM_CACHE_TTL_SECONDS'],
+                      current_app.config['FAA_LLM_CACHE_MAX_ENTRIES'])
+    return summary, research_topics
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_analysis_events(analysis_id, text_to_analyze, education_level):
+    """
+    Server-sent events for a streamed analysis: a `token` event per chunk of
+    generated text, then one `done` event with the parsed summary and
+    research topics once they are cached and saved on the analysis, or an
+    `error` event. A cached analysis is sent as a single `done` event.
+    """
+    model = llm_model()
+    key = AnalysisCache.key(text_to_analyze, education_level, model, ANALYSIS_PROMPT_VERSION)
+    cached = AnalysisCache.get(key)
+    try:
+        if cached:
+            summary, research_topics = cached['summary'], cached['research_topics']
+        else:
+            # Tell the browser the request is underway before the first token arrives
+            yield ": analyzing\n\n"
+            content = []
+            for delta in iter_analysis(get_gateway(), get_llm_client(), text_to_analyze, education_level,
+                                       current_app.config['FAA_LLM_CHUNK_TOKENS'],
+                                       current_app.config['FAA_LLM_CONCURRENCY']):
+                content.append(delta)
+                yield _sse('token', {'text': delta})
+            summary, research_topics = parse_analysis(''.join(content))
+            AnalysisCache.put(key, summary, research_topics, model, ANALYSIS_PROMPT_VERSION,
+                              current_app.config['FAA_LLM_CACHE_TTL_SECONDS'],
+                              current_app.config['FAA_LLM_CACHE_MAX_ENTRIES'])
+        FindingAidAnalysis.update_analysis(analysis_id, summary, research_topics)
+    except Exception as e:
+        current_app.logger.error(f"Error streaming analysis: {str(e)}")
+        yield _sse('error', {'error': 'An error occurred while analyzing the text'})
+        return
+    yield _sse('done', {'summary': summary, 'research_topics': research_topics, 'cached': bool(cached)})
+
+
+def event_stream_response(events):
+    response = Response(stream_with_context(events), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering tokens until the stream ends
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def llm_model():
+    return FakeLLMClient.model if current_app.config['FAA_LLM_CLIENT'] == 'fake' else ANALYSIS_MODEL
+
+
+def get_llm_client():
+    if current_app.config['FAA_LLM_CLIENT'] == 'fake':
+        return FakeLLMClient(current_app.config['FAA_FAKE_LLM_LATENCY'])
+    return OpenAIClient(get_gateway(), ANALYSIS_MODEL)
+
+
+def _request_analysis(client, text_to_analyze, education_level):
+    # Long selections are split and summarized concurrently before the final analysis
+    return run_analysis(get_gateway(), client, text_to_analyze, education_level,
+                        current_app.config['FAA_LLM_CHUNK_TOKENS'],
+                        current_app.config['FAA_LLM_CONCURRENCY'])
@@ -0,0 +1,87 @@
+# finding_aid_analyzer/worker.py
+import multiprocessing
+import os
+import socket
+import time
+from bson import ObjectId
+from flask import current_app
+from .models import FindingAidAnalysis, LeaseLost
+from .utils import count_pdf_pages, extract_text_in_batches
+
+
+def run_extraction(analysis):
+    """
+    Extract the text of a claimed analysis' PDF, saving pages batch by batch
+    so the project page can show them while the rest are still running.
+    Raises LeaseLost if another worker reclaims it part way through.
+    """
+    analysis_id = str(analysis['_id'])
+    worker_id = analysis['extraction_worker']
+    finding_aid = current_app.db.finding_aids.find_one({'_id': ObjectId(analysis['file_id'])})
+    if not finding_aid:
+        raise FileNotFoundError(f"Finding aid {analysis['file_id']} no longer exists")
+
+    file_path = finding_aid['path']
+    lease_seconds = current_app.config['FAA_EXTRACTION_LEASE_SECONDS']
+    page_count = count_pdf_pages(file_path)
+    FindingAidAnalysis.start_extraction(analysis_id, page_count, worker_id)
+
+    extract_text_in_batches(
+        file_path,
+        page_count,
+        lambda start, pages: FindingAidAnalysis.save_extracted_pages(analysis_id, start, pages, lease_seconds,
+                                                                     worker_id),
+        pool_size=current_app.config['FAA_EXTRACTION_POOL_SIZE'],
+        batch_pages=current_app.config['FAA_EXTRACTION_BATCH_PAGES']
+    )
+    FindingAidAnalysis.finish_extraction(analysis_id, worker_id)
+
+
+def work(poll_interval=1.0, max_jobs=None):
+    """
+    Claim and extract queued finding aids until `max_jobs` have been handled
+    (forever if None). Must be called inside an application context.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    handled = 0
+    while max_jobs is None or handled < max_jobs:
+        analysis = FindingAidAnalysis.claim_extraction(worker_id, current_app.config['FAA_EXTRACTION_LEASE_SECONDS'],
+                                                       current_app.config['FAA_EXTRACTION_MAX_ATTEMPTS'])
+        if not analysis:
+            time.sleep(poll_interval)
+            continue
+        try:
+            run_extraction(analysis)
+        except LeaseLost as e:
+            # The worker that reclaimed it owns the retry now
+            current_app.logger.warning(str(e))
+        except Exception as e:
+            current_app.logger.error(f"Error extracting finding aid {analysis['_id']}: {str(e)}")
+            FindingAidAnalysis.fail_extraction(analysis, str(e),
+                                               current_app.config['FAA_EXTRACTION_MAX_ATTEMPTS'],
+                                               current_app.config['FAA_EXTRACTION_RETRY_DELAY_SECONDS'])
+        handled += 1
+
+
+def _worker_process(poll_interval):
+    from .. import create_app
+
+    app = create_app()
+    with app.app_context():
+        work(poll_interval)
+
+
+def run_workers(concurrency, poll_interval=1.0):
+    """
+    Run `concurrency` worker processes, each extracting one PDF at a time
+    with its own page-range process pool.
+    """
+    if concurrency <= 1:
+        work(poll_interval)
+        return
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_worker_process, args=(poll_interval,)) for _ in range(concurrency)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
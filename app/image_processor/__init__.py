@@ -2,4 +2,4 @@ from flask import Blueprint
 
 image_processor = Blueprint('image_processor', __name__)
 
-from . import routes
\ No newline at end of file
+from . import routes, commands
\ No newline at end of file
@@ -0,0 +1,15 @@
+import click
+from flask import current_app
+from . import image_processor
+from .worker import run_workers
+
+
+@image_processor.cli.command('worker')
+@click.option('--concurrency', type=int, default=None,
+              help='Worker processes, each rendering one job at a time. Defaults to IP_WORKER_CONCURRENCY.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+def worker_command(concurrency, poll_interval):
+    """Process queued image rendition jobs."""
+    concurrency = concurrency or current_app.config['IMAGE_WORKER_CONCURRENCY']
+    click.echo(f"Starting {concurrency} image worker(s)")
+    run_workers(concurrency, poll_interval)
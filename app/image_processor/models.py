@@ -0,0 +1,449 @@
+# image_processor/models.py
+import fcntl
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import current_app
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from ..indexes import ensure_indexes, register_indexes
+from .renditions import ENCODER_SETTINGS
+
+HASH_CHUNK_SIZE = 1024 * 1024
+RENDITION_DIRECTORY = 'renditions'
+ORIGINAL_DIRECTORY = 'originals'
+LOCK_DIRECTORY = 'locks'
+EVICTION_BATCH_SIZE = 100
+# _id of the `rendition_stats` document holding the running byte total of renditions and originals
+RENDITION_TOTAL_ID = 'renditions'
+
+register_indexes(
+    'renditions',
+    # Eviction walks renditions least recently used first
+    IndexModel([('last_used', ASCENDING)]),
+    IndexModel([('source_hash', ASCENDING)]),
+)
+register_indexes(
+    'image_jobs',
+    # Workers claim the oldest queued or abandoned job
+    IndexModel([('status', ASCENDING), ('created_at', ASCENDING)]),
+    # An original is kept while a job still has to render from it
+    IndexModel([('source_hash', ASCENDING), ('status', ASCENDING)]),
+)
+register_indexes('images', IndexModel([('source_hash', ASCENDING)]))
+
+
+def hash_stream(stream):
+    """
+    SHA-256 of an upload's bytes, read in chunks. The stream is rewound
+    afterwards so it can still be decoded.
+    """
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def rendition_key(source_hash, target):
+    width, height = target
+    settings = ','.join(f"{name}={value}" for name, value in sorted(ENCODER_SETTINGS.items()))
+    return hashlib.sha256(f"{source_hash}:{width}x{height}:{settings}".encode('utf-8')).hexdigest()
+
+
+class LeaseLost(Exception):
+    """Raised when a worker writes to an image job another worker has reclaimed."""
+
+
+class RenditionCache:
+    """
+    Renditions stored once per (source bytes, size, encoder settings) under
+    static/output/renditions, with one document per entry in the
+    `renditions` collection tracking size, last use and the title aliases
+    (symlinks in static/output) that point at it.
+    """
+
+    @staticmethod
+    def output_directory():
+        return os.path.join(current_app.root_path, 'static', 'output')
+
+    @staticmethod
+    def blob_path(key):
+        return os.path.join(RenditionCache.output_directory(), RENDITION_DIRECTORY, f"{key}.webp")
+
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.renditions)
+
+    @staticmethod
+    def lookup(keys):
+        """
+        Return the subset of `keys` that have a stored rendition on disk.
+        """
+        found = current_app.db.renditions.find({'_id': {'$in': list(keys)}}, {'_id': 1})
+        return {doc['_id'] for doc in found if os.path.exists(RenditionCache.blob_path(doc['_id']))}
+
+    @staticmethod
+    def store(source_hash, entries):
+        """
+        Record freshly written renditions. `entries` maps key to target size.
+        """
+        now = datetime.utcnow()
+        for key, target in entries.items():
+            size = os.path.getsize(RenditionCache.blob_path(key))
+            previous = current_app.db.renditions.find_one_and_update(
+                {'_id': key},
+                {
+                    '$set': {
+                        'source_hash': source_hash,
+                        'width': target[0],
+                        'height': target[1],
+                        'bytes': size,
+                        'last_used': now,
+                    },
+                    '$setOnInsert': {'aliases': [], 'created_at': now},
+                },
+                projection={'bytes': 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+            RenditionCache._add_bytes(size - (previous or {}).get('bytes', 0))
+
+    @staticmethod
+    def total_bytes():
+        """
+        Size of every stored rendition and original, from the running total
+        that store, SourceImage.save and evict keep. A database without one
+        is summed once to start it.
+        """
+        stats = current_app.db.rendition_stats.find_one({'_id': RENDITION_TOTAL_ID})
+        if stats is None:
+            totals = list(current_app.db.renditions.aggregate([
+                {'$group': {'_id': None, 'bytes': {'$sum': '$bytes'}}}
+            ]))
+            original_directory = os.path.join(RenditionCache.output_directory(), ORIGINAL_DIRECTORY)
+            originals = sum(entry.stat().st_size for entry in os.scandir(original_directory)
+                            if entry.is_file() and not entry.name.endswith('.tmp')) \
+                if os.path.isdir(original_directory) else 0
+            # Another worker may have started the total meanwhile; keep theirs
+            stats = current_app.db.rendition_stats.find_one_and_update(
+                {'_id': RENDITION_TOTAL_ID},
+                {'$setOnInsert': {'bytes': (totals[0]['bytes'] if totals else 0) + originals}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        return stats['bytes']
+
+    @staticmethod
+    def _add_bytes(delta):
+        # Without a total yet there is nothing to adjust; total_bytes sums the collection
+        if delta:
+            current_app.db.rendition_stats.update_one({'_id': RENDITION_TOTAL_ID}, {'$inc': {'bytes': delta}})
+
+    @staticmethod
+    def nearest_source(source_hash, target):
+        """
+        Path of the smallest cached rendition of `source_hash` that covers
+        `target` in both dimensions, or None if only the original does.
+        """
+        width, height = target
+        candidates = current_app.db.renditions.find(
+            {'source_hash': source_hash, 'width': {'$gte': width}, 'height': {'$gte': height}},
+            {'width': 1, 'height': 1}
+        )
+        for entry in sorted(candidates, key=lambda doc: doc['width'] * doc['height']):
+            path = RenditionCache.blob_path(entry['_id'])
+            if os.path.exists(path):
+                return path
+        return None
+
+    @staticmethod
+    @contextmanager
+    def lock(key):
+        """
+        Exclusive lock on one rendition key, shared by every thread and
+        worker process on this host, so a rendition is only computed once.
+        """
+        lock_directory = os.path.join(RenditionCache.output_directory(), LOCK_DIRECTORY)
+        os.makedirs(lock_directory, exist_ok=True)
+        lock_path = os.path.join(lock_directory, f"{key}.lock")
+        with open(lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def touch(keys):
+        if keys:
+            current_app.db.renditions.update_many(
+                {'_id': {'$in': list(keys)}},
+                {'$set': {'last_used': datetime.utcnow()}}
+            )
+
+    @staticmethod
+    def alias(filename, key):
+        """
+        Point static/output/<filename> at a stored rendition, replacing any
+        previous target atomically.
+        """
+        alias_path = os.path.join(RenditionCache.output_directory(), filename)
+        relative_target = os.path.join(RENDITION_DIRECTORY, f"{key}.webp")
+        if os.path.islink(alias_path) and os.readlink(alias_path) == relative_target:
+            return alias_path
+        temp_path = f"{alias_path}.{os.getpid()}.tmp"
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        os.symlink(relative_target, temp_path)
+        os.replace(temp_path, alias_path)
+        current_app.db.renditions.update_one({'_id': key}, {'$addToSet': {'aliases': filename}})
+        return alias_path
+
+    @staticmethod
+    def evict(max_bytes, pinned=()):
+        """
+        Delete least recently used renditions until the cache, originals
+        included, fits in `max_bytes`. An original goes with the last
+        rendition made from it. Entries in `pinned` (the current request's)
+        are kept.
+        """
+        RenditionCache.ensure_indexes()
+        total = RenditionCache.total_bytes()
+        pinned = set(pinned)
+        evicted = 0
+
+        while total > max_bytes:
+            victims = list(current_app.db.renditions.find(
+                {'_id': {'$nin': list(pinned)}},
+                {'bytes': 1, 'aliases': 1, 'source_hash': 1}
+            ).sort('last_used', ASCENDING).limit(EVICTION_BATCH_SIZE))
+            if not victims:
+                break
+            for victim in victims:
+                if total <= max_bytes:
+                    break
+                RenditionCache._remove_files(victim)
+                # Only the worker whose delete succeeds takes the entry off the total
+                removed = current_app.db.renditions.find_one_and_delete({'_id': victim['_id']}, {'bytes': 1})
+                if removed:
+                    RenditionCache._add_bytes(-removed.get('bytes', 0))
+                    evicted += 1
+                    total -= SourceImage.remove_if_unused(victim['source_hash'])
+                total -= victim.get('bytes', 0)
+        return evicted
+
+    @staticmethod
+    def _remove_files(entry):
+        blob_path = RenditionCache.blob_path(entry['_id'])
+        for filename in entry.get('aliases', []):
+            alias_path = os.path.join(RenditionCache.output_directory(), filename)
+            # The alias may since have been repointed at a newer upload with the same title
+            if os.path.islink(alias_path) and os.path.realpath(alias_path) == os.path.realpath(blob_path):
+                os.remove(alias_path)
+        # The key's lock file stays: a request may hold it or be waiting on it, and
+        # unlinking it would let the next request lock a new file alongside them
+        if os.path.exists(blob_path):
+            os.remove(blob_path)
+
+
+class SourceImage:
+    """
+    The original upload behind a title slug, stored once per content hash
+    under static/output/originals. Renditions are derived from it on demand.
+    """
+
+    @staticmethod
+    def original_path(source_hash, extension):
+        return os.path.join(RenditionCache.output_directory(), ORIGINAL_DIRECTORY, f"{source_hash}.{extension}")
+
+    @staticmethod
+    def save(slug, source_hash, stream, extension, width, height):
+        path = SourceImage.original_path(source_hash, extension)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            stream.seek(0)
+            with open(temp_path, 'wb') as f:
+                for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                    f.write(chunk)
+            try:
+                # Linking fails if another upload of the same bytes got there first, so they count once
+                os.link(temp_path, path)
+                RenditionCache._add_bytes(os.path.getsize(path))
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(temp_path)
+            stream.seek(0)
+        current_app.db.images.update_one(
+            {'_id': slug},
+            {'$set': {
+                'source_hash': source_hash,
+                'extension': extension,
+                'width': width,
+                'height': height,
+                'updated_at': datetime.utcnow(),
+            }},
+            upsert=True
+        )
+        return path
+
+    @staticmethod
+    def get(slug):
+        return current_app.db.images.find_one({'_id': slug})
+
+    @staticmethod
+    def remove_if_unused(source_hash):
+        """
+        Delete the original behind `source_hash`, and the images that use it,
+        once no rendition is cached from it and no job still has to render
+        it. Returns the bytes freed.
+        """
+        db = current_app.db
+        if db.renditions.find_one({'source_hash': source_hash}, {'_id': 1}) or db.image_jobs.find_one(
+                {'source_hash': source_hash, 'status': {'$in': ['queued', 'running']}}, {'_id': 1}):
+            return 0
+        freed = 0
+        for extension in db.images.distinct('extension', {'source_hash': source_hash}):
+            path = SourceImage.original_path(source_hash, extension)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                # Another worker evicting the same source got there first
+                continue
+            freed += size
+        db.images.delete_many({'source_hash': source_hash})
+        RenditionCache._add_bytes(-freed)
+        return freed
+
+
+class ImageJob:
+    """
+    A queued request to render a set of sizes for one uploaded image.
+
+    Jobs live in the `image_jobs` collection and move from 'queued' to
+    'running' to 'done' (or 'failed' once their attempts run out). A worker
+    holds a lease on a running job; if it dies, the lease expires and the
+    job is picked up again.
+    """
+
+    @staticmethod
+    def create(slug, title, source_hash, extension, targets, max_attempts=3):
+        now = datetime.utcnow()
+        job = {
+            'slug': slug,
+            'title': title,
+            'source_hash': source_hash,
+            'extension': extension,
+            'targets': [list(target) for target in targets],
+            'completed': [],
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': max_attempts,
+            'error': None,
+            'created_at': now,
+            'available_at': now,
+            'lease_expires_at': None,
+        }
+        result = current_app.db.image_jobs.insert_one(job)
+        return str(result.inserted_id)
+
+    @staticmethod
+    def get(job_id):
+        try:
+            return current_app.db.image_jobs.find_one({'_id': ObjectId(job_id)})
+        except InvalidId:
+            return None
+
+    @staticmethod
+    def pending_count():
+        return current_app.db.image_jobs.count_documents({'status': {'$in': ['queued', 'running']}})
+
+    @staticmethod
+    def fail_abandoned(now):
+        """
+        Mark failed the running jobs whose lease expired after their last
+        attempt, e.g. because they crashed or hung every worker that took them.
+        """
+        current_app.db.image_jobs.update_many(
+            {'status': 'running', 'lease_expires_at': {'$lt': now},
+             '$expr': {'$gte': ['$attempts', '$max_attempts']}},
+            {'$set': {'status': 'failed', 'finished_at': now, 'lease_expires_at': None,
+                      'error': 'Worker stopped responding on the last attempt'}}
+        )
+
+    @staticmethod
+    def claim(worker_id, lease_seconds):
+        """
+        Atomically take the oldest runnable job: a queued one whose retry
+        delay has passed, or a running one whose worker's lease expired and
+        that has attempts left.
+        """
+        now = datetime.utcnow()
+        ImageJob.fail_abandoned(now)
+        return current_app.db.image_jobs.find_one_and_update(
+            {'$or': [
+                {'status': 'queued', 'available_at': {'$lte': now}},
+                {'status': 'running', 'lease_expires_at': {'$lt': now},
+                 '$expr': {'$lt': ['$attempts', '$max_attempts']}},
+            ]},
+            {
+                '$set': {
+                    'status': 'running',
+                    'worker': worker_id,
+                    'started_at': now,
+                    'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                },
+                '$inc': {'attempts': 1},
+            },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def _update_claimed(job_id, worker_id, update):
+        """
+        Apply `update` only while `worker_id` still holds the job. Raises
+        LeaseLost once another worker has reclaimed it.
+        """
+        result = current_app.db.image_jobs.update_one(
+            {'_id': job_id, 'status': 'running', 'worker': worker_id},
+            update
+        )
+        if not result.matched_count:
+            raise LeaseLost(f"Image job {job_id} is no longer held by {worker_id}")
+
+    @staticmethod
+    def rendition_done(job_id, worker_id, target, filename, lease_seconds):
+        # Each finished rendition also extends the lease, so long jobs are not reclaimed
+        ImageJob._update_claimed(job_id, worker_id, {
+            '$addToSet': {'completed': {'size': f"{target[0]}x{target[1]}", 'filename': filename}},
+            '$set': {'lease_expires_at': datetime.utcnow() + timedelta(seconds=lease_seconds)},
+        })
+
+    @staticmethod
+    def finish(job_id, worker_id):
+        ImageJob._update_claimed(job_id, worker_id, {
+            '$set': {'status': 'done', 'finished_at': datetime.utcnow(), 'lease_expires_at': None}
+        })
+
+    @staticmethod
+    def fail(job, error, retry_delay_seconds):
+        """
+        Requeue a job after an exponential delay, or mark it failed once it
+        has used all of its attempts. Does nothing if its worker has since
+        lost the lease.
+        """
+        if job['attempts'] < job['max_attempts']:
+            delay = retry_delay_seconds * 2 ** (job['attempts'] - 1)
+            update = {'status': 'queued', 'available_at': datetime.utcnow() + timedelta(seconds=delay)}
+        else:
+            update = {'status': 'failed', 'finished_at': datetime.utcnow()}
+        update.update({'error': error, 'lease_expires_at': None})
+        current_app.db.image_jobs.update_one({'_id': job['_id'], 'status': 'running', 'worker': job['worker']},
+                                             {'$set': update})
@@ -0,0 +1,208 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from PIL import Image
+
+# Passed to Image.resize so large downscales start with a cheap integer
+# reduce() and only run LANCZOS over the last ~3x of the reduction
+REDUCING_GAP = 3.0
+# Intermediates kept around as resize sources; the largest are dropped first
+# once they add up to more than this many pixels
+INTERMEDIATE_PIXEL_BUDGET = 40_000_000
+# Pillow's own WebP defaults, spelled out because they are part of the cache key
+WEBP_QUALITY = 80
+WEBP_METHOD = 4
+# Everything that changes the bytes of a rendition; bump 'version' when the
+# resize pipeline changes so old cache entries stop matching
+ENCODER_SETTINGS = {
+    'format': 'webp',
+    'quality': WEBP_QUALITY,
+    'method': WEBP_METHOD,
+    'resample': 'lanczos',
+    'reducing_gap': REDUCING_GAP,
+    'version': 1,
+}
+
+
+def parse_sizes(sizes):
+    """
+    Turn 'WxH' strings into unique (width, height) tuples, keeping the
+    order they were selected in.
+    """
+    targets = []
+    for size in sizes:
+        width, height = map(int, size.split('x'))
+        if (width, height) not in targets:
+            targets.append((width, height))
+    return targets
+
+
+def probe_image(source):
+    """
+    Read just the header of an upload for its format and full size, then
+    rewind it for decoding.
+    """
+    with Image.open(source) as img:
+        info = img.format, img.size
+    source.seek(0)
+    return info
+
+
+def decode_image(source, targets):
+    """
+    Decode the upload once. JPEGs are decoded at the smallest DCT scale that
+    still covers the largest target, which skips most of the decode work for
+    big photos.
+    """
+    img = Image.open(source)
+    if img.format == 'JPEG' and targets:
+        max_width = max(width for width, _ in targets)
+        max_height = max(height for _, height in targets)
+        img.draft('RGB', (max_width, max_height))
+    img.load()
+    if img.mode not in ('RGB', 'RGBA'):
+        has_alpha = img.mode in ('LA', 'PA') or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+    return img
+
+
+def _covers(img, width, height):
+    return img.width >= width and img.height >= height
+
+
+def _pick_source(pool, width, height):
+    candidates = [img for img in pool if _covers(img, width, height)]
+    return min(candidates, key=lambda img: img.width * img.height) if candidates else None
+
+
+def render_renditions(img, targets):
+    """
+    Yield ((width, height), image) for each target.
+
+    Targets are rendered largest first, and each one is resized from the
+    smallest image computed so far that covers it in both dimensions, so
+    most renditions start from a source only a little larger than
+    themselves instead of the full-resolution original.
+    """
+    pool = [img]
+    for width, height in sorted(targets, key=lambda size: size[0] * size[1], reverse=True):
+        source = _pick_source(pool, width, height) or img
+        rendition = source.resize((width, height), Image.LANCZOS, reducing_gap=REDUCING_GAP)
+        yield (width, height), rendition
+
+        pool.append(rendition)
+        intermediates = sorted(pool[1:], key=lambda im: im.width * im.height, reverse=True)
+        while intermediates and sum(im.width * im.height for im in intermediates) > INTERMEDIATE_PIXEL_BUDGET:
+            pool.remove(intermediates.pop(0))
+
+
+_executor = None
+_executor_size = None
+# gthread workers share the pool; only one thread may create or replace it
+_executor_lock = threading.Lock()
+
+
+def _get_executor(pool_size):
+    """
+    Lazily start one process pool per web worker. Spawned rather than forked
+    so the children never inherit the parent's Mongo client or threads.
+    """
+    global _executor, _executor_size
+    with _executor_lock:
+        if _executor is None or _executor_size != pool_size:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=pool_size, mp_context=multiprocessing.get_context('spawn'))
+            _executor_size = pool_size
+        return _executor
+
+
+def save_webp(img, path):
+    """
+    Encode to a temporary file and rename it into place, so readers never
+    see a half-written rendition.
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        img.save(temp_path, 'WEBP', quality=WEBP_QUALITY, method=WEBP_METHOD)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _save_group(img, targets, output_paths, on_saved=None):
+    renditions = render_renditions(img, targets)
+    try:
+        for target, rendition in renditions:
+            save_webp(rendition, output_paths[target])
+            if on_saved:
+                on_saved(target)
+    finally:
+        # Drop the generator's references to the source before its buffer goes away
+        renditions.close()
+
+
+def _save_group_from_shared_memory(shm_name, mode, size, targets, output_paths):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        img = Image.frombuffer(mode, size, shm.buf, 'raw', mode, 0, 1)
+        try:
+            _save_group(img, targets, output_paths)
+        finally:
+            del img
+    finally:
+        shm.close()
+    return [output_paths[target] for target in targets]
+
+
+def _split_targets(targets, groups):
+    """
+    Deal targets out to `groups` buckets, largest first, always onto the
+    bucket with the fewest pixels so far, so the workers finish together.
+    """
+    buckets = [[] for _ in range(groups)]
+    loads = [0] * groups
+    for target in sorted(targets, key=lambda size: size[0] * size[1], reverse=True):
+        index = loads.index(min(loads))
+        buckets[index].append(target)
+        loads[index] += target[0] * target[1]
+    return [bucket for bucket in buckets if bucket]
+
+
+def save_renditions(img, targets, output_paths, pool_size=1, parallel_min_pixels=0, on_saved=None):
+    """
+    Render and encode every target to its output path.
+
+    Jobs whose renditions add up to fewer than `parallel_min_pixels` pixels,
+    or runs with a single worker, are done in this process; otherwise the
+    decoded pixels are copied once into shared memory and the targets are
+    split across a process pool that reads them from there. `on_saved` is
+    called in this process with each target once its file is in place.
+    """
+    total_pixels = sum(width * height for width, height in targets)
+    if pool_size <= 1 or len(targets) < 2 or total_pixels < parallel_min_pixels:
+        _save_group(img, targets, output_paths, on_saved)
+        return
+
+    data = img.tobytes()
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[:len(data)] = data
+        del data
+        executor = _get_executor(pool_size)
+        futures = {
+            executor.submit(_save_group_from_shared_memory, shm.name, img.mode, img.size, group,
+                            {target: output_paths[target] for target in group}): group
+            for group in _split_targets(targets, pool_size)
+        }
+        for future in as_completed(futures):
+            future.result()
+            if on_saved:
+                for target in futures[future]:
+                    on_saved(target)
+    finally:
+        shm.close()
+        shm.unlink()
@@ -1,42 +1,142 @@
 import os
-from flask import render_template, flash, redirect, url_for, current_app, request
-from werkzeug.utils import secure_filename
+from flask import render_template, flash, redirect, url_for, current_app, request, send_file, abort, jsonify
 from . import image_processor
 from .forms import ImageUploadForm
-from PIL import Image
+from .models import ImageJob, RenditionCache, SourceImage, hash_stream, rendition_key
+from .renditions import decode_image, parse_sizes, probe_image, render_renditions, save_webp
 import slugify
 
-def process_image(image, sizes, title):
-    results = []
-    output_directory = os.path.join(current_app.root_path, 'static', 'output')
-    os.makedirs(output_directory, exist_ok=True)
+# Largest width or height the on-demand endpoint will render
+MAX_RENDER_DIMENSION = 8192
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
 
-    for size in sizes:
-        width, height = map(int, size.split('x'))
-        img = Image.open(image)
-        img = img.resize((width, height), Image.LANCZOS)
+def enqueue_image(image, sizes, title):
+    """
+    Store the original upload and queue a job to render the selected sizes.
+    Returns the job ID, or None when no sizes were selected.
+    """
+    targets = parse_sizes(sizes)
+    slug = slugify.slugify(title)
+    source_hash = hash_stream(image)
 
-        # Create slugified filename
-        filename = f"{slugify.slugify(title)}-{width}x{height}.webp"
+    # Keep the original so the worker, and the on-demand endpoint, can render from it
+    image_format, (original_width, original_height) = probe_image(image)
+    extension = EXTENSIONS.get(image_format, 'img')
+    SourceImage.save(slug, source_hash, image, extension, original_width, original_height)
 
-        # Save the image
-        output_path = os.path.join(output_directory, filename)
-        img.save(output_path, 'WEBP')
-        results.append(f"Saved {filename} to {output_path}")
-
-    return results
+    if not targets:
+        return None
+    return ImageJob.create(slug, title, source_hash, extension, targets)
 
 @image_processor.route('/', methods=['GET', 'POST'])
 def upload_image():
     form = ImageUploadForm()
     if form.validate_on_submit():
+        # Refuse new work instead of letting a burst of uploads pile up behind the workers
+        if ImageJob.pending_count() >= current_app.config['IMAGE_MAX_PENDING_JOBS']:
+            flash('The image processor is busy. Please try again in a few minutes.', 'error')
+            return render_template('image_processor/upload.html', form=form)
+
         f = form.image.data
-        filename = secure_filename(f.filename)
+        job_id = enqueue_image(f, form.sizes.data, form.title.data)
+
+        if job_id is None:
+            flash('Image uploaded. Sizes can be requested on demand.', 'success')
+            return render_template('image_processor/result.html', job=None,
+                                   slug=slugify.slugify(form.title.data))
+        flash('Image queued for processing.', 'success')
+        return redirect(url_for('image_processor.job_status', job_id=job_id))
+
+    return render_template('image_processor/upload.html', form=form)
+
+def _job_progress(job):
+    return {
+        'job_id': str(job['_id']),
+        'status': job['status'],
+        'total': len(job['targets']),
+        'completed': [
+            dict(rendition, url=url_for('static', filename=f"output/{rendition['filename']}"))
+            for rendition in job['completed']
+        ],
+        'attempts': job['attempts'],
+        'error': job['error'],
+    }
+
+@image_processor.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = ImageJob.get(job_id)
+    if not job:
+        flash('Image job not found', 'error')
+        return redirect(url_for('image_processor.upload_image'))
+    return render_template('image_processor/result.html', job=_job_progress(job), slug=job['slug'])
+
+@image_processor.route('/jobs/<job_id>/progress')
+def job_progress(job_id):
+    job = ImageJob.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_job_progress(job))
+
+def _render_on_demand(image, target, key):
+    source_path = RenditionCache.nearest_source(image['source_hash'], target) \
+        or SourceImage.original_path(image['source_hash'], image['extension'])
+    if not os.path.exists(source_path):
+        abort(404)
+
+    try:
+        with open(source_path, 'rb') as source:
+            img = decode_image(source, [target])
+    except FileNotFoundError:
+        # Evicted along with the source's last rendition since the check above
+        abort(404)
+    for _, rendition in render_renditions(img, [target]):
+        save_webp(rendition, RenditionCache.blob_path(key))
+    RenditionCache.store(image['source_hash'], {key: target})
+    RenditionCache.evict(current_app.config['IMAGE_CACHE_MAX_BYTES'], pinned=[key])
+
+def _render_locked(image, target, key):
+    with RenditionCache.lock(key):
+        # Another request may have rendered it while this one waited for the lock
+        if not os.path.exists(RenditionCache.blob_path(key)):
+            _render_on_demand(image, target, key)
+
+@image_processor.route('/render/<slug>/<int:width>x<int:height>.webp')
+def render(slug, width, height):
+    """
+    Serve one rendition of an uploaded image, rendering it on first request.
+    """
+    if not (0 < width <= MAX_RENDER_DIMENSION and 0 < height <= MAX_RENDER_DIMENSION):
+        abort(404)
+    image = SourceImage.get(slug)
+    if not image:
+        abort(404)
+
+    target = (width, height)
+    key = rendition_key(image['source_hash'], target)
+    max_age = current_app.config['IMAGE_RENDER_MAX_AGE']
 
-        # Process the image only for selected sizes
-        results = process_image(f, form.sizes.data, form.title.data)
+    # The key fixes the bytes, so a matching ETag needs neither the disk nor a render
+    if key in request.if_none_match:
+        response = current_app.response_class(status=304)
+        response.set_etag(key)
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        return response
 
-        flash('Image processed successfully!', 'success')
-        return render_template('image_processor/result.html', results=results)
+    path = RenditionCache.blob_path(key)
+    if os.path.exists(path):
+        RenditionCache.touch([key])
+    else:
+        _render_locked(image, target, key)
 
-    return render_template('image_processor/upload.html', form=form)
\ No newline at end of file
+    try:
+        response = send_file(path, mimetype='image/webp', etag=key, max_age=max_age, conditional=True)
+    except FileNotFoundError:
+        # Evicted by another request between the check and the open; render it again
+        _render_locked(image, target, key)
+        try:
+            response = send_file(path, mimetype='image/webp', etag=key, max_age=max_age, conditional=True)
+        except FileNotFoundError:
+            abort(404)
+    response.cache_control.public = True
+    return response
@@ -0,0 +1,103 @@
+# image_processor/worker.py
+import multiprocessing
+import os
+import socket
+import time
+from flask import current_app
+from .models import ImageJob, LeaseLost, RenditionCache, SourceImage, rendition_key
+from .renditions import decode_image, save_renditions
+
+
+def rendition_filename(slug, target):
+    return f"{slug}-{target[0]}x{target[1]}.webp"
+
+
+def run_job(job):
+    """
+    Render every size of a claimed job, recording each rendition on the job
+    as soon as it is on disk so the result page can show progress. Raises
+    LeaseLost if another worker reclaims it part way through.
+    """
+    source_hash = job['source_hash']
+    targets = [tuple(target) for target in job['targets']]
+    keys = {target: rendition_key(source_hash, target) for target in targets}
+    lease_seconds = current_app.config['IMAGE_JOB_LEASE_SECONDS']
+
+    def saved(target):
+        filename = rendition_filename(job['slug'], target)
+        RenditionCache.alias(filename, keys[target])
+        ImageJob.rendition_done(job['_id'], job['worker'], target, filename, lease_seconds)
+
+    # Identical bytes at the same size and settings were already encoded once
+    cached = RenditionCache.lookup(keys.values())
+    RenditionCache.touch(cached)
+    for target in targets:
+        if keys[target] in cached:
+            saved(target)
+
+    missing = [target for target in targets if keys[target] not in cached]
+    if missing:
+        with open(SourceImage.original_path(source_hash, job['extension']), 'rb') as original:
+            source = decode_image(original, missing)
+
+        def stored(target):
+            RenditionCache.store(source_hash, {keys[target]: target})
+            saved(target)
+
+        # Resize and save every rendition, across the worker pool for large jobs
+        save_renditions(source, missing, {target: RenditionCache.blob_path(keys[target]) for target in missing},
+                        pool_size=current_app.config['IMAGE_POOL_SIZE'],
+                        parallel_min_pixels=current_app.config['IMAGE_PARALLEL_MIN_PIXELS'],
+                        on_saved=stored)
+
+    RenditionCache.evict(current_app.config['IMAGE_CACHE_MAX_BYTES'], pinned=keys.values())
+    ImageJob.finish(job['_id'], job['worker'])
+
+
+def work(poll_interval=1.0, max_jobs=None):
+    """
+    Claim and run jobs until `max_jobs` have been handled (forever if None).
+    Must be called inside an application context.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    handled = 0
+    while max_jobs is None or handled < max_jobs:
+        job = ImageJob.claim(worker_id, current_app.config['IMAGE_JOB_LEASE_SECONDS'])
+        if not job:
+            time.sleep(poll_interval)
+            continue
+        try:
+            run_job(job)
+        except LeaseLost as e:
+            # The worker that reclaimed it owns the job now
+            current_app.logger.warning(str(e))
+        except Exception as e:
+            current_app.logger.error(f"Error processing image job {job['_id']}: {str(e)}")
+            ImageJob.fail(job, str(e), current_app.config['IMAGE_JOB_RETRY_DELAY_SECONDS'])
+        handled += 1
+
+
+def _worker_process(poll_interval):
+    from .. import create_app
+
+    app = create_app()
+    with app.app_context():
+        work(poll_interval)
+
+
+def run_workers(concurrency, poll_interval=1.0):
+    """
+    Run `concurrency` worker processes, each handling one job at a time.
+    This is the cap on how many uploads are rendered at once, however many
+    are queued.
+    """
+    if concurrency <= 1:
+        work(poll_interval)
+        return
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=_worker_process, args=(poll_interval,), daemon=False)
+                 for _ in range(concurrency)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
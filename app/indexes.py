@@ -0,0 +1,108 @@
+import logging
+import threading
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+# Collection name -> the IndexModels the app's queries rely on. Each module
+# registers the indexes for the collections it owns when it is imported.
+_registry = {}
+_ensured = set()
+_ensured_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+
+def register_indexes(name, *indexes):
+    _registry.setdefault(name, []).extend(indexes)
+
+
+def registered_indexes():
+    return {name: list(indexes) for name, indexes in sorted(_registry.items())}
+
+
+def _with_background(index):
+    document = dict(index.document)
+    keys = list(document.pop('key').items())
+    document['background'] = True
+    return IndexModel(keys, **document)
+
+
+def create_registered_indexes(collection, name=None, background=False):
+    """
+    Create `name`'s registered indexes (by default the collection's own
+    name) on `collection`. Indexes that already exist are left as they
+    are. Returns [(index name, error or None)]; one index failing, e.g. a
+    unique index over duplicate data, doesn't stop the others.
+    """
+    results = []
+    for index in _registry.get(name or collection.name, []):
+        try:
+            collection.create_indexes([_with_background(index) if background else index])
+            results.append((index.document['name'], None))
+        except OperationFailure as e:
+            results.append((index.document['name'], str(e)))
+    return results
+
+
+def ensure_indexes(collection, name=None):
+    """
+    create_registered_indexes, once per process and collection; called by
+    models before they query so a fresh database works without `apply`.
+    An index that can't be built (e.g. unique over legacy duplicates) is
+    logged and not retried, like at startup: queries still run without it.
+    """
+    marker = (collection.full_name, name or collection.name)
+    with _ensured_lock:
+        if marker in _ensured:
+            return
+        _ensured.add(marker)
+    try:
+        results = create_registered_indexes(collection, name)
+    except Exception:
+        # Not an index problem (e.g. Mongo unreachable), so try again next time
+        with _ensured_lock:
+            _ensured.discard(marker)
+        raise
+    for index_name, error in results:
+        if error:
+            logger.warning(f"Could not create index {index_name} on {collection.full_name}: {error}")
+
+
+def apply_indexes(db, background=False):
+    """
+    Create every registered index in `db`. Safe to re-run. Returns
+    {collection: [(index name, error or None)]}.
+    """
+    return {name: create_registered_indexes(db[name], background=background) for name in sorted(_registry)}
+
+
+indexes_cli = AppGroup('indexes', help='Create and inspect the MongoDB indexes the app relies on.')
+
+
+@indexes_cli.command('apply')
+@click.option('--background', is_flag=True,
+              help="Ask for background builds (only honored by MongoDB before 4.2, where builds lock the collection).")
+def apply_command(background):
+    """Create every registered index that doesn't exist yet."""
+    failures = 0
+    for name, results in apply_indexes(current_app.db, background).items():
+        for index_name, error in results:
+            if error:
+                failures += 1
+                click.echo(f"{name}.{index_name}: FAILED: {error}", err=True)
+            else:
+                click.echo(f"{name}.{index_name}: ok")
+    if failures:
+        raise click.ClickException(f"{failures} index(es) could not be created")
+
+
+@indexes_cli.command('list')
+def list_command():
+    """Compare the registered indexes with those in the database."""
+    for name, indexes in registered_indexes().items():
+        existing = set(current_app.db[name].index_information())
+        for index in indexes:
+            index_name = index.document['name']
+            click.echo(f"{name}.{index_name}: {'present' if index_name in existing else 'MISSING'}")
@@ -0,0 +1,371 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+import httpx
+from flask import current_app
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+from .indexes import ensure_indexes, register_indexes
+
+# Optimistic bucket updates retried this many times under contention before backing off
+BUCKET_UPDATE_ATTEMPTS = 5
+CONTENTION_WAIT_SECONDS = 0.05
+# Per-minute metric documents are kept this long
+METRICS_RETENTION = timedelta(days=7)
+
+register_indexes('llm_metrics',
+                 IndexModel([('minute', ASCENDING)], expireAfterSeconds=int(METRICS_RETENTION.total_seconds())))
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 5000, 10000, 30000)
+# Rough GPT tokenizer ratio for English prose, for reservations and chunk sizes
+CHARS_PER_TOKEN = 4
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+
+class TokenBucket:
+    """
+    A token bucket stored in MongoDB so every worker process draws from the
+    same budget. `capacity` tokens refill evenly over a minute.
+    """
+
+    def __init__(self, collection, name, per_minute):
+        self.collection = collection
+        self.name = name
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+
+    def try_take(self, amount):
+        """
+        Take `amount` tokens if they are available. Returns 0 on success, or
+        the number of seconds to wait before trying again.
+        """
+        # A single request bigger than the whole bucket still goes through once it is full
+        amount = min(amount, self.capacity)
+        for _ in range(BUCKET_UPDATE_ATTEMPTS):
+            now = time.time()
+            state = self.collection.find_one({'_id': self.name})
+            if state is None:
+                try:
+                    self.collection.insert_one({'_id': self.name, 'tokens': float(self.capacity), 'updated_at': now})
+                except DuplicateKeyError:
+                    pass
+                continue
+            tokens = min(self.capacity, state['tokens'] + (now - state['updated_at']) * self.rate)
+            if tokens < amount:
+                return (amount - tokens) / self.rate
+            # Only applies if no other worker changed the bucket since it was read
+            result = self.collection.update_one(
+                {'_id': self.name, 'tokens': state['tokens'], 'updated_at': state['updated_at']},
+                {'$set': {'tokens': tokens - amount, 'updated_at': now}}
+            )
+            if result.modified_count:
+                return 0
+        return CONTENTION_WAIT_SECONDS
+
+    def give_back(self, amount):
+        if amount > 0:
+            self.collection.update_one({'_id': self.name}, {'$inc': {'tokens': amount}})
+
+
+class LLMMetrics:
+    """
+    Per-model, per-minute call counters in the `llm_metrics` collection:
+    calls, errors, retries, rate-limit responses, token usage, time queued
+    on the rate limiter and a latency histogram. Shared by every worker process.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        ensure_indexes(self.collection, 'llm_metrics')
+
+    def record(self, model, latency, waited=0.0, prompt_tokens=0, completion_tokens=0, retries=0, rate_limited=0,
+               error=None):
+        self.ensure_indexes()
+        minute = datetime.utcnow().replace(second=0, microsecond=0)
+        latency_ms = int(latency * 1000)
+        bucket = next((f"le_{limit}" for limit in LATENCY_BUCKETS_MS if latency_ms <= limit), 'inf')
+        self.collection.update_one(
+            {'_id': f"{model}:{minute.isoformat()}"},
+            {
+                '$setOnInsert': {'model': model, 'minute': minute},
+                '$inc': {
+                    'calls': 1,
+                    'errors': 1 if error else 0,
+                    'retries': retries,
+                    'rate_limited': rate_limited,
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'latency_ms_total': latency_ms,
+                    'wait_ms_total': int(waited * 1000),
+                    f"latency_ms.{bucket}": 1,
+                },
+                '$max': {'latency_ms_max': latency_ms},
+            },
+            upsert=True
+        )
+
+    def summary(self, minutes=60):
+        """
+        Totals per model over the last `minutes` minutes.
+        """
+        since = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=minutes - 1)
+        totals = {}
+        for doc in self.collection.find({'minute': {'$gte': since}}):
+            model = totals.setdefault(doc['model'], {
+                'calls': 0, 'errors': 0, 'retries': 0, 'rate_limited': 0,
+                'prompt_tokens': 0, 'completion_tokens': 0, 'latency_ms_total': 0, 'wait_ms_total': 0,
+                'latency_ms_max': 0, 'latency_ms': {},
+            })
+            for field in ('calls', 'errors', 'retries', 'rate_limited', 'prompt_tokens',
+                          'completion_tokens', 'latency_ms_total', 'wait_ms_total'):
+                model[field] += doc.get(field, 0)
+            model['latency_ms_max'] = max(model['latency_ms_max'], doc.get('latency_ms_max', 0))
+            for bucket, count in doc.get('latency_ms', {}).items():
+                model['latency_ms'][bucket] = model['latency_ms'].get(bucket, 0) + count
+        for model in totals.values():
+            model['latency_ms_avg'] = model.pop('latency_ms_total') // model['calls'] if model['calls'] else 0
+            model['wait_ms_avg'] = model.pop('wait_ms_total') // model['calls'] if model['calls'] else 0
+        return totals
+
+
+class LLMGateway:
+    """
+    The process-wide path to the LLM provider.
+
+    One background event loop owns a single AsyncOpenAI client, so its HTTP
+    connection pool is reused by every request in the process. Each call
+    first takes from shared request and token buckets, is retried with
+    exponential backoff and full jitter on 429s, 5xxs and connection
+    errors, and is recorded in LLMMetrics. Views run coroutines on the
+    gateway's loop with run() and iterate().
+    """
+
+    def __init__(self, db, api_key=None, base_url=None, requests_per_minute=500, tokens_per_minute=200000,
+                 max_attempts=5, backoff_base=0.5, backoff_max=20.0, timeout=60.0, max_connections=20):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.request_bucket = TokenBucket(db.llm_rate_limits, 'requests', requests_per_minute)
+        self.token_bucket = TokenBucket(db.llm_rate_limits, 'tokens', tokens_per_minute)
+        self.metrics = LLMMetrics(db.llm_metrics)
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='llm-gateway', daemon=True)
+        self._thread.start()
+
+    @property
+    def client(self):
+        # Created on first use, on the gateway loop, so apps running the fake client need no API key
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=self.timeout,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                    timeout=self.timeout
+                )
+            )
+        return self._client
+
+    def run(self, coro):
+        """
+        Run a coroutine on the gateway loop and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def iterate(self, agen):
+        """
+        Iterate an async generator on the gateway loop from synchronous code.
+        """
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    break
+        finally:
+            self.run(agen.aclose())
+
+    async def _acquire(self, tokens):
+        """
+        Wait until both buckets allow the call. Returns the seconds waited.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        while True:
+            wait = await loop.run_in_executor(None, self.request_bucket.try_take, 1)
+            if not wait:
+                wait = await loop.run_in_executor(None, self.token_bucket.try_take, tokens)
+                if not wait:
+                    return time.perf_counter() - started
+                await loop.run_in_executor(None, self.request_bucket.give_back, 1)
+            await asyncio.sleep(wait)
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        response = getattr(error, 'response', None)
+        if response is not None:
+            try:
+                retry_after = float(response.headers.get('retry-after'))
+            except (TypeError, ValueError):
+                pass
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        return max(delay, retry_after or 0)
+
+    async def _record(self, model, started, waited, usage=None, retries=0, rate_limited=0, error=None):
+        # Time spent queued on the rate limiter is reported apart from call latency
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: self.metrics.record(
+            model, time.perf_counter() - started - waited, waited=waited,
+            prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+            completion_tokens=getattr(usage, 'completion_tokens', 0) or 0,
+            retries=retries, rate_limited=rate_limited, error=error
+        ))
+
+    async def _settle(self, reserved, usage):
+        # Tokens are reserved up front from an estimate; return what the call didn't use
+        loop = asyncio.get_running_loop()
+        if usage is None:
+            return
+        await loop.run_in_executor(None, self.token_bucket.give_back, reserved - (usage.total_tokens or 0))
+
+    async def _release(self, reserved, used=0):
+        # A failed call used none of its reservation, or only what a broken stream had consumed
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.token_bucket.give_back, max(reserved - used, 0))
+
+    async def complete(self, model, messages, max_tokens, estimated_prompt_tokens, **options):
+        """
+        Return the completion's text.
+        """
+        reserved = estimated_prompt_tokens + max_tokens
+        started = time.perf_counter()
+        waited = 0.0
+        rate_limited = 0
+        for attempt in range(1, self.max_attempts + 1):
+            waited += await self._acquire(reserved)
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model, messages=messages, max_tokens=max_tokens, **options
+                )
+            except RETRYABLE_ERRORS as e:
+                await self._release(reserved)
+                rate_limited += isinstance(e, RateLimitError)
+                if attempt == self.max_attempts:
+                    await self._record(model, started, waited, retries=attempt - 1, rate_limited=rate_limited, error=e)
+                    raise
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+            except Exception as e:
+                await self._release(reserved)
+                await self._record(model, started, waited, retries=attempt - 1, rate_limited=rate_limited, error=e)
+                raise
+            await self._settle(reserved, response.usage)
+            await self._record(model, started, waited, response.usage, retries=attempt - 1, rate_limited=rate_limited)
+            return response.choices[0].message.content
+
+    async def stream(self, model, messages, max_tokens, estimated_prompt_tokens, **options):
+        """
+        Yield the completion's text as it is generated. Failures are retried
+        only until the first token has been yielded.
+        """
+        reserved = estimated_prompt_tokens + max_tokens
+        started = time.perf_counter()
+        waited = 0.0
+        rate_limited = 0
+        for attempt in range(1, self.max_attempts + 1):
+            waited += await self._acquire(reserved)
+            usage = None
+            yielded = False
+            used = 0
+            finished = retry = False
+            error = None
+            try:
+                response = await self.client.chat.completions.create(
+                    model=model, messages=messages, max_tokens=max_tokens, stream=True,
+                    stream_options={'include_usage': True}, **options
+                )
+                # Once the stream is open the prompt has been read, and each token sent is spent
+                used = estimated_prompt_tokens
+                async for chunk in response:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                        used = usage.total_tokens or used
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yielded = True
+                        used += estimate_tokens(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                finished = True
+            except RETRYABLE_ERRORS as e:
+                error = e
+                rate_limited += isinstance(e, RateLimitError)
+                retry = not yielded and attempt < self.max_attempts
+                if not retry:
+                    raise
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                # Also reached when the consumer goes away mid-stream (GeneratorExit or
+                # CancelledError at the yield), so the reservation is never leaked
+                if finished:
+                    await self._settle(reserved, usage)
+                else:
+                    await self._release(reserved, used)
+                if not retry:
+                    await self._record(model, started, waited, usage, retries=attempt - 1,
+                                       rate_limited=rate_limited, error=error)
+            if finished:
+                return
+            await asyncio.sleep(self._backoff(attempt, error))
+
+_gateway = None
+_gateway_pid = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """
+    The gateway for this process, created from the current app's config on
+    first use. A forked child builds its own, since threads and event loops
+    don't survive fork.
+    """
+    global _gateway, _gateway_pid
+    with _gateway_lock:
+        if _gateway is None or _gateway_pid != os.getpid():
+            config = current_app.config
+            _gateway = LLMGateway(
+                current_app.db,
+                api_key=config['OPENAI_API_KEY'],
+                base_url=config['OPENAI_BASE_URL'],
+                requests_per_minute=config['LLM_REQUESTS_PER_MINUTE'],
+                tokens_per_minute=config['LLM_TOKENS_PER_MINUTE'],
+                max_attempts=config['LLM_MAX_ATTEMPTS'],
+                backoff_base=config['LLM_BACKOFF_BASE_SECONDS'],
+                backoff_max=config['LLM_BACKOFF_MAX_SECONDS'],
+                timeout=config['LLM_TIMEOUT_SECONDS'],
+                max_connections=config['LLM_MAX_CONNECTIONS']
+            )
+            _gateway_pid = os.getpid()
+        return _gateway
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_prompt_tokens(messages):
+    return estimate_tokens(''.join(message['content'] for message in messages))
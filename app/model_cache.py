@@ -0,0 +1,109 @@
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class ModelCache:
+    """
+    A small read-through cache for model lookups, local to one process.
+
+    Holds at most `max_entries` documents, dropping the least recently used,
+    and each for at most `ttl_seconds`: models invalidate entries when they
+    write, but only in the process that wrote, so the TTL bounds how stale
+    another worker's copy can be. Callers get their own copy of a document.
+    """
+
+    def __init__(self, name, max_entries, ttl_seconds):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, load):
+        """
+        The cached document for `key`, or `load()`'s result, cached unless
+        it is None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+            self.misses += 1
+            generation = self._generation
+
+        document = load()
+        if document is None:
+            return None
+        with self._lock:
+            # Don't store what was read before a concurrent write invalidated it
+            if generation == self._generation:
+                self._entries[key] = (document, now + self.ttl_seconds)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return copy.deepcopy(document)
+
+    def invalidate(self, *keys, where=None):
+        """
+        Drop `keys`, and every entry whose document matches `where`.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+            if where:
+                for key in [key for key, (document, _) in self._entries.items() if where(document)]:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+
+_caches = {}
+_caches_pid = None
+_caches_lock = threading.Lock()
+
+
+def get_model_cache(name):
+    """
+    This process's cache called `name`, sized from the current app's
+    config on first use. A forked child starts with empty caches.
+    """
+    global _caches, _caches_pid
+    with _caches_lock:
+        if _caches_pid != os.getpid():
+            _caches = {}
+            _caches_pid = os.getpid()
+        if name not in _caches:
+            _caches[name] = ModelCache(name, current_app.config['MODEL_CACHE_MAX_ENTRIES'],
+                                       current_app.config['MODEL_CACHE_TTL_SECONDS'])
+        return _caches[name]
+
+
+def model_cache_stats():
+    with _caches_lock:
+        caches = list(_caches.values()) if _caches_pid == os.getpid() else []
+    return {cache.name: cache.stats() for cache in caches}
@@ -0,0 +1,20 @@
+import click
+from . import research_assistant
+from .models import ScholarCache, SearchResult
+
+
+@research_assistant.cli.command('migrate-search-results')
+def migrate_search_results_command():
+    """Move search results embedded in projects into search_results."""
+    projects, results = SearchResult.migrate_embedded_results()
+    click.echo(f"Migrated {results} search results from {projects} projects")
+
+
+@research_assistant.cli.command('scholar-cache-stats')
+def scholar_cache_stats_command():
+    """Show hit and miss counts for the shared Google Scholar cache."""
+    stats = ScholarCache.stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = stats['hits'] / lookups if lookups else 0
+    click.echo(f"{stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses "
+               f"({hit_rate:.0%} hit rate), {stats['fetches']} searches sent to Scholar")
@@ -8,6 +8,10 @@ class ScholarSearchForm(FlaskForm):
     query = StringField('Search Query', validators=[DataRequired()])
     submit = SubmitField('Search')
 
+class ScholarBatchSearchForm(FlaskForm):
+    queries = TextAreaField('Search Queries (one per line)', validators=[DataRequired()])
+    submit = SubmitField('Search All')
+
 class ResearchProjectForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired()])
     description = TextAreaField('Description', validators=[DataRequired()])
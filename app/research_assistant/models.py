@@ -1,7 +1,34 @@
 # research_assistant/models.py
 
+import hashlib
+import re
+from datetime import datetime, timedelta
 from bson import ObjectId
 from flask import current_app
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from ..books.pagination import fetch_page
+from ..indexes import ensure_indexes, register_indexes
+from ..model_cache import get_model_cache
+
+SEARCH_RESULTS_PER_PAGE = 20
+MIGRATION_BATCH_SIZE = 100
+# Batches only matter while the project page is polling them
+SEARCH_BATCH_TTL_SECONDS = 7 * 24 * 3600
+DUPLICATE_KEY_ERROR = 11000
+# Projects not yet migrated still embed every search result
+PROJECT_PROJECTION = {'search_results': 0}
+LIST_PROJECTION = {'title': 1}
+
+register_indexes(
+    'search_results',
+    IndexModel([('project_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+    IndexModel([('project_id', ASCENDING), ('dedup_key', ASCENDING)], unique=True),
+)
+register_indexes('scholar_cache', IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0))
+register_indexes('scholar_fetches', IndexModel([('expires_at', ASCENDING)], expireAfterSeconds=0))
+register_indexes('search_batches',
+                 IndexModel([('created_at', ASCENDING)], expireAfterSeconds=SEARCH_BATCH_TTL_SECONDS))
 
 class ResearchProject:
     def __init__(self, title, description, _id=None, finding_aid_ids=None, education_level=None):
@@ -20,16 +47,36 @@ class ResearchProject:
             'education_level': education_level
         }
         result = current_app.db.research_projects.insert_one(project)
+        ResearchProject._cache().invalidate('titles')
         return str(result.inserted_id)
 
+    @staticmethod
+    def _cache():
+        return get_model_cache('research_projects')
+
+    @staticmethod
+    def _invalidate(project_id):
+        ResearchProject._cache().invalidate(('id', str(project_id)), 'titles')
+
     @staticmethod
     def get_all():
-        projects = current_app.db.research_projects.find()
+        projects = current_app.db.research_projects.find({}, PROJECT_PROJECTION).sort('_id', ASCENDING)
         return [ResearchProject(p['title'], p['description'], str(p['_id']), p.get('finding_aid_ids', []), p.get('education_level')) for p in projects]
 
+    @staticmethod
+    def get_titles():
+        """
+        (id, title) for every project, for project pickers and listings.
+        """
+        def load():
+            projects = current_app.db.research_projects.find({}, LIST_PROJECTION).sort('_id', ASCENDING)
+            return {'titles': [(str(p['_id']), p['title']) for p in projects]}
+        return [tuple(pair) for pair in ResearchProject._cache().get('titles', load)['titles']]
+
     @staticmethod
     def get_by_id(project_id):
-        project = current_app.db.research_projects.find_one({'_id': ObjectId(project_id)})
+        project = ResearchProject._cache().get(('id', str(project_id)), lambda: current_app.db.research_projects.find_one(
+            {'_id': ObjectId(project_id)}, PROJECT_PROJECTION))
         if project:
             return ResearchProject(project['title'], project['description'], str(project['_id']), project.get('finding_aid_ids', []), project.get('education_level'))
         return None
@@ -40,6 +87,7 @@ class ResearchProject:
             {'_id': ObjectId(project_id)},
             {'$set': {'title': title, 'description': description, 'education_level': education_level}}
         )
+        ResearchProject._invalidate(project_id)
         return result.modified_count > 0
 
     @staticmethod
@@ -49,8 +97,13 @@ class ResearchProject:
             {"project_ids": project_id},
             {"$pull": {"project_ids": project_id}}
         )
+        # Imported here: the finding aid blueprint imports this module
+        from ..finding_aid_analyzer.models import FindingAidAnalysis
+        FindingAidAnalysis.invalidate_project(project_id)
+        SearchResult.delete_for(project_id)
         # Delete the project
         result = current_app.db.research_projects.delete_one({'_id': ObjectId(project_id)})
+        ResearchProject._invalidate(project_id)
         return result.deleted_count > 0
 
     @staticmethod
@@ -59,36 +112,300 @@ class ResearchProject:
             {'_id': ObjectId(project_id)},
             {'$addToSet': {'finding_aid_ids': finding_aid_id}}
         )
+        ResearchProject._invalidate(project_id)
         return result.modified_count > 0
 
     @staticmethod
-    def add_finding_aid(project_id, finding_aid_id):
-        result = current_app.db.research_projects.update_one(
-            {'_id': ObjectId(project_id)},
-            {'$addToSet': {'finding_aid_ids': finding_aid_id}}
+    def get_detail(project_id):
+        """
+        Load a project and its finding aids, each with its analysis
+        metadata, in one aggregation. Returns (project, finding_aids), or
+        None if the project doesn't exist. Search results are paged
+        separately with SearchResult.get_page.
+        """
+        # Imported here: the finding aid blueprint imports this module
+        from ..finding_aid_analyzer.models import FindingAidAnalysis
+
+        FindingAidAnalysis.ensure_indexes()
+        pipeline = [
+            {'$match': {'_id': ObjectId(project_id)}},
+            # Projects not yet migrated still embed their search results
+            {'$project': {'search_results': 0}},
+            {'$addFields': {'finding_aid_object_ids': {'$map': {
+                'input': {'$ifNull': ['$finding_aid_ids', []]},
+                'in': {'$toObjectId': '$$this'}
+            }}}},
+            {'$lookup': {
+                'from': 'finding_aids',
+                'localField': 'finding_aid_object_ids',
+                'foreignField': '_id',
+                'as': 'finding_aids',
+            }},
+            {'$lookup': {
+                'from': 'analyses',
+                'localField': 'finding_aid_ids',
+                'foreignField': 'file_id',
+                # Analyses from before pages moved out may still embed their text
+                'pipeline': [{'$project': {'extracted_text_pages': 0}}],
+                'as': 'analyses',
+            }},
+            {'$project': {'finding_aid_object_ids': 0}},
+        ]
+        documents = list(current_app.db.research_projects.aggregate(pipeline))
+        if not documents:
+            return None
+        document = documents[0]
+
+        project = ResearchProject(document['title'], document['description'], str(document['_id']),
+                                  document.get('finding_aid_ids', []), document.get('education_level'))
+        analyses = {analysis['file_id']: FindingAidAnalysis.from_dict(analysis) for analysis in document['analyses']}
+        finding_aids = document['finding_aids']
+        for finding_aid in finding_aids:
+            finding_aid['analysis'] = analyses.get(str(finding_aid['_id']))
+        return project, finding_aids
+
+
+class SearchResult:
+    """
+    Scholar results saved to a project, one document each, newest first.
+    A result is saved once per project, keyed on its URL (or title).
+    """
+
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.search_results)
+
+    @staticmethod
+    def dedup_key(result):
+        url = (result.get('url') or '').strip()
+        if url and url != 'N/A':
+            return url
+        return re.sub(r'\s+', ' ', (result.get('title') or '')).strip().lower()
+
+    @staticmethod
+    def add_many(project_id, results, query=None, created_at=None):
+        """
+        Save a search's results in one unordered insert. Results the project
+        already has are skipped. Returns how many were added.
+        """
+        SearchResult.ensure_indexes()
+        created_at = created_at or datetime.utcnow()
+        documents = [dict(result, project_id=ObjectId(project_id), query=query, created_at=created_at,
+                          dedup_key=SearchResult.dedup_key(result))
+                     # Inserted last to first so that, newest first, a search lists in rank order
+                     for result in reversed(results)]
+        if not documents:
+            return 0
+        try:
+            return len(current_app.db.search_results.insert_many(documents, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details['writeErrors']):
+                raise
+            return e.details['nInserted']
+
+    @staticmethod
+    def get_page(project_id, after=None, before=None, limit=SEARCH_RESULTS_PER_PAGE):
+        """
+        One page of a project's results, newest first, in the same shape as
+        books.pagination.fetch_page. Raises ValueError on a bad cursor.
+        """
+        SearchResult.ensure_indexes()
+        return fetch_page(current_app.db.search_results, sort_field='created_at', direction=DESCENDING,
+                          limit=limit, after=after, before=before,
+                          criteria={'project_id': ObjectId(project_id)})
+
+    @staticmethod
+    def cursor_for(project_id, projection=None):
+        """
+        Cursor over all of a project's results, oldest first, for exports.
+        """
+        SearchResult.ensure_indexes()
+        return current_app.db.search_results.find({'project_id': ObjectId(project_id)}, projection) \
+            .sort([('created_at', ASCENDING), ('_id', ASCENDING)])
+
+    @staticmethod
+    def delete_for(project_id):
+        current_app.db.search_results.delete_many({'project_id': ObjectId(project_id)})
+
+    @staticmethod
+    def migrate_embedded_results(batch_size=MIGRATION_BATCH_SIZE):
+        """
+        Move search results embedded in project documents into the
+        search_results collection. Returns (projects, results) migrated.
+        """
+        projects_migrated = results_migrated = 0
+        while True:
+            projects = list(current_app.db.research_projects.find(
+                {'search_results': {'$exists': True}}, {'search_results': 1}).limit(batch_size))
+            if not projects:
+                return projects_migrated, results_migrated
+            for project in projects:
+                # Keep the embedded order: later pushes become newer results
+                results = list(reversed(project['search_results'] or []))
+                results_migrated += SearchResult.add_many(project['_id'], results,
+                                                          created_at=project['_id'].generation_time)
+                current_app.db.research_projects.update_one({'_id': project['_id']},
+                                                            {'$unset': {'search_results': ''}})
+                projects_migrated += 1
+
+
+class ScholarCache:
+    """
+    Google Scholar results shared by every web worker, in the
+    `scholar_cache` collection, keyed on the normalized query and result
+    count and expired through a TTL index. A short-lived lease in
+    `scholar_fetches` marks a query one worker is already fetching, so the
+    others wait for its results instead of querying Scholar again.
+    """
+
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.scholar_cache)
+        ensure_indexes(current_app.db.scholar_fetches)
+
+    @staticmethod
+    def key(query, num_results):
+        normalized = ' '.join(query.lower().split())
+        return hashlib.sha256(f"{normalized}\x1f{num_results}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get(key, count=True):
+        ScholarCache.ensure_indexes()
+        # The TTL monitor only runs once a minute, so check expiry here too
+        entry = current_app.db.scholar_cache.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}},
+                                                      {'results': 1})
+        if count:
+            ScholarCache._count('hits' if entry else 'misses')
+        return entry['results'] if entry else None
+
+    @staticmethod
+    def put(key, query, results, ttl_seconds):
+        ScholarCache.ensure_indexes()
+        now = datetime.utcnow()
+        current_app.db.scholar_cache.update_one(
+            {'_id': key},
+            {'$set': {'query': query, 'results': results, 'created_at': now,
+                      'expires_at': now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
         )
-        return result.modified_count > 0
+        ScholarCache._count('fetches')
 
     @staticmethod
-    def get_finding_aids(project_id):
-        project = current_app.db.research_projects.find_one({'_id': ObjectId(project_id)})
-        if project and 'finding_aid_ids' in project:
-            finding_aid_ids = [ObjectId(fid) for fid in project['finding_aid_ids']]
-            finding_aids = current_app.db.finding_aids.find({'_id': {'$in': finding_aid_ids}})
-            return list(finding_aids)
-        return []
+    def claim_fetch(key, lease_seconds):
+        """
+        Take the lease to fetch `key` from Scholar. Returns False while
+        another worker holds an unexpired lease.
+        """
+        ScholarCache.ensure_indexes()
+        now = datetime.utcnow()
+        try:
+            # Matches only an expired lease; otherwise the upsert collides with the live one
+            current_app.db.scholar_fetches.update_one(
+                {'_id': key, 'expires_at': {'$lte': now}},
+                {'$set': {'expires_at': now + timedelta(seconds=lease_seconds)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
 
     @staticmethod
-    def add_search_result(project_id, search_result):
-        result = current_app.db.research_projects.update_one(
-            {'_id': ObjectId(project_id)},
-            {'$push': {'search_results': search_result}}
+    def release_fetch(key):
+        current_app.db.scholar_fetches.delete_one({'_id': key})
+
+    @staticmethod
+    def _count(counter):
+        current_app.db.scholar_cache_stats.update_one({'_id': 'scholar'}, {'$inc': {counter: 1}}, upsert=True)
+
+    @staticmethod
+    def stats():
+        counters = current_app.db.scholar_cache_stats.find_one({'_id': 'scholar'}) or {}
+        return {
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'fetches': counters.get('fetches', 0),
+            'entries': current_app.db.scholar_cache.estimated_document_count(),
+        }
+
+
+class SearchBatch:
+    """
+    Progress of a multi-query Scholar search, in `search_batches`: one entry
+    per query with its status and how many results it found and added.
+    """
+
+    @staticmethod
+    def ensure_indexes():
+        ensure_indexes(current_app.db.search_batches)
+
+    @staticmethod
+    def create(project_id, queries, timeout_seconds):
+        """
+        Queue `queries`. Each gets a lease, renewed when it starts: a query
+        still unfinished when its lease runs out was lost with the process
+        running it (e.g. a recycled web worker) and is reported failed.
+        """
+        SearchBatch.ensure_indexes()
+        now = datetime.utcnow()
+        lease_expires_at = now + timedelta(seconds=timeout_seconds)
+        result = current_app.db.search_batches.insert_one({
+            'project_id': ObjectId(project_id),
+            'queries': [{'query': query, 'status': 'pending', 'found': 0, 'added': 0,
+                         'lease_expires_at': lease_expires_at} for query in queries],
+            'created_at': now,
+        })
+        return str(result.inserted_id)
+
+    @staticmethod
+    def _set_query(batch_id, index, **fields):
+        current_app.db.search_batches.update_one(
+            {'_id': ObjectId(batch_id)},
+            {'$set': {f'queries.{index}.{name}': value for name, value in fields.items()}}
         )
-        return result.modified_count > 0
 
     @staticmethod
-    def get_search_results(project_id):
-        project = current_app.db.research_projects.find_one({'_id': ObjectId(project_id)})
-        if project and 'search_results' in project:
-            return project['search_results']
-        return []
\ No newline at end of file
+    def start_query(batch_id, index, timeout_seconds):
+        now = datetime.utcnow()
+        SearchBatch._set_query(batch_id, index, status='running', started_at=now,
+                               lease_expires_at=now + timedelta(seconds=timeout_seconds))
+
+    @staticmethod
+    def finish_query(batch_id, index, found, added):
+        SearchBatch._set_query(batch_id, index, status='done', found=found, added=added)
+
+    @staticmethod
+    def fail_query(batch_id, index, error):
+        SearchBatch._set_query(batch_id, index, status='failed', error=error)
+
+    @staticmethod
+    def _fail_stale_queries(batch):
+        now = datetime.utcnow()
+        error = 'Search was interrupted; try it again'
+        for index, query in enumerate(batch['queries']):
+            if query['status'] in ('pending', 'running') and query.get('lease_expires_at', now) < now:
+                # Only if it hasn't moved on since it was read
+                current_app.db.search_batches.update_one(
+                    {'_id': batch['_id'], f'queries.{index}.status': query['status']},
+                    {'$set': {f'queries.{index}.status': 'failed', f'queries.{index}.error': error}}
+                )
+                query.update(status='failed', error=error)
+
+    @staticmethod
+    def get(batch_id, project_id):
+        """
+        The batch's queries and overall status ('running' until every query
+        is done or failed), or None if it isn't this project's batch.
+        Queries whose lease ran out are marked failed.
+        """
+        if not ObjectId.is_valid(batch_id):
+            return None
+        batch = current_app.db.search_batches.find_one({'_id': ObjectId(batch_id),
+                                                        'project_id': ObjectId(project_id)})
+        if not batch:
+            return None
+        SearchBatch._fail_stale_queries(batch)
+        finished = all(query['status'] in ('done', 'failed') for query in batch['queries'])
+        return {
+            'status': 'done' if finished else 'running',
+            'queries': batch['queries'],
+        }
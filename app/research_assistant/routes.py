@@ -3,16 +3,23 @@
 from flask import render_template, request, jsonify, redirect, url_for, flash
 from flask import current_app
 from . import research_assistant
-from .forms import ScholarSearchForm, ResearchProjectForm
-from .scholar_search import search_google_scholar
-from .models import ResearchProject
+from ..exports import EXPORT_BATCH_SIZE, EXPORT_FORMATS, stream_export
+from .forms import ScholarSearchForm, ScholarBatchSearchForm, ResearchProjectForm
+from .scholar_search import MAX_BATCH_QUERIES, parse_batch_queries, search_google_scholar, start_batch_search
+from .models import ResearchProject, SearchBatch, SearchResult
 from ..finding_aid_analyzer.models import FindingAidAnalysis
-from ..finding_aid_analyzer.utils import analyze_finding_aid
+from ..finding_aid_analyzer.utils import analyze_finding_aid, event_stream_response, stream_analysis_events
+
+# Each project's results are read from their own cursor, so keep the outer one's batches small
+PROJECT_EXPORT_BATCH_SIZE = 100
+RESULT_EXPORT_PROJECTION = {'_id': 0, 'title': 1, 'author': 1, 'year': 1, 'url': 1}
+PROJECT_EXPORT_FIELDS = ['project_id', 'project_title', 'education_level',
+                         'result_title', 'result_author', 'result_year', 'result_url']
 
 @research_assistant.route('/', methods=['GET', 'POST'])
 def index():
     form = ScholarSearchForm()
-    projects = ResearchProject.get_all()
+    projects = ResearchProject.get_titles()
     return render_template('research_assistant/index.html', form=form, projects=projects)
 
 @research_assistant.route('/project/new', methods=['GET', 'POST'])
@@ -26,24 +33,28 @@ def new_project():
 
 @research_assistant.route('/project/<project_id>')
 def view_project(project_id):
-    project = ResearchProject.get_by_id(project_id)
-    if project:
+    detail = ResearchProject.get_detail(project_id)
+    if detail:
+        project, finding_aids = detail
+        try:
+            results_page = SearchResult.get_page(project_id, after=request.args.get('after'),
+                                                 before=request.args.get('before'))
+        except ValueError:
+            flash('Invalid page link, showing the newest search results instead.', 'error')
+            return redirect(url_for('research_assistant.view_project', project_id=project_id))
         search_form = ScholarSearchForm()
-        search_results = ResearchProject.get_search_results(project_id)
-        finding_aids = ResearchProject.get_finding_aids(project_id)
-
-        for finding_aid in finding_aids:
-            analysis = FindingAidAnalysis.get_by_file_id(finding_aid['_id'])
-            if analysis:
-                finding_aid['extracted_text_pages'] = analysis.extracted_text_pages
-            else:
-                finding_aid['extracted_text_pages'] = []
-
+        batch_form = ScholarBatchSearchForm()
+        # Page text is fetched by the browser a range at a time from the pages API
         return render_template('research_assistant/project_detail.html',
                                project=project,
-                               search_results=search_results,
+                               search_results=results_page['items'],
+                               next_cursor=results_page['next_cursor'],
+                               prev_cursor=results_page['prev_cursor'],
                                finding_aids=finding_aids,
                                form=search_form,
+                               batch_form=batch_form,
+                               batch_id=request.args.get('batch'),
+                               max_batch_queries=MAX_BATCH_QUERIES,
                                education_level=project.education_level)
     flash('Project not found', 'error')
     return redirect(url_for('research_assistant.index'))
@@ -79,11 +90,35 @@ def project_search(project_id):
     if form.validate_on_submit():
         query = form.query.data
         results = search_google_scholar(query)
-        for result in results:
-            ResearchProject.add_search_result(project_id, result)
-        flash(f'Added {len(results)} search results to the project', 'success')
+        added = SearchResult.add_many(project_id, results, query=query)
+        message = f'Added {added} search results to the project'
+        if added < len(results):
+            message += f' ({len(results) - added} already saved)'
+        flash(message, 'success')
     return redirect(url_for('research_assistant.view_project', project_id=project_id))
 
+@research_assistant.route('/project/<project_id>/search/batch', methods=['POST'])
+def project_batch_search(project_id):
+    form = ScholarBatchSearchForm()
+    if form.validate_on_submit():
+        queries = parse_batch_queries(form.queries.data)
+        if queries:
+            batch_id = start_batch_search(project_id, queries)
+            flash(f'Searching {len(queries)} queries; results are added as each one finishes', 'success')
+            return redirect(url_for('research_assistant.view_project', project_id=project_id, batch=batch_id))
+    return redirect(url_for('research_assistant.view_project', project_id=project_id))
+
+@research_assistant.route('/project/<project_id>/search/batch/<batch_id>')
+def batch_search_progress(project_id, batch_id):
+    batch = SearchBatch.get(batch_id, project_id)
+    if not batch:
+        return jsonify({'error': 'Search batch not found'}), 404
+    # The newest results, so the page can show them as queries finish
+    results = SearchResult.get_page(project_id)['items']
+    batch['results'] = [{field: result.get(field) for field in ('title', 'author', 'year', 'url', 'query')}
+                        for result in results]
+    return jsonify(batch)
+
 @research_assistant.route('/project/<project_id>/remove_finding_aid', methods=['POST'])
 def remove_finding_aid(project_id):
     finding_aid_id = request.json.get('finding_aid_id')
@@ -118,4 +153,62 @@ def analyze_text(project_id):
         return jsonify({'summary': summary, 'research_topics': research_topics})
     except Exception as e:
         current_app.logger.error(f"Error analyzing text: {str(e)}")
-        return jsonify({'error': 'An error occurred while analyzing the text'}), 500
\ No newline at end of file
+        return jsonify({'error': 'An error occurred while analyzing the text'}), 500
+
+@research_assistant.route('/project/<project_id>/analyze/stream', methods=['POST'])
+def analyze_text_stream(project_id):
+    data = request.json
+    analysis_id = data.get('analysis_id')
+    selected_text = data.get('selected_text')
+    education_level = data.get('education_level')
+
+    if not all([analysis_id, selected_text, education_level]):
+        return jsonify({'error': 'Missing required data'}), 400
+
+    return event_stream_response(stream_analysis_events(analysis_id, selected_text, education_level))
+
+def _project_export_documents(projects):
+    """
+    One document per saved search result: the project's fields plus the
+    result as `search_result` (None for a project without results). Results
+    stream from each project's own cursor rather than being gathered into
+    one document.
+    """
+    for project in projects:
+        exported = False
+        results = SearchResult.cursor_for(project['_id'], RESULT_EXPORT_PROJECTION).batch_size(EXPORT_BATCH_SIZE)
+        for result in results:
+            exported = True
+            yield dict(project, search_result=result)
+        if not exported:
+            yield dict(project, search_result=None)
+
+
+def _project_export_rows(documents):
+    for document in documents:
+        result = document['search_result'] or {}
+        yield {
+            'project_id': str(document['_id']),
+            'project_title': document.get('title'),
+            'education_level': document.get('education_level'),
+            'result_title': result.get('title'),
+            'result_author': result.get('author'),
+            'result_year': result.get('year'),
+            'result_url': result.get('url'),
+        }
+
+
+@research_assistant.route('/export')
+def export_projects():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported export format: {fmt}'}), 400
+
+    # Results come from search_results, not any embedded array left from before the migration
+    projects = current_app.db.research_projects.find({}, {'search_results': 0}) \
+        .sort('_id', 1).batch_size(PROJECT_EXPORT_BATCH_SIZE)
+    documents = _project_export_documents(projects)
+    if fmt == 'csv':
+        return stream_export(fmt, 'research_projects', rows=_project_export_rows(documents),
+                             fieldnames=PROJECT_EXPORT_FIELDS)
+    return stream_export(fmt, 'research_projects', documents=documents)
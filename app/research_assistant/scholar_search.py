@@ -1,32 +1,249 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
 from scholarly import scholarly, ProxyGenerator
+from .models import ScholarCache, SearchBatch, SearchResult
+
+# How often a worker waiting on another worker's fetch checks the cache
+FETCH_POLL_SECONDS = 0.2
+MAX_BATCH_QUERIES = 20
+
+_executor = None
+_executor_key = None
+_fetch_slots = None
+_fetch_slots_key = None
+_pool_lock = threading.Lock()
+
+_proxy_lock = threading.Lock()
+_proxy_pid = None
+proxy_ready = threading.Event()
+# Proxy setup runs in its own thread, outside any app context
+logger = logging.getLogger(__name__)
+
 
 def initialize_proxy():
     pg = ProxyGenerator()
     pg.FreeProxies()
     success = scholarly.use_proxy(pg)
     if not success:
-        print("Failed to initialize proxy. Searches may be limited.")
+        logger.warning("Failed to initialize proxy. Searches may be limited.")
     return success
 
-def search_google_scholar(query, num_results=10):
-    if not hasattr(search_google_scholar, "proxy_initialized"):
-        search_google_scholar.proxy_initialized = initialize_proxy()
 
+def _setup_proxy():
+    try:
+        initialize_proxy()
+    except Exception:
+        logger.exception("An error occurred while setting up the proxy")
+    finally:
+        proxy_ready.set()
+
+
+def start_proxy_setup():
+    """
+    Look for free proxies in a background thread, once per process, so no
+    search waits for them. Searches made before they are found go direct.
+    """
+    global _proxy_pid
+    with _proxy_lock:
+        # Threads don't survive a fork, so a forked worker starts its own
+        if _proxy_pid == os.getpid():
+            return
+        _proxy_pid = os.getpid()
+        proxy_ready.clear()
+    threading.Thread(target=_setup_proxy, name='scholar-proxy-setup', daemon=True).start()
+
+
+class FakeScholarBackend:
+    """
+    Offline stand-in for scholarly. Each search waits `latency` seconds,
+    like a slow proxied request, then yields made-up publications for the
+    query. Counts searches so coalescing can be checked.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def search_pubs(self, query):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        for index in itertools.count(1):
+            yield {
+                'bib': {'title': f"{query.title()}: Study {index}", 'author': [f"Author {index}"],
+                        'pub_year': str(1950 + index)},
+                'pub_url': f"https://scholar.example.org/{'-'.join(query.lower().split())}/{index}",
+            }
+
+
+def get_scholar_backend():
+    if current_app.config['SCHOLAR_BACKEND'] == 'fake':
+        return FakeScholarBackend(current_app.config['SCHOLAR_FAKE_LATENCY'])
+    return scholarly
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time in this process; callers that arrive
+    while it is running wait for it and share its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_in_flight = SingleFlight()
+
+
+def _fetch(backend, query, num_results):
+    """
+    Query Scholar. Returns (results, complete); on an error the results
+    found so far are returned and `complete` is False.
+    """
     results = []
     try:
-        search_query = scholarly.search_pubs(query)
-        for i in range(num_results):
-            try:
-                publication = next(search_query)
-                results.append({
-                    'title': publication['bib'].get('title', 'N/A'),
-                    'author': publication['bib'].get('author', 'N/A'),
-                    'year': publication['bib'].get('pub_year', 'N/A'),
-                    'url': publication.get('pub_url', 'N/A')
-                })
-            except StopIteration:
-                break
+        for publication in itertools.islice(backend.search_pubs(query), num_results):
+            results.append({
+                'title': publication['bib'].get('title', 'N/A'),
+                'author': publication['bib'].get('author', 'N/A'),
+                'year': publication['bib'].get('pub_year', 'N/A'),
+                'url': publication.get('pub_url', 'N/A')
+            })
     except Exception as e:
         print(f"An error occurred while searching: {str(e)}")
+        return results, False
+    return results, True
+
+
+def _get_fetch_slots(limit):
+    global _fetch_slots, _fetch_slots_key
+    with _pool_lock:
+        if _fetch_slots_key != (os.getpid(), limit):
+            _fetch_slots = threading.BoundedSemaphore(limit)
+            _fetch_slots_key = (os.getpid(), limit)
+        return _fetch_slots
+
+
+def _fetch_shared(key, query, num_results, backend):
+    lease_seconds = current_app.config['SCHOLAR_FETCH_LEASE_SECONDS']
+    # Another worker is fetching this query: wait for its results, or take
+    # over once it releases the lease or the lease runs out
+    while not ScholarCache.claim_fetch(key, lease_seconds):
+        time.sleep(FETCH_POLL_SECONDS)
+        results = ScholarCache.get(key, count=False)
+        if results is not None:
+            return results
+    try:
+        # Results may have landed between the cache miss and the claim
+        results = ScholarCache.get(key, count=False)
+        if results is None:
+            # A process searches through one proxy session, so cap what it sends at once
+            with _get_fetch_slots(current_app.config['SCHOLAR_MAX_CONCURRENT_FETCHES']):
+                results, complete = _fetch(backend, query, num_results)
+            if complete:
+                ScholarCache.put(key, query, results, current_app.config['SCHOLAR_CACHE_TTL_SECONDS'])
+        return results
+    finally:
+        ScholarCache.release_fetch(key)
+
+
+def search_google_scholar(query, num_results=10, backend=None):
+    """
+    Search Google Scholar through the shared cache. Identical searches
+    running at the same time, in this process or another worker, share one
+    upstream request. Failed searches aren't cached.
+    """
+    key = ScholarCache.key(query, num_results)
+    results = ScholarCache.get(key)
+    if results is not None:
+        return results
+    backend = backend or get_scholar_backend()
+    return _in_flight.do(key, lambda: _fetch_shared(key, query, num_results, backend))
+
+
+def parse_batch_queries(text):
+    """
+    One query per non-blank line, without repeats (ignoring case and
+    spacing), at most MAX_BATCH_QUERIES.
+    """
+    queries = {}
+    for line in (text or '').splitlines():
+        query = ' '.join(line.split())
+        if query:
+            queries.setdefault(query.lower(), query)
+    return list(queries.values())[:MAX_BATCH_QUERIES]
+
+
+def _get_executor(pool_size):
+    global _executor, _executor_key
+    with _pool_lock:
+        # A forked worker can't use its parent's threads, so it gets its own pool
+        if _executor_key != (os.getpid(), pool_size):
+            if _executor is not None and _executor_key[0] == os.getpid():
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='scholar-search')
+            _executor_key = (os.getpid(), pool_size)
+        return _executor
+
+
+def _run_batch_query(app, batch_id, project_id, index, query):
+    with app.app_context():
+        SearchBatch.start_query(batch_id, index, app.config['SCHOLAR_BATCH_QUERY_TIMEOUT_SECONDS'])
+        try:
+            results = search_google_scholar(query)
+            added = SearchResult.add_many(project_id, results, query=query)
+        except Exception as e:
+            app.logger.error(f"Error running batch search {query!r}: {str(e)}")
+            SearchBatch.fail_query(batch_id, index, str(e))
+            return
+        SearchBatch.finish_query(batch_id, index, len(results), added)
+
 
-    return results
\ No newline at end of file
+def start_batch_search(project_id, queries):
+    """
+    Run `queries` concurrently on the process's search pool, saving each
+    query's results to the project as soon as it finishes. Returns the
+    batch id to poll with SearchBatch.get.
+    """
+    batch_id = SearchBatch.create(project_id, queries, current_app.config['SCHOLAR_BATCH_QUERY_TIMEOUT_SECONDS'])
+    app = current_app._get_current_object()
+    executor = _get_executor(app.config['SCHOLAR_BATCH_WORKERS'])
+    for index, query in enumerate(queries):
+        executor.submit(_run_batch_query, app, batch_id, project_id, index, query)
+    return batch_id
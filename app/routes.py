@@ -1,5 +1,7 @@
-from flask import render_template, Blueprint
+import os
+from flask import render_template, Blueprint, jsonify
 from datetime import datetime
+from .model_cache import model_cache_stats
 
 main = Blueprint('main', __name__)
 
@@ -7,6 +9,11 @@ main = Blueprint('main', __name__)
 def home():
     return render_template('home.html')
 
+@main.route('/model-cache/stats')
+def model_cache_stats_view():
+    # Counters are per process; each web worker reports its own
+    return jsonify({'pid': os.getpid(), 'caches': model_cache_stats()})
+
 @main.context_processor
 def inject_year():
     return {'current_year': datetime.now().year}
\ No newline at end of file
@@ -11,6 +11,10 @@ document.addEventListener('DOMContentLoaded', function() {
         const extractedText = section.querySelector('.extracted-text');
         const analysisResult = section.querySelector('.analysis-result');
 
+        if (extractedText && extractedText.dataset.pagesUrl) {
+            initPageLoading(section, extractedText);
+        }
+
         if (analyzeButton && extractedText && analysisResult) {
             console.log(`Analysis section ${index + 1} has all required elements`);
             analyzeButton.addEventListener('click', function() {
@@ -33,9 +37,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Show loading indicator
                 analysisResult.innerHTML = 'Analyzing...';
 
-                // Make AJAX request to the server
-                console.log('Sending analysis request to server');
-                fetch(`/research-assistant/project/${getProjectId()}/analyze`, {
+                // Stream the analysis so text shows up as soon as the model starts writing
+                console.log('Sending streaming analysis request to server');
+                fetch(`/research-assistant/project/${getProjectId()}/analyze/stream`, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -52,19 +56,24 @@ document.addEventListener('DOMContentLoaded', function() {
                         if (!response.ok) {
                             throw new Error('Network response was not ok');
                         }
-                        return response.json();
-                    })
-                    .then(data => {
-                        console.log('Analysis data received:', data);
-                        // Update the analysis result on the page
-                        analysisResult.innerHTML = `
-                        <h3>Summary:</h3>
-                        <p>${data.summary}</p>
-                        <h3>Research Topics:</h3>
-                        <ul>
-                            ${data.research_topics.map(topic => `<li>${topic}</li>`).join('')}
-                        </ul>
-                    `;
+                        const streamedText = document.createElement('p');
+                        streamedText.style.whiteSpace = 'pre-wrap';
+                        return readEventStream(response, {
+                            token: data => {
+                                if (!streamedText.isConnected) {
+                                    analysisResult.innerHTML = '';
+                                    analysisResult.appendChild(streamedText);
+                                }
+                                streamedText.textContent += data.text;
+                            },
+                            done: data => {
+                                console.log('Analysis data received:', data);
+                                renderAnalysis(analysisResult, data);
+                            },
+                            error: data => {
+                                throw new Error(data.error);
+                            }
+                        });
                     })
                     .catch(error => {
                         console.error('Error:', error);
@@ -77,6 +86,104 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+function renderAnalysis(analysisResult, data) {
+    // Update the analysis result on the page
+    analysisResult.innerHTML = `
+        <h3>Summary:</h3>
+        <p>${data.summary}</p>
+        <h3>Research Topics:</h3>
+        <ul>
+            ${data.research_topics.map(topic => `<li>${topic}</li>`).join('')}
+        </ul>
+    `;
+}
+
+function readEventStream(response, handlers) {
+    // Parse a text/event-stream body, calling handlers[event](data) for each event
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    function dispatch(block) {
+        let event = 'message';
+        const data = [];
+        block.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data.push(line.slice(5).trim());
+            }
+        });
+        if (data.length && handlers[event]) {
+            handlers[event](JSON.parse(data.join('\n')));
+        }
+    }
+
+    function read() {
+        return reader.read().then(({ done, value }) => {
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+            const blocks = buffer.split('\n\n');
+            buffer = blocks.pop();
+            blocks.forEach(dispatch);
+            if (done) {
+                if (buffer.trim()) {
+                    dispatch(buffer);
+                }
+                return;
+            }
+            return read();
+        });
+    }
+
+    return read();
+}
+
+const PAGES_PER_REQUEST = 10;
+const PAGE_POLL_MS = 2000;
+
+function initPageLoading(section, extractedText) {
+    // Pages are fetched a range at a time so large finding aids don't load all at once
+    const loadButton = section.querySelector('.load-pages-button');
+    let nextStart = 0;
+
+    function loadPages() {
+        loadButton.disabled = true;
+        fetch(`${extractedText.dataset.pagesUrl}?start=${nextStart}&limit=${PAGES_PER_REQUEST}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Network response was not ok');
+                }
+                return response.json();
+            })
+            .then(data => {
+                data.pages.forEach(page => {
+                    const pageElement = document.createElement('div');
+                    pageElement.className = 'extracted-page';
+                    pageElement.dataset.pageNo = page.page_no;
+                    pageElement.textContent = page.text;
+                    extractedText.appendChild(pageElement);
+                });
+                nextStart = data.next_start;
+                if (nextStart !== null && data.status !== 'done' && data.pages.length < PAGES_PER_REQUEST) {
+                    // The rest of this range is still being extracted; ask again shortly
+                    loadButton.hidden = true;
+                    setTimeout(loadPages, PAGE_POLL_MS);
+                    return;
+                }
+                loadButton.hidden = nextStart === null;
+                loadButton.disabled = false;
+            })
+            .catch(error => {
+                console.error('Error loading pages:', error);
+                loadButton.hidden = false;
+                loadButton.disabled = false;
+            });
+    }
+
+    loadButton.addEventListener('click', loadPages);
+    loadPages();
+}
+
 function getProjectId() {
     // Extract project ID from the current URL
     const pathParts = window.location.pathname.split('/');
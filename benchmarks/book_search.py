@@ -0,0 +1,86 @@
+"""
+Book search latency benchmark.
+
+Seeds a scratch database with synthetic books at increasing sizes and times
+full-text search and prefix autocomplete at each size. With the text and
+prefix indexes in place the per-query latency should stay roughly flat as
+the collection grows. Queries are chosen to match a bounded number of books;
+a text query for a very common word still costs time proportional to the
+number of books containing it.
+
+    MONGO_URI=mongodb://localhost:27017/ python -m benchmarks.book_search --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from pymongo import MongoClient
+from app.books.models import Book
+from app.books.search import autocomplete_books, ensure_search_indexes, search_books
+
+WORDS = ('river', 'shadow', 'garden', 'empire', 'silent', 'winter', 'glass', 'harbor', 'crimson',
+         'orchard', 'lantern', 'meridian', 'hollow', 'copper', 'tide', 'atlas', 'ember', 'quarry')
+GENRES = ('Fiction', 'History', 'Poetry', 'Science', 'Biography', 'Mystery', 'Travel', 'Philosophy')
+SURNAMES = ('Alvarez', 'Brooks', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Hughes', 'Ito', 'Jones')
+
+
+def synthetic_books(start, count, rng):
+    for i in range(start, start + count):
+        title = ' '.join(rng.choice(WORDS) for _ in range(3)) + f' {i}'
+        yield Book(
+            title=title.title(),
+            author=f"{rng.choice(SURNAMES)} {chr(65 + i % 26)}.",
+            isbn=f"{9780000000000 + i}",
+            published_year=rng.randint(1800, 2024),
+            genre=rng.choice(GENRES)
+        ).to_dict()
+
+
+def seed(collection, target, rng, batch_size=10000):
+    current = collection.estimated_document_count()
+    while current < target:
+        count = min(batch_size, target - current)
+        collection.insert_many(list(synthetic_books(current, count, rng)), ordered=False)
+        current += count
+
+
+def time_queries(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--database', default='library_bench')
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    collection = client[args.database].books
+    collection.drop()
+    ensure_search_indexes(collection)
+    rng = random.Random(42)
+
+    print(f"{'books':>10} {'text p50':>10} {'text p95':>10} {'prefix p50':>11} {'prefix p95':>11}")
+    for size in sorted(args.sizes):
+        seed(collection, size, rng)
+        # Titles end in a unique number, so each text query matches one book and the
+        # timing reflects the index lookup rather than the size of the result set
+        text_queries = [str(rng.randrange(size)) for _ in range(args.queries)]
+        prefixes = [rng.choice(WORDS + SURNAMES)[:3] for _ in range(args.queries)]
+        text_p50, text_p95 = time_queries(lambda q: search_books(collection, q), text_queries)
+        prefix_p50, prefix_p95 = time_queries(lambda q: autocomplete_books(collection, q), prefixes)
+        print(f"{size:>10} {text_p50:>8.2f}ms {text_p95:>8.2f}ms {prefix_p50:>9.2f}ms {prefix_p95:>9.2f}ms")
+
+    client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Chunked finding aid analysis benchmark, run offline against the fake LLM.
+
+Builds a synthetic finding aid of the requested length and analyzes it with
+FakeLLMClient at each concurrency level, reporting wall time, the number of
+LLM calls and the most calls in flight at once. It also checks that the
+chunks cover the whole text in order and that each chunk fits its budget.
+With a fixed per-call latency the map stage should take roughly
+ceil(chunks / concurrency) round trips instead of one per chunk. The
+streamed variant's time to first token is reported alongside, with the
+fake model writing one word every --token-latency seconds.
+
+    python -m benchmarks.finding_aid_analysis --tokens 20000 --latency 0.5 --concurrency 1 4 8
+"""
+import argparse
+import asyncio
+import random
+import time
+from app.finding_aid_analyzer.llm import FakeLLMClient, analyze_text, chunk_text, stream_analysis
+from app.llm_gateway import estimate_tokens
+
+WORDS = ('correspondence', 'ledger', 'photograph', 'minutes', 'survey', 'deed', 'diary', 'map',
+         'plantation', 'railroad', 'harbor', 'church', 'school', 'hurricane', 'citrus', 'cigar')
+NAMES = ('Flagler', 'Tuttle', 'Brickell', 'Merrick', 'Fisher', 'Seminole', 'Coconut Grove', 'Key West')
+
+
+def synthetic_finding_aid(tokens, rng):
+    paragraphs = []
+    while estimate_tokens('\n\n'.join(paragraphs)) < tokens:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+            words.insert(rng.randrange(len(words)), rng.choice(NAMES))
+            words.append(str(rng.randint(1870, 1990)))
+            sentences.append(' '.join(words).capitalize() + '.')
+        paragraphs.append(f"Series {len(paragraphs) + 1}. " + ' '.join(sentences))
+    return '\n\n'.join(paragraphs)
+
+
+def check_chunks(text, chunk_tokens):
+    chunks = chunk_text(text, chunk_tokens)
+    assert ' '.join(chunks).split() == text.split(), "chunks lost or reordered words"
+    assert all(estimate_tokens(chunk) <= chunk_tokens for chunk in chunks), "chunk over budget"
+    return chunks
+
+
+def run(text, chunk_tokens, concurrency, latency, token_latency):
+    client = FakeLLMClient(latency, token_latency)
+    start = time.perf_counter()
+    summary, topics = asyncio.run(analyze_text(client, text, 'undergraduate', chunk_tokens, concurrency))
+    elapsed = time.perf_counter() - start
+    assert summary and topics, "empty analysis"
+    assert client.max_in_flight <= concurrency, "semaphore exceeded"
+    return elapsed, client.calls, client.max_in_flight
+
+
+def time_to_first_token(text, chunk_tokens, concurrency, latency, token_latency):
+    async def first_token():
+        client = FakeLLMClient(latency, token_latency)
+        start = time.perf_counter()
+        first = None
+        async for _ in stream_analysis(client, text, 'undergraduate', chunk_tokens, concurrency):
+            if first is None:
+                first = time.perf_counter() - start
+        return first, time.perf_counter() - start
+
+    return asyncio.run(first_token())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=20000, help='approximate length of the finding aid')
+    parser.add_argument('--chunk-tokens', type=int, default=3000)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per fake LLM call')
+    parser.add_argument('--token-latency', type=float, default=0.02, help='seconds per streamed word')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8])
+    args = parser.parse_args()
+
+    text = synthetic_finding_aid(args.tokens, random.Random(42))
+    chunks = check_chunks(text, args.chunk_tokens)
+    print(f"{estimate_tokens(text)} tokens in {len(chunks)} chunks of <= {args.chunk_tokens} tokens")
+    print(f"{'concurrency':>11} {'seconds':>8} {'calls':>6} {'in flight':>9} {'stream ttft':>11} {'stream total':>12}")
+    for concurrency in args.concurrency:
+        elapsed, calls, in_flight = run(text, args.chunk_tokens, concurrency, args.latency, args.token_latency)
+        first, total = time_to_first_token(text, args.chunk_tokens, concurrency, args.latency, args.token_latency)
+        print(f"{concurrency:>11} {elapsed:>8.2f} {calls:>6} {in_flight:>9} {first:>11.2f} {total:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
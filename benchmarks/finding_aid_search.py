@@ -0,0 +1,107 @@
+"""
+Finding aid page search latency benchmark.
+
+Seeds a scratch database with synthetic extracted pages (100 pages per
+finding aid, 10 finding aids per project) at increasing sizes and times
+search_pages for single terms, quoted phrases and project-scoped searches,
+including snippet highlighting and the filename lookups. Each page mentions
+a few names from a large pool, so a name matches a bounded number of pages
+and the timing reflects the text index rather than the result set size. The
+target is a p95 under 100 ms at tens of thousands of pages.
+
+    MONGO_URI=mongodb://localhost:27017/ python -m benchmarks.finding_aid_search --sizes 10000 50000 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+from pymongo import MongoClient
+from app.finding_aid_analyzer.search import ensure_page_search_index, search_pages
+
+PAGES_PER_FINDING_AID = 100
+FINDING_AIDS_PER_PROJECT = 10
+NAMES_PER_PAGE = 3
+WORDS = ('correspondence', 'ledger', 'photograph', 'minutes', 'survey', 'deed', 'diary', 'map', 'box',
+         'folder', 'series', 'plantation', 'railroad', 'harbor', 'church', 'school', 'hurricane', 'citrus')
+TARGET_P95_MS = 100
+
+
+def name(index):
+    return f"surname{index}"
+
+
+def seed(db, target, rng, name_pool, batch_size=5000):
+    pages = db.finding_aid_pages
+    current = pages.estimated_document_count()
+    batch = []
+    while current < target:
+        finding_aid = db.finding_aids.insert_one({'filename': f"finding-aid-{current // PAGES_PER_FINDING_AID}.pdf"})
+        project = f"project-{current // (PAGES_PER_FINDING_AID * FINDING_AIDS_PER_PROJECT)}"
+        analysis_id = db.analyses.insert_one({'file_id': str(finding_aid.inserted_id),
+                                              'project_ids': [project]}).inserted_id
+        for page_no in range(PAGES_PER_FINDING_AID):
+            words = [rng.choice(WORDS) for _ in range(300)]
+            for _ in range(NAMES_PER_PAGE):
+                # Names appear as "first last" pairs so they can be searched as phrases
+                index = rng.randrange(name_pool)
+                words.insert(rng.randrange(len(words)), f"given{index % 50} {name(index)}")
+            batch.append({'analysis_id': analysis_id, 'page_no': page_no, 'text': ' '.join(words)})
+            if len(batch) >= batch_size:
+                pages.insert_many(batch, ordered=False)
+                batch = []
+        current += PAGES_PER_FINDING_AID
+    if batch:
+        pages.insert_many(batch, ordered=False)
+
+
+def time_queries(fn, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--database', default='finding_aid_search_bench')
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    client.drop_database(args.database)
+    db = client[args.database]
+    ensure_page_search_index(db.finding_aid_pages)
+    rng = random.Random(42)
+
+    print(f"{'pages':>8} {'term p50':>9} {'term p95':>9} {'phrase p50':>11} {'phrase p95':>11} "
+          f"{'project p50':>12} {'project p95':>12}")
+    for size in sorted(args.sizes):
+        # A pool that grows with the collection keeps each name on roughly 30 pages
+        name_pool = max(size * NAMES_PER_PAGE // 30, 1)
+        seed(db, size, rng, name_pool)
+        projects = db.analyses.distinct('project_ids')
+        project_ids = {project: [str(doc['_id']) for doc in db.analyses.find({'project_ids': project}, {'_id': 1})]
+                       for project in projects}
+
+        terms = [name(rng.randrange(name_pool)) for _ in range(args.queries)]
+        phrases = [f'"given{index % 50} {name(index)}"' for index in
+                   (rng.randrange(name_pool) for _ in range(args.queries))]
+        scoped = [(rng.choice(projects), name(rng.randrange(name_pool))) for _ in range(args.queries)]
+
+        term = time_queries(lambda q: search_pages(db, q), terms)
+        phrase = time_queries(lambda q: search_pages(db, q), phrases)
+        project = time_queries(lambda q: search_pages(db, q[1], project_ids[q[0]]), scoped)
+        worst = max(term[1], phrase[1], project[1])
+        print(f"{size:>8} {term[0]:>7.2f}ms {term[1]:>7.2f}ms {phrase[0]:>9.2f}ms {phrase[1]:>9.2f}ms "
+              f"{project[0]:>10.2f}ms {project[1]:>10.2f}ms {'ok' if worst < TARGET_P95_MS else 'OVER TARGET'}")
+
+    client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Image rendition benchmark.
+
+Renders every size offered by ImageUploadForm from one synthetic photo, first
+the old way (re-open and LANCZOS-resize the full original for every size)
+and then with decode_image/render_renditions, and finally through
+save_renditions on a process pool. Reports wall time for each and the PSNR
+of every new rendition against the old one; anything above ~35 dB is
+visually indistinguishable.
+
+    python -m benchmarks.image_renditions --width 8000 --height 6000 --pool-size 8
+"""
+import argparse
+import io
+import math
+import os
+import tempfile
+import time
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+from app.image_processor.forms import SIZE_CHOICES
+from app.image_processor.renditions import decode_image, parse_sizes, render_renditions, save_renditions
+
+
+def synthetic_photo(width, height):
+    """A JPEG with gradients, edges and noise so resampling differences show up."""
+    img = Image.radial_gradient('L').resize((width, height)).convert('RGB')
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    img = Image.blend(img, noise, 0.35)
+    draw = ImageDraw.Draw(img)
+    step = max(width, height) // 40
+    for offset in range(0, width + height, step):
+        draw.line([(offset, 0), (offset - height, height)], fill=(200, 60, 40), width=max(2, step // 8))
+    img = img.filter(ImageFilter.SMOOTH)
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def psnr(a, b):
+    diff = ImageChops.difference(a.convert('RGB'), b.convert('RGB'))
+    mse = sum(v ** 2 for v in ImageStat.Stat(diff).rms) / 3
+    return float('inf') if mse == 0 else 20 * math.log10(255 / math.sqrt(mse))
+
+
+def encode(img):
+    img.save(io.BytesIO(), 'WEBP')
+
+
+def legacy(data, sizes):
+    renditions = {}
+    for size in sizes:
+        width, height = map(int, size.split('x'))
+        img = Image.open(io.BytesIO(data))
+        img = img.resize((width, height), Image.LANCZOS)
+        encode(img)
+        renditions[(width, height)] = img
+    return renditions
+
+
+def pyramid(data, sizes):
+    targets = parse_sizes(sizes)
+    renditions = {}
+    for target, img in render_renditions(decode_image(io.BytesIO(data), targets), targets):
+        encode(img)
+        renditions[target] = img
+    return renditions
+
+
+def pooled(data, sizes, pool_size):
+    targets = parse_sizes(sizes)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {(w, h): os.path.join(directory, f"{w}x{h}.webp") for w, h in targets}
+        save_renditions(decode_image(io.BytesIO(data), targets), targets, paths, pool_size=pool_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=8000)
+    parser.add_argument('--height', type=int, default=6000)
+    parser.add_argument('--pool-size', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    data = synthetic_photo(args.width, args.height)
+    sizes = [value for value, _ in SIZE_CHOICES]
+    print(f"Source: {args.width}x{args.height} JPEG ({len(data) / 1e6:.1f} MB), {len(sizes)} sizes selected")
+
+    started = time.perf_counter()
+    old = legacy(data, sizes)
+    legacy_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    new = pyramid(data, sizes)
+    pyramid_seconds = time.perf_counter() - started
+
+    # Warm the pool so process start-up is not counted against the first job
+    pooled(synthetic_photo(64, 64), ['32x32', '16x16'], args.pool_size)
+    started = time.perf_counter()
+    pooled(data, sizes, args.pool_size)
+    pooled_seconds = time.perf_counter() - started
+
+    scores = sorted(psnr(old[target], new[target]) for target in new)
+    print(f"legacy:  {legacy_seconds:.2f}s")
+    print(f"pyramid: {pyramid_seconds:.2f}s ({legacy_seconds / pyramid_seconds:.1f}x faster, "
+          f"{len(new)} unique renditions)")
+    print(f"pooled:  {pooled_seconds:.2f}s ({legacy_seconds / pooled_seconds:.1f}x faster, "
+          f"{args.pool_size} workers)")
+    print(f"PSNR vs legacy: min {scores[0]:.1f} dB, median {scores[len(scores) // 2]:.1f} dB")
+
+
+if __name__ == '__main__':
+    main()
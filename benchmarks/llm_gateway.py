@@ -0,0 +1,177 @@
+"""
+LLM gateway benchmark against a local mock OpenAI server.
+
+Starts an HTTP server on localhost that answers /v1/chat/completions (plain
+and streamed) after a fixed latency, failing a share of requests with 429 or
+500, then sends a burst of concurrent completions through LLMGateway. It
+reports throughput, how many connections the server saw (one pool should
+reuse a handful), the request rate the server observed against the
+configured limit, and the gateway's own metrics. Rate-limit and metric
+state goes in a scratch database that is dropped afterwards.
+
+    MONGO_URI=mongodb://localhost:27017/ python -m benchmarks.llm_gateway --requests 200 --rpm 120 --fail-rate 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pymongo import MongoClient
+from app.finding_aid_analyzer.llm import OpenAIClient
+from app.llm_gateway import LLMGateway
+
+DATABASE = 'llm_gateway_benchmark'
+
+
+class MockServerState:
+    def __init__(self, latency, fail_rate, seed):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_times = []
+        self.connections = set()
+        self.failures = 0
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            with state.lock:
+                state.request_times.append(time.time())
+                state.connections.add(self.client_address)
+                roll = state.rng.random()
+            time.sleep(state.latency)
+
+            if roll < state.fail_rate / 2:
+                with state.lock:
+                    state.failures += 1
+                return self._send_json(429, {'error': {'message': 'Rate limit reached', 'type': 'requests'}},
+                                       {'retry-after': '0'})
+            if roll < state.fail_rate:
+                with state.lock:
+                    state.failures += 1
+                return self._send_json(500, {'error': {'message': 'Server error', 'type': 'server_error'}})
+
+            prompt = request['messages'][-1]['content']
+            words = prompt.split()[:40]
+            usage = {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(words),
+                     'total_tokens': len(prompt) // 4 + len(words)}
+            if not request.get('stream'):
+                return self._send_json(200, {
+                    'id': 'mock', 'object': 'chat.completion', 'created': int(time.time()), 'model': request['model'],
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': ' '.join(words)}}],
+                    'usage': usage,
+                })
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            chunks = [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None} for word in words]
+            events = [{'choices': [choice], 'usage': None} for choice in chunks]
+            events.append({'choices': [], 'usage': usage})
+            for event in events:
+                event.update({'id': 'mock', 'object': 'chat.completion.chunk',
+                              'created': int(time.time()), 'model': request['model']})
+                self._write_chunk(f"data: {json.dumps(event)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text):
+            data = text.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+
+    return Handler
+
+
+def start_server(state):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def burst(client, count, stream_share, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async def one(index):
+        nonlocal errors
+        async with semaphore:
+            prompt = f"Finding aid selection {index}: " + ' '.join(['correspondence'] * 50)
+            try:
+                if index < count * stream_share:
+                    async for _ in client.stream('Summarize.', prompt, 100):
+                        pass
+                else:
+                    await client.complete('Summarize.', prompt, 100)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(one(index) for index in range(count)))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20, help='calls in flight from the client side')
+    parser.add_argument('--rpm', type=int, default=120, help='gateway requests-per-minute limit')
+    parser.add_argument('--tpm', type=int, default=1000000, help='gateway tokens-per-minute limit')
+    parser.add_argument('--latency', type=float, default=0.05, help='mock server seconds per request')
+    parser.add_argument('--fail-rate', type=float, default=0.1, help='share of requests answered with 429 or 500')
+    parser.add_argument('--stream-share', type=float, default=0.5, help='share of calls that stream')
+    args = parser.parse_args()
+
+    state = MockServerState(args.latency, args.fail_rate, seed=42)
+    server = start_server(state)
+    mongo = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    mongo.drop_database(DATABASE)
+    try:
+        gateway = LLMGateway(mongo[DATABASE], api_key='mock', base_url=f"http://127.0.0.1:{server.server_port}/v1",
+                             requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                             max_attempts=6, backoff_base=0.05, backoff_max=1.0, max_connections=10)
+        client = OpenAIClient(gateway, 'mock-model')
+
+        start = time.perf_counter()
+        errors = gateway.run(burst(client, args.requests, args.stream_share, args.concurrency))
+        elapsed = time.perf_counter() - start
+
+        times = sorted(state.request_times)
+        print(f"{args.requests} calls in {elapsed:.2f}s, {errors} failed after retries")
+        print(f"server saw {len(times)} requests ({state.failures} answered 429/500) "
+              f"on {len(state.connections)} connections")
+        # The bucket starts full, so only requests after the first bucketful show the sustained rate
+        sustained = times[args.rpm:]
+        if len(sustained) > 1:
+            rate = (len(sustained) - 1) / (sustained[-1] - sustained[0]) * 60
+            print(f"sustained {rate:.0f} requests/minute after the initial burst, against a limit of {args.rpm}")
+        for model, stats in gateway.metrics.summary(60).items():
+            print(f"{model}: {json.dumps(stats, sort_keys=True)}")
+    finally:
+        server.shutdown()
+        mongo.drop_database(DATABASE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Project detail page query-count benchmark.
+
+Seeds a scratch database with projects holding increasing numbers of finding
+aids (each with an analysis), then loads each project's detail both the old
+way (the project and its finding aids, then one analysis lookup per finding
+aid) and with ResearchProject.get_detail, each followed by a page of search
+results. A pymongo command listener counts the commands each load sends.
+The get_detail load's count must not change with the number of finding
+aids; the script exits non-zero if it does.
+
+    MONGO_URI=mongodb://localhost:27017/ python -m benchmarks.project_detail --sizes 1 10 100
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+from bson import ObjectId
+from flask import Flask, current_app
+from pymongo import MongoClient, monitoring
+from app.finding_aid_analyzer.models import FindingAidAnalysis
+from app.research_assistant.models import ResearchProject, SearchResult
+
+DATABASE = 'project_detail_benchmark'
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        if event.database_name == DATABASE:
+            self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def seed(db, finding_aid_count):
+    finding_aids = db.finding_aids.insert_many(
+        [{'filename': f"finding-aid-{index}.pdf"} for index in range(finding_aid_count)]).inserted_ids
+    project_id = db.research_projects.insert_one({
+        'title': f"Project with {finding_aid_count} finding aids",
+        'description': 'Benchmark project',
+        'education_level': 'undergraduate',
+        'finding_aid_ids': [str(file_id) for file_id in finding_aids],
+    }).inserted_id
+    SearchResult.add_many(project_id, [{'title': f"Result {index}", 'author': '', 'year': '', 'url': ''}
+                                       for index in range(10)])
+    db.analyses.insert_many([{
+        'file_id': str(file_id),
+        'summary': 'Summary',
+        'research_topics': ['Topic'],
+        'education_level': 'undergraduate',
+        'project_ids': [str(project_id)],
+        'extraction_status': 'complete',
+        'created_at': datetime.utcnow(),
+    } for file_id in finding_aids])
+    return str(project_id)
+
+
+def load_separately(project_id):
+    project = ResearchProject.get_by_id(project_id)
+    # The project page's queries before get_detail: the project again, then its finding aids
+    stored = current_app.db.research_projects.find_one({'_id': ObjectId(project_id)})
+    finding_aid_ids = [ObjectId(fid) for fid in stored.get('finding_aid_ids', [])]
+    finding_aids = list(current_app.db.finding_aids.find({'_id': {'$in': finding_aid_ids}}))
+    for finding_aid in finding_aids:
+        finding_aid['analysis'] = FindingAidAnalysis.get_by_file_id(finding_aid['_id'])
+    return project, finding_aids, SearchResult.get_page(project_id)
+
+
+def load_detail(project_id):
+    return ResearchProject.get_detail(project_id), SearchResult.get_page(project_id)
+
+
+def measure(counter, load, project_id, repeats):
+    # The first load also creates indexes, so count commands on a warm one
+    load(project_id)
+    counter.commands.clear()
+    load(project_id)
+    commands = len(counter.commands)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        load(project_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    return commands, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    counter = CommandCounter()
+    client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'), event_listeners=[counter])
+    client.drop_database(DATABASE)
+    app = Flask(__name__)
+    app.db = client[DATABASE]
+    # Count the lookups themselves, not the model cache
+    app.config.update(MODEL_CACHE_MAX_ENTRIES=1000, MODEL_CACHE_TTL_SECONDS=0)
+
+    counts = []
+    print(f"{'finding aids':>12} {'separate cmds':>14} {'separate p50':>13} {'detail cmds':>12} {'detail p50':>11}")
+    try:
+        with app.app_context():
+            for size in args.sizes:
+                project_id = seed(app.db, size)
+                separate, separate_ms = measure(counter, load_separately, project_id, args.repeats)
+                detail, detail_ms = measure(counter, load_detail, project_id, args.repeats)
+                counts.append(detail)
+                print(f"{size:>12} {separate:>14} {separate_ms:>11.2f}ms {detail:>12} {detail_ms:>9.2f}ms")
+    finally:
+        client.drop_database(DATABASE)
+
+    if len(set(counts)) != 1:
+        print(f"project detail command count varies with project size: {counts}")
+        sys.exit(1)
+    print(f"project detail sends {counts[0]} command(s) regardless of project size")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Google Scholar search cache benchmark against a fake scholarly backend.
+
+Sends bursts of concurrent searches through search_google_scholar with a
+FakeScholarBackend that takes `--latency` seconds per search, like a slow
+proxied request. Threads are split across `--workers` processes standing
+in for web workers, each with its own in-process coalescing, so only the
+Mongo fetch lease joins them. For a cold burst of one query it reports how
+many upstream searches were made (one is the target) against the same
+burst sent straight to the backend, then the latency of cache hits and of
+a burst of distinct queries. Cache state goes in a scratch database that is
+dropped afterwards.
+
+    MONGO_URI=mongodb://localhost:27017/ python -m benchmarks.scholar_search --concurrency 50 --workers 4 --latency 2
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from flask import Flask
+from pymongo import MongoClient
+from app.research_assistant import scholar_search
+from app.research_assistant.scholar_search import FakeScholarBackend, search_google_scholar
+
+DATABASE = 'scholar_search_benchmark'
+
+
+def _make_app():
+    app = Flask(__name__)
+    app.db = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))[DATABASE]
+    app.config.update(SCHOLAR_CACHE_TTL_SECONDS=3600, SCHOLAR_FETCH_LEASE_SECONDS=60,
+                      SCHOLAR_MAX_CONCURRENT_FETCHES=4)
+    return app
+
+
+def _uncached(query, backend):
+    return scholar_search._fetch(backend, query, 10)
+
+
+def _worker(queries, latency, start_at, cached):
+    """
+    One simulated web worker: search every query on its own thread, all
+    starting at `start_at`. Returns (upstream calls, latencies in ms).
+    """
+    app = _make_app()
+    backend = FakeScholarBackend(latency)
+    search = search_google_scholar if cached else _uncached
+    latencies = []
+    lock = threading.Lock()
+
+    def one(query):
+        with app.app_context():
+            time.sleep(max(0.0, start_at - time.time()))
+            started = time.perf_counter()
+            search(query, backend=backend)
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=one, args=(query,)) for query in queries]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return backend.calls, latencies
+
+
+def burst(pool, workers, queries, latency, cached=True):
+    """
+    Send every query at once, spread over the worker processes. Returns
+    (seconds, upstream calls, sorted latencies in ms).
+    """
+    # Leave time for the processes to pick up their share before the start
+    start_at = time.time() + 1.0
+    shares = [queries[index::workers] for index in range(workers)]
+    results = pool.starmap(_worker, [(share, latency, start_at, cached) for share in shares])
+    seconds = time.time() - start_at
+    latencies = sorted(ms for _, share in results for ms in share)
+    return seconds, sum(calls for calls, _ in results), latencies
+
+
+def percentiles(latencies):
+    return statistics.median(latencies), latencies[max(int(len(latencies) * 0.95) - 1, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=50, help='searches sent at once')
+    parser.add_argument('--workers', type=int, default=4, help='simulated web worker processes')
+    parser.add_argument('--latency', type=float, default=2.0, help='fake backend seconds per search')
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017/'))
+    client.drop_database(DATABASE)
+
+    # Spawned so each worker, like a web worker, has its own in-process coalescing
+    with multiprocessing.get_context('spawn').Pool(args.workers) as pool:
+        try:
+            query = 'everglades drainage history'
+            seconds, calls, _ = burst(pool, args.workers, [query] * args.concurrency, args.latency, cached=False)
+            print(f"uncached burst: {args.concurrency} searches, {calls} upstream calls, {seconds:.2f}s")
+
+            # Vary case and spacing: they normalize to the same cache key
+            variants = [query, query.upper(), f"  {query}  ", query.title()]
+            queries = [variants[index % len(variants)] for index in range(args.concurrency)]
+            seconds, calls, _ = burst(pool, args.workers, queries, args.latency)
+            print(f"cold burst:     {args.concurrency} searches, {calls} upstream calls, {seconds:.2f}s "
+                  f"{'ok' if calls == 1 else 'NOT COALESCED'}")
+
+            seconds, calls, latencies = burst(pool, args.workers, [query] * args.concurrency, args.latency)
+            p50, p95 = percentiles(latencies)
+            print(f"warm burst:     {args.concurrency} searches, {calls} upstream calls, "
+                  f"p50 {p50:.2f}ms p95 {p95:.2f}ms")
+
+            distinct = [f"{query} {index}" for index in range(args.concurrency)]
+            seconds, calls, _ = burst(pool, args.workers, distinct, args.latency)
+            print(f"distinct burst: {args.concurrency} searches, {calls} upstream calls, {seconds:.2f}s")
+        finally:
+            client.drop_database(DATABASE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# gunicorn.conf.py: production serving, used by `gunicorn run:app`
+# Imported under another name: gunicorn reads every module-level name as a setting
+from app.config import config as app_config
+
+bind = app_config["gunicorn_bind"]
+# Threaded workers: LLM streams and Scholar searches spend most of their time waiting on I/O
+worker_class = "gthread"
+workers = app_config["gunicorn_workers"]
+threads = app_config["gunicorn_threads"]
+timeout = app_config["gunicorn_timeout"]
+graceful_timeout = app_config["gunicorn_graceful_timeout"]
+keepalive = app_config["gunicorn_keepalive"]
+# Recycle workers now and then so slow leaks don't build up; jitter keeps them from restarting together
+max_requests = app_config["gunicorn_max_requests"]
+max_requests_jitter = max(app_config["gunicorn_max_requests"] // 10, 1)
+# Import the app once in the master and fork it; each worker then opens its own connections
+preload_app = True
+accesslog = "-"
+
+
+def post_worker_init(worker):
+    from app import init_worker
+    init_worker(worker.wsgi)
@@ -1,6 +1,11 @@
-from app import create_app
+import os
+from app import create_app, init_worker
 
 app = create_app()
 
+# Development server only; production runs `gunicorn run:app` with gunicorn.conf.py
 if __name__ == '__main__':
+    # With the reloader, only the child process serves requests; the parent just watches files
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_worker(app)
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
@@ -0,0 +1,340 @@
+"""
+Query plan tests: no model query may fall back to a collection scan.
+
+Creates the app against a scratch database and applies the index registry
+(app/indexes.py). Each test runs one blueprint's workload through its
+models and a few routes while a pymongo command listener records every
+read and write sent. Each recorded command is then explained (writes one
+statement at a time, with executionStats so $lookup stages report how they
+read the joined collection) and its winning plan searched for COLLSCAN.
+Scans listed in EXPECTED_SCANS, which read a whole collection on purpose,
+are allowed. Any other scan fails the test, so a new query needs an index
+registered next to its model. Skipped unless MONGO_URI is set.
+
+    MONGO_URI=mongodb://localhost:27017/ python -m pytest tests/test_query_plans.py
+"""
+import os
+from contextlib import contextmanager
+from copy import deepcopy
+from datetime import datetime
+import pytest
+
+if not os.environ.get('MONGO_URI'):
+    pytest.skip('needs a MongoDB server; set MONGO_URI', allow_module_level=True)
+
+DATABASE = 'query_plans_check'
+# The app reads its database name from the environment when it is imported
+os.environ['MONGO_DB'] = DATABASE
+os.environ.setdefault('SCHOLAR_BACKEND', 'fake')
+os.environ.setdefault('FAA_LLM_CLIENT', 'fake')
+os.environ.setdefault('SCHOLAR_FREE_PROXIES', 'false')
+
+from bson import ObjectId
+from pymongo import monitoring
+from app import create_app
+from app.books.facets import rebuild_facets, record_change, top_facets
+from app.books.importer import import_books
+from app.books.pagination import encode_cursor, fetch_page
+from app.books.search import autocomplete_books, backfill_normalized_fields, search_books
+from app.finding_aid_analyzer.models import AnalysisCache, FindingAid, FindingAidAnalysis, FindingAidPage
+from app.finding_aid_analyzer.search import project_analysis_ids, search_pages
+from app.image_processor.models import ImageJob, RenditionCache, SourceImage
+from app.indexes import apply_indexes
+from app.llm_gateway import LLMMetrics, TokenBucket
+from app.research_assistant.models import ResearchProject, ScholarCache, SearchBatch, SearchResult
+
+EXPLAINED_COMMANDS = ('find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify')
+# Driver and session fields explain doesn't take
+STRIPPED_FIELDS = ('lsid', '$db', '$clusterTime', 'txnNumber', '$readPreference', 'readConcern', 'writeConcern',
+                   'apiVersion', 'apiStrict', 'apiDeprecationErrors')
+# (workload, collection, command) -> why reading the whole collection is fine
+EXPECTED_SCANS = {
+    ('books.backfill', 'books', 'find'): 'one-off backfill of books missing normalized fields',
+    ('books.rebuild_facets', 'books', 'aggregate'): 'recounts facets over every book',
+    ('finding_aids.migrate', 'analyses', 'find'): 'one-off migration of analyses with embedded pages',
+    ('research.migrate', 'research_projects', 'find'): 'one-off migration of projects with embedded results',
+    ('images.evict', 'renditions', 'aggregate'): 'starts the running rendition byte total, once per database',
+}
+
+
+class CommandRecorder(monitoring.CommandListener):
+    """
+    Keeps a copy of each explainable command sent to DATABASE, tagged with
+    the workload running when it was sent.
+    """
+
+    def __init__(self):
+        self.workload = None
+        self.commands = []
+
+    def started(self, event):
+        if self.workload and event.database_name == DATABASE and event.command_name in EXPLAINED_COMMANDS:
+            self.commands.append((self.workload, event.command_name, deepcopy(dict(event.command))))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+recorder = CommandRecorder()
+# Registered before the app creates its client, which picks it up
+monitoring.register(recorder)
+
+
+@contextmanager
+def workload(name):
+    recorder.workload = name
+    try:
+        yield
+    finally:
+        recorder.workload = None
+
+
+def run_books(app, client):
+    db = app.db
+    records = [{'title': f"Book {index}", 'author': f"Author {index % 7}", 'isbn': f"978{index:010d}",
+                'published_year': 1900 + index, 'genre': ('History', 'Poetry', 'Science')[index % 3]}
+               for index in range(60)]
+    with workload('books.import'):
+        import_books(db.books, records, batch_size=25, facets=db.book_facets)
+        import_books(db.books, records[:10], facets=db.book_facets)
+    with workload('books.listing'):
+        for sort in ('_id', 'title', 'author', 'published_year'):
+            for order in ('asc', 'desc'):
+                page = client.get(f'/books/?sort={sort}&order={order}&limit=10')
+                assert page.status_code == 200, page.status_code
+        first = db.books.find_one(sort=[('title', 1)])
+        for sort in ('title', 'published_year'):
+            fetch_page(db.books, sort_field=sort, after=encode_cursor(first, sort), limit=10)
+            fetch_page(db.books, sort_field=sort, before=encode_cursor(first, sort), limit=10)
+    with workload('books.search'):
+        search_books(db.books, 'history')
+        autocomplete_books(db.books, 'boo')
+        autocomplete_books(db.books, 'auth')
+        assert client.get('/books/api/search?q=poetry').status_code == 200
+    with workload('books.facets'):
+        top_facets(db.book_facets)
+    with workload('books.edit'):
+        book = db.books.find_one({'isbn': records[0]['isbn']})
+        edited = dict(records[0], title='Book Zero', published_year=1999)
+        response = client.post(f"/books/edit/{book['_id']}", data=edited)
+        assert response.status_code in (200, 302), response.status_code
+        client.post(f"/books/delete/{book['_id']}")
+        record_change(db.book_facets, after={'genre': 'Drama', 'published_year': 2001, 'author': 'Someone'})
+    with workload('books.export'):
+        assert client.get('/books/export?format=ndjson').get_data()
+    with workload('books.backfill'):
+        backfill_normalized_fields(db.books)
+    with workload('books.rebuild_facets'):
+        rebuild_facets(db.books, db.book_facets)
+
+
+def run_finding_aids(app, client):
+    db = app.db
+    project_id = ResearchProject.create('Plans project', 'For query plans', 'undergraduate')
+    with workload('finding_aids.upload'):
+        finding_aid, _ = FindingAid.create('plans.pdf', '/tmp/plans.pdf', 'a' * 64)
+        FindingAid.get_by_hash('a' * 64)
+        file_id = str(finding_aid['_id'])
+        analysis_id = FindingAidAnalysis.create(file_id, 'undergraduate', project_id)
+        ResearchProject.add_finding_aid(project_id, file_id)
+    with workload('finding_aids.extraction'):
+        claimed = FindingAidAnalysis.claim_extraction('plans-worker', 60, 3)
+        assert claimed and str(claimed['_id']) == analysis_id
+        FindingAidAnalysis.start_extraction(analysis_id, 3, 'plans-worker')
+        FindingAidAnalysis.save_extracted_pages(analysis_id, 0, ['Everglades drainage survey',
+                                                                 'Letters about the canal', 'Maps'], 60, 'plans-worker')
+        FindingAidAnalysis.fail_extraction(db.analyses.find_one({'_id': ObjectId(analysis_id)}), 'test', 3, 1)
+        db.analyses.update_one({'_id': ObjectId(analysis_id)}, {'$set': {'extraction_available_at': datetime.utcnow()}})
+        FindingAidAnalysis.claim_extraction('plans-worker', 60, 3)
+        FindingAidAnalysis.finish_extraction(analysis_id, 'plans-worker')
+    with workload('finding_aids.read'):
+        FindingAidAnalysis.get_progress(analysis_id)
+        FindingAidAnalysis.get_by_id(analysis_id)
+        FindingAidAnalysis.get_by_file_id(file_id)
+        FindingAidAnalysis.get_by_project(project_id)
+        FindingAidPage.get_range(analysis_id, 0, 10)
+        assert client.get(f'/finding-aid-analyzer/analysis/{analysis_id}/pages').status_code == 200
+    with workload('finding_aids.search'):
+        search_pages(db, 'drainage')
+        search_pages(db, 'canal', project_analysis_ids(db, project_id))
+    with workload('finding_aids.edit'):
+        FindingAidAnalysis.update_analysis(analysis_id, 'Summary', ['Topic'])
+        other_project = ResearchProject.create('Other project', 'For query plans', 'graduate')
+        FindingAidAnalysis.add_to_project(analysis_id, other_project)
+        FindingAidAnalysis.remove_from_project(analysis_id, other_project)
+    with workload('finding_aids.llm_cache'):
+        key = AnalysisCache.key('Some selected text', 'undergraduate', 'model', 1)
+        AnalysisCache.get(key)
+        AnalysisCache.put(key, 'Summary', ['Topic'], 'model', 1, 3600, max_entries=1)
+        AnalysisCache.put(AnalysisCache.key('Other text', 'undergraduate', 'model', 1), 'Summary', ['Topic'],
+                          'model', 1, 3600, max_entries=1)
+        AnalysisCache.stats()
+    with workload('finding_aids.llm_gateway'):
+        bucket = TokenBucket(db.llm_buckets, 'plans:requests', 60)
+        bucket.try_take(1)
+        bucket.try_take(1)
+        bucket.give_back(1)
+        metrics = LLMMetrics(db.llm_metrics)
+        metrics.record('model', 0.2, prompt_tokens=10, completion_tokens=5)
+        metrics.summary()
+    with workload('finding_aids.delete'):
+        FindingAidAnalysis.delete(analysis_id)
+    db.analyses.insert_one({'file_id': file_id, 'extracted_text_pages': ['Old page'], 'project_ids': [],
+                            'created_at': datetime.utcnow()})
+    with workload('finding_aids.migrate'):
+        FindingAidAnalysis.migrate_embedded_pages()
+
+
+def run_research(app, client):
+    db = app.db
+    with workload('research.projects'):
+        project_id = ResearchProject.create('Research plans', 'For query plans', 'undergraduate')
+        ResearchProject.get_all()
+        ResearchProject.get_titles()
+        ResearchProject.get_by_id(project_id)
+        ResearchProject.update(project_id, 'Research plans', 'Updated', 'graduate')
+        ResearchProject.get_detail(project_id)
+    with workload('research.search_results'):
+        results = [{'title': f"Result {index}", 'author': 'Author', 'year': '2000',
+                    'url': f"https://example.org/{index}"} for index in range(30)]
+        SearchResult.add_many(project_id, results, query='plans')
+        SearchResult.add_many(project_id, results[:5], query='plans')
+        page = SearchResult.get_page(project_id, limit=10)
+        SearchResult.get_page(project_id, after=page['next_cursor'], limit=10)
+        assert client.get(f'/research-assistant/project/{project_id}').status_code == 200
+    with workload('research.scholar_cache'):
+        key = ScholarCache.key('plans query', 10)
+        ScholarCache.get(key)
+        ScholarCache.claim_fetch(key, 60)
+        ScholarCache.put(key, 'plans query', results[:3], 3600)
+        ScholarCache.release_fetch(key)
+        ScholarCache.get(key)
+        ScholarCache.stats()
+    with workload('research.batches'):
+        batch_id = SearchBatch.create(project_id, ['first', 'second'], 600)
+        SearchBatch.start_query(batch_id, 0, 600)
+        SearchBatch.finish_query(batch_id, 0, 10, 8)
+        SearchBatch.fail_query(batch_id, 1, 'test')
+        SearchBatch.get(batch_id, project_id)
+    with workload('research.export'):
+        assert client.get('/research-assistant/export?format=ndjson').get_data()
+    with workload('research.delete'):
+        ResearchProject.delete(project_id)
+    db.research_projects.insert_one({'title': 'Legacy', 'description': '', 'finding_aid_ids': [],
+                                     'search_results': results[:2]})
+    with workload('research.migrate'):
+        SearchResult.migrate_embedded_results()
+
+
+def run_images(app, client):
+    db = app.db
+    now = datetime.utcnow()
+    # Rendition documents without blobs on disk, so eviction has files to skip, not delete
+    db.renditions.insert_many([{'_id': f"plans-{index}", 'source_hash': 'b' * 64, 'width': 100 * index,
+                                'height': 80 * index, 'bytes': 1000, 'aliases': [], 'last_used': now}
+                               for index in range(1, 4)])
+    with workload('images.renditions'):
+        RenditionCache.lookup(['plans-1', 'plans-2'])
+        RenditionCache.nearest_source('b' * 64, (150, 100))
+        RenditionCache.touch(['plans-1'])
+        SourceImage.get('plans-slug')
+    with workload('images.evict'):
+        RenditionCache.evict(1500, pinned=['plans-1'])
+        SourceImage.remove_if_unused('c' * 64)
+    with workload('images.jobs'):
+        job_id = ImageJob.create('plans-slug', 'Plans', 'b' * 64, 'png', [(100, 80)])
+        ImageJob.get(job_id)
+        ImageJob.pending_count()
+        job = ImageJob.claim('plans-worker', 60)
+        ImageJob.rendition_done(job['_id'], 'plans-worker', (100, 80), 'plans-100x80.webp', 60)
+        ImageJob.finish(job['_id'], 'plans-worker')
+        ImageJob.fail(job, 'test', 1)
+        assert client.get(f'/image-processor/jobs/{job_id}/progress').status_code == 200
+
+
+WORKLOADS = {
+    'books': run_books,
+    'finding_aids': run_finding_aids,
+    'research': run_research,
+    'images': run_images,
+}
+
+
+def explain_commands(command_name, command):
+    """
+    The explain commands for one recorded command: writes are explained a
+    statement at a time, since a bulk write sends many in one command.
+    """
+    command = {name: value for name, value in command.items() if name not in STRIPPED_FIELDS}
+    if command_name == 'update':
+        return [dict(command, updates=[statement]) for statement in command['updates']]
+    if command_name == 'delete':
+        return [dict(command, deletes=[statement]) for statement in command['deletes']]
+    return [command]
+
+
+def collection_scans(explain, winning=False):
+    """
+    Yield what the winning plans in an explain document scan in full:
+    COLLSCAN stages, and $lookup stages that join without an index (shown
+    as collectionScans, or on 6.0+ as an EQ_LOOKUP strategy other than an
+    indexed loop join). Rejected plans are skipped.
+    """
+    if isinstance(explain, dict):
+        if winning and explain.get('stage') == 'COLLSCAN':
+            yield 'COLLSCAN'
+        if winning and explain.get('stage') == 'EQ_LOOKUP' and explain.get('strategy') != 'IndexedLoopJoin':
+            yield f"$lookup from {explain.get('foreignCollection')} by {explain.get('strategy')}"
+        if explain.get('collectionScans'):
+            yield f"$lookup with {explain['collectionScans']} collection scan(s)"
+        for name, value in explain.items():
+            if name == 'rejectedPlans':
+                continue
+            yield from collection_scans(value, winning or name == 'winningPlan')
+    elif isinstance(explain, list):
+        for value in explain:
+            yield from collection_scans(value, winning)
+
+
+def unexpected_scans(db, commands):
+    """
+    Explain each recorded command and describe those that scan a whole
+    collection without being listed in EXPECTED_SCANS.
+    """
+    unexpected = []
+    for label, command_name, command in commands:
+        collection = command[command_name]
+        for explain_command in explain_commands(command_name, command):
+            explain = db.command({'explain': explain_command, 'verbosity': 'executionStats'})
+            scans = sorted(set(collection_scans(explain)))
+            if scans and (label, collection, command_name) not in EXPECTED_SCANS:
+                unexpected.append(f"{label} {collection}.{command_name}: {'; '.join(scans)}\n    {explain_command}")
+    return unexpected
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False, MODEL_CACHE_TTL_SECONDS=0)
+    app.mongo_client.drop_database(DATABASE)
+    try:
+        with app.app_context():
+            for name, results in apply_indexes(app.db).items():
+                for index_name, error in results:
+                    assert not error, f"Could not create index {name}.{index_name}: {error}"
+            yield app
+    finally:
+        app.mongo_client.drop_database(DATABASE)
+
+
+@pytest.mark.parametrize('blueprint', WORKLOADS)
+def test_queries_use_indexes(app, blueprint):
+    recorder.commands.clear()
+    WORKLOADS[blueprint](app, app.test_client())
+    assert recorder.commands, f"the {blueprint} workload sent no commands"
+    unexpected = unexpected_scans(app.db, recorder.commands)
+    assert not unexpected, (f"{len(unexpected)} command(s) scan a whole collection; register an index for them:\n"
+                            + '\n'.join(unexpected))